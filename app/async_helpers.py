@@ -0,0 +1,41 @@
+"""
+Shared pieces of the async views.
+
+Under Daphne a sync view runs on asgiref's single thread-sensitive executor,
+so async views must not touch lazy ORM state either: request.user, related
+objects read by templates and querysets evaluated during rendering all have
+to be loaded up front through the async ORM.
+"""
+from django.contrib.auth import aget_user
+from django.core.paginator import Paginator
+
+from users.models import Profile
+
+
+async def prefetch_user_profile(request):
+    """
+    Resolve the async user AND pre-warm the related Profile in the ORM
+    field cache. This prevents SynchronousOnlyOperation when the template
+    accesses user.profile inside an async view.
+    """
+    # Properly resolve the user asynchronously without triggering lazy evaluation
+    request.user = await aget_user(request)
+
+    if request.user.is_authenticated:
+        # Accessing user.profile would run a sync ORM query; fetch it with the
+        # async ORM and cache it on the user instance so template lookups are free.
+        profile = await Profile.objects.filter(user_id=request.user.id).afirst()
+        if profile is not None:
+            request.user.profile = profile
+    return request.user
+
+
+async def paginate(queryset, page_number, per_page=20):
+    """Paginator.get_page() with the count and the page rows fetched through the async ORM."""
+    paginator = Paginator(queryset, per_page)
+    # count is a cached_property; filling it in keeps the paginator from querying
+    paginator.count = await queryset.acount()
+    page_obj = paginator.get_page(page_number)
+    page_obj.object_list = [item async for item in page_obj.object_list]
+    return page_obj
+
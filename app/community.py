@@ -0,0 +1,147 @@
+"""
+Per-anime community stats (AnimeCommunityStats).
+
+Every list change is a transition from one (status, score) pair to another;
+apply_transitions() turns a batch of them into per-anime counter deltas and
+applies each anime's deltas once, under a row lock. rebuild_community_stats()
+recomputes everything from UserAnimeEntry with one grouped query so drift from
+writes that bypass the outbox (queryset updates, raw SQL) heals overnight.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from users.models import UserAnimeEntry
+from .models import AnimeCommunityStats
+
+STATUSES = [status for status, _ in UserAnimeEntry.STATUS_CHOICES]
+COUNTER_FIELDS = ['members', *STATUSES, 'scored_count', 'score_sum']
+
+# Titles need this many votes before they can rank by mean score
+MIN_SCORED = getattr(settings, 'COMMUNITY_MIN_SCORED', 3)
+
+
+def _contribution(status, score):
+    """The counters one entry adds to its anime."""
+    counts = Counter(members=1)
+    counts[status] += 1
+    if score:
+        counts['scored_count'] += 1
+        counts['score_sum'] += score
+        counts[f'score_{score}'] += 1
+    return counts
+
+
+def _mean(stats):
+    return round(stats.score_sum / stats.scored_count, 2) if stats.scored_count > 0 else None
+
+
+def apply_transitions(transitions):
+    """
+    Apply [(anime_id, old status, old score, new status, new score)] to the
+    stats. Old status None means a new entry, new status None a deleted one.
+    """
+    deltas = defaultdict(Counter)
+    for anime_id, old_status, old_score, new_status, new_score in transitions:
+        if old_status is not None:
+            deltas[anime_id].subtract(_contribution(old_status, old_score))
+        if new_status is not None:
+            deltas[anime_id].update(_contribution(new_status, new_score))
+    deltas = {anime_id: delta for anime_id, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return 0
+
+    with transaction.atomic():
+        AnimeCommunityStats.objects.bulk_create(
+            [AnimeCommunityStats(anime_id=anime_id, score_distribution=[0] * 10) for anime_id in deltas],
+            ignore_conflicts=True,
+        )
+        # Lock in a fixed order so concurrent drains can't deadlock
+        rows = list(
+            AnimeCommunityStats.objects.select_for_update()
+            .filter(anime_id__in=deltas).order_by('anime_id')
+        )
+        for stats in rows:
+            delta = deltas[stats.anime_id]
+            for field in COUNTER_FIELDS:
+                setattr(stats, field, getattr(stats, field) + delta[field])
+            distribution = list(stats.score_distribution or [0] * 10)
+            stats.score_distribution = [votes + delta[f'score_{score}'] for score, votes in enumerate(distribution, 1)]
+            stats.mean_score = _mean(stats)
+        AnimeCommunityStats.objects.bulk_update(
+            rows, [*COUNTER_FIELDS, 'score_distribution', 'mean_score', 'updated_at']
+        )
+    return len(rows)
+
+
+def rebuild_community_stats(entry_model=UserAnimeEntry, stats_model=AnimeCommunityStats):
+    """
+    Recompute every anime's stats from the lists. Returns the number of rows
+    written. Migrations pass their historical models.
+    """
+    totals = entry_model.objects.values('anime_id').annotate(
+        total_members=Count('id'),
+        **{f'total_{status}': Count('id', filter=Q(status=status)) for status in STATUSES},
+        total_scored=Count('id', filter=Q(score__gt=0)),
+        total_score_sum=Sum('score', filter=Q(score__gt=0)),
+    )
+    distributions = defaultdict(lambda: [0] * 10)
+    for anime_id, score, votes in (
+        entry_model.objects.filter(score__range=(1, 10)).values('anime_id', 'score')
+        .annotate(votes=Count('id')).values_list('anime_id', 'score', 'votes')
+    ):
+        distributions[anime_id][score - 1] = votes
+
+    rows = []
+    for row in totals:
+        stats = stats_model(
+            anime_id=row['anime_id'],
+            members=row['total_members'],
+            scored_count=row['total_scored'],
+            score_sum=row['total_score_sum'] or 0,
+            score_distribution=distributions[row['anime_id']],
+            **{status: row[f'total_{status}'] for status in STATUSES},
+        )
+        stats.mean_score = _mean(stats)
+        rows.append(stats)
+
+    with transaction.atomic():
+        stats_model.objects.exclude(anime_id__in=[stats.anime_id for stats in rows]).delete()
+        stats_model.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['anime_id'],
+            update_fields=[*COUNTER_FIELDS, 'score_distribution', 'mean_score', 'updated_at'],
+        )
+    return len(rows)
+
+
+def community_summary(stats):
+    """Template-ready view of one AnimeCommunityStats row (None if nobody listed it)."""
+    if stats is None or stats.members <= 0:
+        return None
+    top_votes = max(stats.score_distribution or [0]) or 1
+    return {
+        'members': stats.members,
+        'mean_score': stats.mean_score,
+        'scored_count': stats.scored_count,
+        'statuses': [
+            (label, getattr(stats, status), round(getattr(stats, status) * 100 / stats.members))
+            for status, label in UserAnimeEntry.STATUS_CHOICES
+        ],
+        'distribution': [
+            (score, votes, round(votes * 100 / top_votes))
+            for score, votes in reversed(list(enumerate(stats.score_distribution or [], 1)))
+        ],
+    }
+
+
+def top_on_mitsulist(order='score', limit=20, min_scored=MIN_SCORED):
+    """Local rankings straight from the stats table: by mean score or by members."""
+    rows = AnimeCommunityStats.objects.filter(members__gt=0)
+    if order == 'members':
+        return rows.order_by('-members', 'anime_id')[:limit]
+    return rows.filter(scored_count__gte=min_scored).order_by('-mean_score', '-scored_count', 'anime_id')[:limit]
@@ -29,6 +29,15 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'title': event.get('title', 'Notification'),
             'message': event.get('message', ''),
             'link': event.get('link', ''),
+            'unread': event.get('unread'),
+        }))
+
+    async def import_progress(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'import_progress',
+            'job_id': event['job_id'],
+            'status': event['status'],
+            'processed': event['processed'],
         }))
 
 class PartyConsumer(AsyncWebsocketConsumer):
@@ -0,0 +1,104 @@
+import asyncio
+import math
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.test.utils import override_settings
+
+from app.models import AnimeCommunityStats, Review
+from app.views import _anime_detail_rows
+from users.models import CustomList, UserAnimeEntry
+from users.social import friends_watching
+
+# Caching off, so every variant pays for its queries
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+async def per_query_hops(user, anime_id):
+    """anime_detail's rows the way the view used to load them: one sync_to_async hop per query, serially."""
+    reviews = await sync_to_async(lambda: list(
+        Review.objects.filter(anime_id=anime_id).order_by('-created_at').select_related('user', 'user__profile')
+        .prefetch_related('likes', 'comments', 'comments__user', 'comments__user__profile')
+    ))()
+    stats = await sync_to_async(lambda: AnimeCommunityStats.objects.filter(anime_id=anime_id).first())()
+    user_review = await sync_to_async(lambda: Review.objects.filter(user=user, anime_id=anime_id).first())()
+    custom_lists = await sync_to_async(lambda: list(CustomList.objects.filter(user=user).prefetch_related(
+        Prefetch('entries', queryset=UserAnimeEntry.objects.filter(anime_id=anime_id), to_attr='current_anime')
+    )))()
+    friends = await sync_to_async(friends_watching)(user.id, anime_id)
+    return reviews, stats, user_review, custom_lists, friends
+
+
+class Command(BaseCommand):
+    help = (
+        "Time anime_detail's database work with per-query sync_to_async hops against the native "
+        "async ORM, under concurrency, and how long other sync work waits for the thread meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="User whose lists, reviews and follows are loaded")
+        parser.add_argument('--anime', type=int, default=1, help="MAL id of the anime page to load")
+        parser.add_argument('--concurrency', default='1,10,50', help="Comma-separated concurrent request counts")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per variant and concurrency level")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user {options['username']!r}")
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        variants = (('sync_to_async per query', per_query_hops), ('native async ORM', _anime_detail_rows))
+        with override_settings(CACHES=NO_CACHE):
+            for concurrency in levels:
+                for label, load in variants:
+                    latencies, waits, elapsed = asyncio.run(
+                        self.run(load, user, options['anime'], concurrency, options['requests'])
+                    )
+                    self.stdout.write(
+                        f"{label:<28} c={concurrency:<4} "
+                        f"p50 {self.ms(statistics.median(latencies))} p95 {self.ms(self.p95(latencies))} "
+                        f"{len(latencies) / elapsed:7.1f} req/s  "
+                        f"thread wait p50 {self.ms(statistics.median(waits))} p95 {self.ms(self.p95(waits))}"
+                    )
+
+    async def run(self, load, user, anime_id, concurrency, total):
+        await load(user, anime_id)  # Warm up connections and imports
+        latencies, waits = [], []
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                await load(user, anime_id)
+                latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            # A trivial sync call: its round trip is the time spent queued behind the ORM work
+            while True:
+                start = time.perf_counter()
+                await sync_to_async(time.perf_counter)()
+                waits.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        prober.cancel()
+        return latencies, waits or [0.0], elapsed
+
+    @staticmethod
+    def p95(values):
+        # Nearest rank, so a handful of probe samples still gives a sane value
+        return sorted(values)[math.ceil(len(values) * 0.95) - 1]
+
+    @staticmethod
+    def ms(seconds):
+        return f"{seconds * 1000:7.2f} ms"
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from app.management.commands.benchmark_async_views import NO_CACHE, Command as AsyncViewsBenchmark
+from app.models import Review
+from chat.models import ChatThread
+from clubs.models import Club
+from users.models import UserAnimeEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the users/chat/clubs hot endpoints through the ASGI handler with N concurrent clients and "
+        "report throughput, latency and how long sync work waits for the thread meanwhile. Run it on two "
+        "revisions against the same database to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="User the requests are made as")
+        parser.add_argument('--concurrency', default='1,10,50', help="Comma-separated concurrent client counts")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency level")
+        parser.add_argument('--writes', action='store_true', help="Also re-save the user's latest list entry via update-status")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user {options['username']!r}")
+        endpoints = self.endpoints(user, options['writes'])
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        with override_settings(CACHES=NO_CACHE, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for label, method, path, body in endpoints:
+                for concurrency in levels:
+                    latencies, waits, elapsed, errors = asyncio.run(
+                        self.run(user, method, path, body, concurrency, options['requests'])
+                    )
+                    self.stdout.write(
+                        f"{label:<16} c={concurrency:<4} "
+                        f"p50 {AsyncViewsBenchmark.ms(statistics.median(latencies))} "
+                        f"p95 {AsyncViewsBenchmark.ms(AsyncViewsBenchmark.p95(latencies))} "
+                        f"{len(latencies) / elapsed:7.1f} req/s  "
+                        f"thread wait p95 {AsyncViewsBenchmark.ms(AsyncViewsBenchmark.p95(waits))}"
+                        + (f"  {errors} errors" if errors else "")
+                    )
+
+    def endpoints(self, user, writes):
+        """(label, method, path, JSON body) for each endpoint the user has data for."""
+        endpoints = [('profile', 'get', reverse('public_profile', args=[user.username]), None)]
+        review = Review.objects.order_by('-created_at').first()
+        if review:
+            endpoints.append(('reviews', 'get', reverse('anime_reviews_list', args=[review.anime_id]), None))
+        thread = ChatThread.objects.filter(user1=user).first() or ChatThread.objects.filter(user2=user).first()
+        if thread:
+            endpoints.append(('chat history', 'get', reverse('chat:get_messages', args=[thread.id]), None))
+        club = Club.objects.order_by('-created_at').first()
+        if club:
+            endpoints.append(('club detail', 'get', reverse('clubs:club_detail', args=[club.pk]), None))
+            endpoints.append(('club history', 'get', reverse('clubs:get_club_messages', args=[club.pk]), None))
+        entry = UserAnimeEntry.objects.filter(user=user).order_by('-updated_at').first()
+        if writes and entry:
+            # The entry's current values, so repeating the request changes nothing
+            body = {
+                'anime_id': entry.anime_id, 'status': entry.status, 'score': entry.score,
+                'episodes_watched': entry.episodes_watched, 'title': entry.title, 'image_url': entry.image_url,
+            }
+            endpoints.append(('update-status', 'post', reverse('update-status'), body))
+        return endpoints
+
+    async def run(self, user, method, path, body, concurrency, total):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        kwargs = {'data': json.dumps(body), 'content_type': 'application/json'} if body is not None else {}
+        send = getattr(client, method)
+        await send(path, **kwargs)  # Warm up connections and imports
+        latencies, waits = [], []
+        errors = 0
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await send(path, **kwargs)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        async def probe():
+            # A trivial sync call: its round trip is the time spent queued behind the request work
+            while True:
+                start = time.perf_counter()
+                await sync_to_async(time.perf_counter)()
+                waits.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        prober.cancel()
+        return latencies, waits or [0.0], elapsed, errors
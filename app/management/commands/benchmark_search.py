@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.models import Review
+from app.search import search_query, search_reviews
+
+BENCH_USERNAME = 'search-benchmark'
+
+# Mixed English / Ukrainian vocabulary for the synthetic reviews
+WORDS = (
+    "animation story characters soundtrack pacing ending villain romance comedy action "
+    "mecha isekai slice life studio opening arc finale emotional boring masterpiece "
+    "анімація сюжет персонажі музика кінцівка лиходій романтика комедія бойовик "
+    "студія опенінг фінал емоційний нудний шедевр"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Time review search with stored GIN-indexed vectors against on-the-fly to_tsvector (PostgreSQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=1_000_000, help="Seed synthetic reviews until the table has this many")
+        parser.add_argument('--query', default='emotional finale', help="Search text to time")
+        parser.add_argument('--repeat', type=int, default=10, help="Timed runs per variant")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the synthetic reviews afterwards")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The search benchmark needs PostgreSQL.")
+
+        self.seed(options['reviews'])
+        text = options['query']
+
+        def stored():
+            return search_reviews(text)
+
+        def on_the_fly():
+            query = SearchQuery(text)
+            return list(
+                Review.objects.annotate(rank=SearchRank(SearchVector('content'), query))
+                .filter(rank__gte=0.01).select_related('user', 'user__profile').order_by('-rank')[:20]
+            )
+
+        for label, run in (('stored tsvector + GIN', stored), ('on-the-fly to_tsvector', on_the_fly)):
+            run()  # Warm the cache
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(f"{label}: median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms")
+
+        plan = Review.objects.filter(search_vector=search_query(text)).explain()
+        self.stdout.write(f"Plan for the stored query:\n{plan}")
+
+        if options['cleanup']:
+            deleted, _ = Review.objects.filter(user__username=BENCH_USERNAME).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic rows")
+
+    def seed(self, target, batch_size=10_000):
+        missing = target - Review.objects.count()
+        if missing <= 0:
+            return
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        rng = random.Random(42)
+        self.stdout.write(f"Seeding {missing} reviews...")
+        while missing > 0:
+            size = min(batch_size, missing)
+            Review.objects.bulk_create([
+                Review(user=user, anime_id=rng.randint(1, 60000), content=' '.join(rng.choices(WORDS, k=rng.randint(20, 120))))
+                for _ in range(size)
+            ])
+            missing -= size
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Review._meta.db_table}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.search import search_metrics
+
+
+class Command(BaseCommand):
+    help = "Show search cache hits, misses and hit rate per query shape."
+
+    def handle(self, *args, **options):
+        metrics = search_metrics()
+        if not metrics:
+            self.stdout.write("No searches recorded.")
+            return
+        for shape, counts in sorted(metrics.items(), key=lambda item: -(item[1]['hits'] + item[1]['misses'])):
+            self.stdout.write(
+                f"{shape:<28} {counts['hits']:>8} hits {counts['misses']:>8} misses {counts['hit_rate']:>7.1%}"
+            )
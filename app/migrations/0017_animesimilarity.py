@@ -0,0 +1,26 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_alter_activity_activity_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anime_id', models.IntegerField()),
+                ('similar_anime_id', models.IntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'verbose_name_plural': 'Anime similarities',
+                'unique_together': {('anime_id', 'similar_anime_id')},
+            },
+        ),
+    ]
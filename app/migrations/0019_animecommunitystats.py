@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_wrappedsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnimeCommunityStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anime_id', models.IntegerField(unique=True)),
+                ('members', models.IntegerField(default=0)),
+                ('watching', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('plan_to_watch', models.IntegerField(default=0)),
+                ('dropped', models.IntegerField(default=0)),
+                ('on_hold', models.IntegerField(default=0)),
+                ('scored_count', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('score_distribution', models.JSONField(default=list, help_text='Votes for scores 1-10')),
+                ('mean_score', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Anime community stats',
+                'indexes': [models.Index(fields=['-mean_score'], name='app_animeco_mean_sc_e292a6_idx'), models.Index(fields=['-members'], name='app_animeco_members_cce500_idx')],
+            },
+        ),
+    ]
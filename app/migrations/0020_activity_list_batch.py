@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_animecommunitystats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='activity_type',
+            field=models.CharField(choices=[('status_update', 'Status Update'), ('new_review', 'New Review'), ('review_like', 'Review Like'), ('list_import', 'List Import'), ('list_batch', 'Bulk List Update')], db_index=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:30
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Stored full-text vectors for Review and News (see app/search.py). The trigger,
+# backfill and GIN index are PostgreSQL-only; other databases just get the column.
+CONFIGS = ('english', 'simple')
+
+
+def _vector(column, weight):
+    return ' || '.join(
+        f"setweight(to_tsvector('{config}', coalesce({column}, '')), '{weight}')" for config in CONFIGS
+    )
+
+
+VECTORS = {
+    'app_review': _vector('NEW.content', 'A'),
+    'app_news': f"{_vector('NEW.title', 'A')} || {_vector('NEW.description', 'B')}",
+}
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, vector in VECTORS.items():
+        schema_editor.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_trigger BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()"
+        )
+        # Backfill through the trigger, then index the filled column
+        schema_editor.execute(f"UPDATE {table} SET search_vector = NULL")
+        schema_editor.execute(f"CREATE INDEX {table}_search_vector_gin ON {table} USING gin (search_vector)")
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in VECTORS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_gin")
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}")
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {table}_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_activity_list_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:10
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# Local title search (see app/search.py). Cached rows only have `title` until
+# they are refreshed from Jikan, so search_titles is backfilled from it. The
+# trigram and jsonb GIN indexes are PostgreSQL-only.
+
+
+def backfill_search_titles(apps, schema_editor):
+    AnimeMetadata = apps.get_model('app', 'AnimeMetadata')
+    AnimeMetadata.objects.update(search_titles=Lower('title'))
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX app_animemetadata_titles_trgm ON app_animemetadata "
+        "USING gin (search_titles gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX app_animemetadata_genre_ids_gin ON app_animemetadata "
+        "USING gin (genre_ids jsonb_path_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS app_animemetadata_titles_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS app_animemetadata_genre_ids_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_search_vectors'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='genre_ids',
+            field=models.JSONField(blank=True, default=list, help_text='MAL genre ids, for local search filters'),
+        ),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='search_titles',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='title_english',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='title_japanese',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='title_synonyms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='animemetadata',
+            name='year',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='animemetadata',
+            index=models.Index(fields=['media_type', 'year'], name='app_animeme_media_t_d2fc1b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animemetadata',
+            index=models.Index(fields=['year'], name='app_animeme_year_0583af_idx'),
+        ),
+        migrations.RunPython(backfill_search_titles, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_anime_title_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('review_like', 'Review Like'), ('review_comment', 'Review Comment'), ('new_follower', 'New Follower'), ('system', 'System Message'), ('badge_earned', 'Badge Earned'), ('search_alert', 'Saved Search Alert')], max_length=20),
+        ),
+    ]
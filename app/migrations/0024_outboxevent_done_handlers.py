@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_alter_notification_notification_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='done_handlers',
+            field=models.JSONField(default=list),
+        ),
+    ]
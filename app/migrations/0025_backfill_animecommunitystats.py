@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:20
+
+from django.db import migrations
+
+
+def backfill_community_stats(apps, schema_editor):
+    """Seed the stats from existing lists; incremental updates only apply deltas to rows that are already right."""
+    from app.community import rebuild_community_stats
+    rebuild_community_stats(apps.get_model('users', 'UserAnimeEntry'), apps.get_model('app', 'AnimeCommunityStats'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_outboxevent_done_handlers'),
+        ('users', '0021_importjob_private_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_community_stats, migrations.RunPython.noop),
+    ]
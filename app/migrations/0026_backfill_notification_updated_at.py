@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:35
+
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """
+    0015 gave every existing notification the migration time as updated_at, so
+    the feed (ordered by it) lost its order. A single-actor row was never folded
+    into, so its last activity is its creation.
+    """
+    Notification = apps.get_model('app', 'Notification')
+    Notification.objects.filter(actor_count=1).update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_backfill_animecommunitystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
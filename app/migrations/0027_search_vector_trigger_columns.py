@@ -0,0 +1,57 @@
+# Generated by Django 6.0.2 on 2026-10-19 17:05
+
+from django.db import migrations
+
+# The columns each search vector is built from (see 0021_search_vectors)
+TEXT_COLUMNS = {
+    'app_review': ['content'],
+    'app_news': ['title', 'description'],
+}
+
+
+def _changed(columns):
+    # A changed or cleared vector also recomputes, so backfills and stale writes heal
+    return ' OR '.join(
+        [f'OLD.{column} IS DISTINCT FROM NEW.{column}' for column in [*columns, 'search_vector']]
+        + ['NEW.search_vector IS NULL']
+    )
+
+
+def restrict_search_triggers(apps, schema_editor):
+    """Recompute the vectors on insert and when their text changes, not on every counter or flag update."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in TEXT_COLUMNS.items():
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}")
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_insert_trigger BEFORE INSERT ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_update_trigger "
+            f"BEFORE UPDATE OF {', '.join(columns)}, search_vector ON {table} "
+            f"FOR EACH ROW WHEN ({_changed(columns)}) EXECUTE FUNCTION {table}_search_vector_update()"
+        )
+
+
+def unrestrict_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TEXT_COLUMNS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_update_trigger ON {table}")
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_insert_trigger ON {table}")
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_trigger BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_backfill_notification_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(restrict_search_triggers, unrestrict_search_triggers),
+    ]
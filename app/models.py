@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 
 class News(models.Model):
     title = models.CharField(max_length=200)
@@ -6,6 +7,8 @@ class News(models.Model):
     description = models.TextField(blank=True)
     link = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by a database trigger on PostgreSQL (see app/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -22,12 +25,17 @@ class Review(models.Model):
     is_spoiler = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger on PostgreSQL (see app/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f'{self.user.username} - {self.anime_id}'
 
     @property
     def like_count(self):
+        # Lists annotate likes_count; counting here is one query per review
+        if hasattr(self, 'likes_count'):
+            return self.likes_count
         return self.likes.count()
 
 class ReviewLike(models.Model):
@@ -74,9 +82,10 @@ class TranslationCache(models.Model):
 
 class AnimeSchedule(models.Model):
     """
-    Stores daily anime release schedules to reduce API usage.
+    Stores anime release schedules to reduce API usage. The calendar reads the
+    single day='week' row (see app/schedule.py).
     """
-    day = models.CharField(max_length=20, unique=True, db_index=True) # monday, tuesday, etc.
+    day = models.CharField(max_length=20, unique=True, db_index=True) # 'week'; formerly monday, tuesday, etc.
     data = models.JSONField(default=list)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -86,6 +95,8 @@ class Activity(models.Model):
         ('status_update', 'Status Update'),
         ('new_review', 'New Review'),
         ('review_like', 'Review Like'),
+        ('list_import', 'List Import'),
+        ('list_batch', 'Bulk List Update'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
@@ -109,6 +120,7 @@ class Notification(models.Model):
         ('new_follower', 'New Follower'),
         ('system', 'System Message'),
         ('badge_earned', 'Badge Earned'),
+        ('search_alert', 'Saved Search Alert'),
     ]
 
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -117,49 +129,132 @@ class Notification(models.Model):
     message = models.CharField(max_length=255)
     link = models.URLField(max_length=500, blank=True, null=True)
     is_read = models.BooleanField(default=False)
+    # Digest support: unread notifications sharing a group_key (e.g. likes on one
+    # review) are folded into a single row - see app/notifications.py
+    group_key = models.CharField(max_length=100, blank=True, default='')
+    actor_count = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['recipient', 'group_key', 'is_read']),
+        ]
 
     def __str__(self):
         return f"To {self.recipient.username} - {self.notification_type} - Read: {self.is_read}"
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-
-@receiver(post_save, sender=Notification)
-def broadcast_notification(sender, instance, created, **kwargs):
-    if created:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'user_{instance.recipient.id}_notifications',
-            {
-                'type': 'send_notification',
-                'title': instance.get_notification_type_display(),
-                'message': instance.message,
-                'link': instance.link or '',
-            }
-        )
+class OutboxEvent(models.Model):
+    """
+    Side effect recorded in the same transaction as the write that caused it.
+    See app/outbox.py - rows are deleted once a worker has processed them.
+    """
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Handlers that already processed the event, so a retry runs only the ones that failed
+    done_handlers = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
 
 class AnimeMetadata(models.Model):
     mal_id = models.IntegerField(primary_key=True)
     title = models.CharField(max_length=255)
+    title_english = models.CharField(max_length=255, blank=True, default='')
+    title_japanese = models.CharField(max_length=255, blank=True, default='')
+    title_synonyms = models.JSONField(default=list, blank=True)
     image_url = models.URLField(max_length=500, blank=True, null=True)
     synopsis = models.TextField(blank=True, null=True)
     episodes = models.IntegerField(blank=True, null=True)
     score = models.FloatField(blank=True, null=True)
     media_type = models.CharField(max_length=50, blank=True, null=True)
+    year = models.PositiveSmallIntegerField(blank=True, null=True)
     status = models.CharField(max_length=50, blank=True, null=True)
     studios = models.JSONField(default=list, blank=True)
     genres = models.JSONField(default=list, blank=True)
+    genre_ids = models.JSONField(default=list, blank=True, help_text="MAL genre ids, for local search filters")
+    # Every title, lowercased one per line; trigram-indexed on PostgreSQL (see app/search.py)
+    search_titles = models.TextField(blank=True, default='', editable=False)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['media_type', 'year']),
+            models.Index(fields=['year']),
+        ]
+
     def __str__(self):
         return f"{self.mal_id} - {self.title}"
 
+    def save(self, *args, **kwargs):
+        titles = [self.title, self.title_english, self.title_japanese, *(self.title_synonyms or [])]
+        self.search_titles = '\n'.join(dict.fromkeys(t.strip().lower() for t in titles if t and t.strip()))
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_titles'}
+        super().save(*args, **kwargs)
+
+class AnimeSimilarity(models.Model):
+    """
+    Top-K item-item neighbours computed offline from the community's list scores
+    (see app/recommender.py). Rebuilt wholesale by build_item_similarity_task.
+    """
+    anime_id = models.IntegerField()
+    similar_anime_id = models.IntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('anime_id', 'similar_anime_id')
+        verbose_name_plural = "Anime similarities"
+
+    def __str__(self):
+        return f"{self.anime_id} ~ {self.similar_anime_id} ({self.score:.3f})"
+
+class WrappedSnapshot(models.Model):
+    """Precomputed MitsuList Wrapped stats for one user and year (see build_wrapped_snapshot_task)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wrapped_snapshots')
+    year = models.PositiveSmallIntegerField()
+    stats = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f"{self.user.username} - Wrapped {self.year}"
+
+class AnimeCommunityStats(models.Model):
+    """
+    MitsuList's own numbers for one anime: members, status breakdown and score
+    distribution over UserAnimeEntry. Kept current by delta from the outbox
+    (see app/community.py) and rebuilt nightly by rebuild_community_stats_task.
+    """
+    anime_id = models.IntegerField(unique=True)
+    members = models.IntegerField(default=0)
+    watching = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    plan_to_watch = models.IntegerField(default=0)
+    dropped = models.IntegerField(default=0)
+    on_hold = models.IntegerField(default=0)
+    scored_count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    score_distribution = models.JSONField(default=list, help_text="Votes for scores 1-10")
+    mean_score = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Anime community stats"
+        indexes = [
+            models.Index(fields=['-mean_score']),
+            models.Index(fields=['-members']),
+        ]
+
+    def __str__(self):
+        return f"{self.anime_id} - {self.members} members"
+
 class WatchParty(models.Model):
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name='hosted_parties')
     room_code = models.CharField(max_length=10, unique=True, db_index=True)
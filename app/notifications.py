@@ -0,0 +1,171 @@
+"""
+Notification delivery used by the outbox handlers.
+
+High-fanout events (hundreds of likes on one review) are digested: an unread
+notification with the same recipient and group_key inside the digest window is
+updated in place ("X and 57 others liked your review.") instead of inserting a
+new row. Websocket pushes are coalesced to one message per recipient per drained
+outbox batch and rate limited per user: pushes inside the interval are folded
+into a pending summary that goes out when the interval ends. Every push carries
+the absolute unread count, so the latest one is always enough to fix the badge.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Notification
+from . import outbox
+
+DIGEST_WINDOW = getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', 6 * 3600)
+WS_MIN_INTERVAL = getattr(settings, 'NOTIFICATION_WS_MIN_INTERVAL', 5)
+
+DIGEST_MESSAGES = {
+    'review_like': "{actor} and {others} liked your review.",
+    'review_comment': "{actor} and {others} commented on your review",
+    'new_follower': "{actor} and {others} started following you",
+}
+
+
+def _digest_message(notification_type, actor, others):
+    noun = 'other' if others == 1 else 'others'
+    return DIGEST_MESSAGES[notification_type].format(actor=actor, others=f"{others} {noun}")
+
+
+def create_notifications(notifications):
+    """
+    Store unsaved Notification instances, folding digestible ones into existing
+    unread rows. Returns the websocket messages to broadcast after commit.
+    """
+    now = timezone.now()
+    singles = []
+    groups = {}
+    for notification in notifications:
+        if notification.group_key and notification.notification_type in DIGEST_MESSAGES:
+            groups.setdefault((notification.recipient_id, notification.group_key), []).append(notification)
+        else:
+            singles.append(notification)
+
+    to_create = list(singles)
+    to_update = []
+    if groups:
+        lookup = Q()
+        for recipient_id, group_key in groups:
+            lookup |= Q(recipient_id=recipient_id, group_key=group_key)
+        # Ordered oldest first so the newest matching row wins in the dict
+        existing = {
+            (n.recipient_id, n.group_key): n
+            for n in Notification.objects.filter(
+                lookup, is_read=False, updated_at__gte=now - datetime.timedelta(seconds=DIGEST_WINDOW)
+            ).order_by('updated_at')
+        }
+
+        for key, batch in groups.items():
+            latest = batch[-1]
+            row = existing.get(key)
+            if row is None:
+                row = latest
+                row.actor_count = len(batch)
+                to_create.append(row)
+            else:
+                row.sender = latest.sender
+                row.link = latest.link
+                row.actor_count += len(batch)
+                row.is_read = False
+                row.updated_at = now
+                to_update.append(row)
+
+            if row.actor_count > 1:
+                row.message = _digest_message(row.notification_type, latest.sender.username, row.actor_count - 1)
+
+    Notification.objects.bulk_create(to_create)
+    if to_update:
+        Notification.objects.bulk_update(to_update, ['sender', 'link', 'actor_count', 'message', 'is_read', 'updated_at'])
+
+    return notification_messages(to_create + to_update)
+
+
+def notification_messages(notifications):
+    """Build one (group, message) pair per notification, tagged with the recipient's unread count."""
+    recipient_ids = {n.recipient_id for n in notifications}
+    if not recipient_ids:
+        return []
+
+    unread = dict(
+        Notification.objects.filter(recipient_id__in=recipient_ids, is_read=False)
+        .values('recipient_id').annotate(total=Count('id')).values_list('recipient_id', 'total')
+    )
+    return [
+        (
+            f'user_{n.recipient_id}_notifications',
+            {
+                'type': 'send_notification',
+                'title': n.get_notification_type_display(),
+                'message': n.message,
+                'link': n.link or '',
+                'unread': unread.get(n.recipient_id, 0),
+            }
+        )
+        for n in notifications
+    ]
+
+
+def _summary(messages, count):
+    """The push for `count` notifications whose latest messages are `messages`."""
+    if count == 1:
+        return messages[-1]
+    return {
+        'type': 'send_notification',
+        'title': 'Notifications',
+        'message': f"You have {count} new notifications",
+        'link': '/notifications/',
+        # Handlers run in order within one transaction, so the last count is the freshest
+        'unread': messages[-1]['unread'],
+    }
+
+
+def _defer(group, messages):
+    """Fold throttled messages into the group's pending summary and schedule its flush once."""
+    from .tasks import flush_notification_push_task
+
+    pending = cache.get(f'notification_ws_pending_{group}') or {'count': 0}
+    cache.set(
+        f'notification_ws_pending_{group}',
+        {'count': pending['count'] + len(messages), 'message': messages[-1]},
+        WS_MIN_INTERVAL * 10,
+    )
+    if cache.add(f'notification_ws_flush_{group}', True, WS_MIN_INTERVAL):
+        transaction.on_commit(lambda: flush_notification_push_task.apply_async((group,), countdown=WS_MIN_INTERVAL))
+
+
+def _take_pending(group):
+    pending = cache.get(f'notification_ws_pending_{group}')
+    if pending:
+        cache.delete(f'notification_ws_pending_{group}')
+    return pending
+
+
+@outbox.coalescer('send_notification')
+def coalesce_notification_messages(group, messages):
+    """Send at most one push per user per drained batch; defer the ones inside the rate-limit interval."""
+    # cache.add is atomic: only the first push inside the interval goes out now
+    if not cache.add(f'notification_ws_{group}', True, WS_MIN_INTERVAL):
+        _defer(group, messages)
+        return []
+    count = len(messages)
+    pending = _take_pending(group)
+    if pending:
+        count += pending['count']
+    return [_summary(messages, count)]
+
+
+def flush_deferred_push(group):
+    """The pending summary for `group` as (group, message) pairs; empty if a later push already took it."""
+    pending = _take_pending(group)
+    if not pending:
+        return []
+    cache.set(f'notification_ws_{group}', True, WS_MIN_INTERVAL)
+    return [(group, _summary([pending['message']], pending['count']))]
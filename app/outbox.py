@@ -0,0 +1,148 @@
+"""
+Transactional outbox for model side effects.
+
+Signal receivers call `publish()` instead of doing work inline: the event row
+is written in the same transaction as the change that caused it, so a rolled
+back request never broadcasts anything and the request itself only pays for a
+single INSERT. The `drain_outbox_task` Celery task later hands the events to the
+registered handlers in batches and flushes all websocket messages in one go,
+after letting registered coalescers merge messages aimed at the same group.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Events that keep failing are dropped after this many drain attempts
+MAX_ATTEMPTS = 5
+
+# topic -> list of handlers; a handler receives the list of payloads published
+# for its topic and may return (group, message) pairs to broadcast.
+_handlers = defaultdict(list)
+
+# message type -> function that turns all of one batch's messages for a single
+# group into the messages actually sent (e.g. merging several notifications)
+_coalescers = {}
+
+
+def handler(topic):
+    """Register a function as a batch handler for an outbox topic."""
+    def decorator(func):
+        _handlers[topic].append(func)
+        return func
+    return decorator
+
+
+def coalescer(message_type):
+    """Register a function that coalesces a batch's messages of one type per group."""
+    def decorator(func):
+        _coalescers[message_type] = func
+        return func
+    return decorator
+
+
+def coalesce(messages):
+    grouped = defaultdict(list)
+    for group, message in messages:
+        grouped[(group, message.get('type'))].append(message)
+
+    result = []
+    for (group, message_type), group_messages in grouped.items():
+        func = _coalescers.get(message_type)
+        if func is not None:
+            group_messages = func(group, group_messages)
+        result.extend((group, message) for message in group_messages)
+    return result
+
+
+def publish(topic, **payload):
+    """Record a side effect to be processed after the current transaction commits."""
+    from .models import OutboxEvent
+    OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def send_group_messages(messages):
+    """Send (group, message) pairs over the channel layer in a single event-loop hop."""
+    if not messages:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async def _send_all():
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, message) for group, message in messages),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Outbox broadcast failed: {result}")
+
+    async_to_sync(_send_all)()
+
+
+def handler_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def drain(batch_size=500):
+    """
+    Process up to `batch_size` pending events. Returns the number of events taken.
+    Rows are locked with SKIP LOCKED so several workers can drain concurrently.
+    A handler that fails is retried on later drains (up to MAX_ATTEMPTS) for
+    its events only; the handlers that succeeded are recorded on the event and
+    not run again.
+    """
+    from .models import OutboxEvent
+
+    messages = []
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        by_topic = defaultdict(list)
+        for event in events:
+            by_topic[event.topic].append(event)
+
+        failed = {}
+        for topic, topic_events in by_topic.items():
+            handlers = _handlers.get(topic)
+            if not handlers:
+                logger.warning(f"No outbox handler registered for topic '{topic}'")
+                continue
+
+            for func in handlers:
+                name = handler_name(func)
+                pending = [event for event in topic_events if name not in event.done_handlers]
+                if not pending:
+                    continue
+                try:
+                    # Savepoint per handler so one failure doesn't undo the others
+                    with transaction.atomic():
+                        messages.extend(func([event.payload for event in pending]) or [])
+                except Exception as e:
+                    logger.error(f"Outbox handler {func.__name__} failed for '{topic}': {e}")
+                    failed.update((event.id, event) for event in pending)
+                else:
+                    for event in pending:
+                        event.done_handlers.append(name)
+
+        retried = [event for event in failed.values() if event.attempts + 1 < MAX_ATTEMPTS]
+        for event in retried:
+            event.attempts += 1
+        # The rows are locked, so writing the counters back can't lose an update
+        OutboxEvent.objects.bulk_update(retried, ['attempts', 'done_handlers'])
+        retried_ids = {event.id for event in retried}
+        OutboxEvent.objects.filter(id__in=[e.id for e in events if e.id not in retried_ids]).delete()
+
+    # Broadcast only once the handlers' writes are committed
+    send_group_messages(coalesce(messages))
+    return len(events)
@@ -0,0 +1,132 @@
+"""
+Query budgets: how many SQL queries a view may run per request.
+
+Every urls.py of the site's apps declares `query_budgets`, {url name: most
+queries per request}, next to its urlpatterns. QueryBudgetTest (app/tests.py)
+requests each route against a small fixture with caching off and fails when a
+view goes over its budget, or when one query shape repeats more than
+MAX_REPEATS times, which is the N+1 signature: the same statement issued once
+per row of an earlier result.
+
+query_budget() is also usable on its own, around any block or as a decorator:
+
+    with query_budget(5) as recorded:
+        ...
+"""
+import re
+from collections import Counter
+from contextlib import ContextDecorator
+from importlib import import_module
+
+from django.db import connections
+
+# The site's urlconfs; each declares query_budgets for all of its named routes
+BUDGETED_URLCONFS = ('app.urls', 'users.urls', 'chat.urls', 'clubs.urls')
+# More copies of one query shape than this in a single request is an N+1
+MAX_REPEATS = 2
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LISTS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+# Statements from atomic() blocks, which repeat by design
+_TRANSACTION_CONTROL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    """SQL with its literals and parameters blanked and IN lists collapsed, so one statement run per row compares equal."""
+    shape = _NUMBERS.sub('%s', _STRINGS.sub('%s', sql))
+    return ' '.join(_PARAM_LISTS.sub('(...)', shape).split())
+
+
+class QueryRecorder:
+    """Context manager collecting the SQL every database connection of this thread runs inside it."""
+
+    def __init__(self):
+        self.queries = []
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrappers = [connection.execute_wrapper(self) for connection in connections.all()]
+        for wrapper in self._wrappers:
+            wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for wrapper in reversed(self._wrappers):
+            wrapper.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated(self, max_repeats=MAX_REPEATS):
+        """{shape: times} for every query shape run more than max_repeats times."""
+        shapes = Counter(
+            query_shape(sql) for sql in self.queries
+            if not sql.lstrip().upper().startswith(_TRANSACTION_CONTROL)
+        )
+        return {shape: times for shape, times in shapes.items() if times > max_repeats}
+
+    def report(self):
+        return '\n'.join(f'{number}. {sql}' for number, sql in enumerate(self.queries, 1))
+
+
+class query_budget(ContextDecorator):
+    """Raise QueryBudgetExceeded if the block runs more than max_queries queries or repeats a query shape."""
+
+    def __init__(self, max_queries, max_repeats=MAX_REPEATS, label='block'):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.label = label
+
+    def __enter__(self):
+        self.recorder = QueryRecorder().__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        problems = []
+        if self.recorder.count > self.max_queries:
+            problems.append(f'{self.recorder.count} queries, budget {self.max_queries}')
+        problems.extend(
+            f'repeated {times} times: {shape}' for shape, times in self.recorder.repeated(self.max_repeats).items()
+        )
+        if problems:
+            raise QueryBudgetExceeded(
+                f"{self.label}: {'; '.join(problems)}\n{self.recorder.report()}"
+            )
+        return False
+
+
+def declared_budgets():
+    """{url name: budget} across BUDGETED_URLCONFS, names qualified by the app namespace."""
+    budgets = {}
+    for urlconf in BUDGETED_URLCONFS:
+        module = import_module(urlconf)
+        namespace = getattr(module, 'app_name', None)
+        for name, budget in getattr(module, 'query_budgets', {}).items():
+            budgets[f'{namespace}:{name}' if namespace else name] = budget
+    return budgets
+
+
+def budgeted_routes():
+    """Every named route of BUDGETED_URLCONFS, qualified like declared_budgets()."""
+    names = set()
+    for urlconf in BUDGETED_URLCONFS:
+        module = import_module(urlconf)
+        namespace = getattr(module, 'app_name', None)
+        names.update(
+            f'{namespace}:{pattern.name}' if namespace else pattern.name
+            for pattern in module.urlpatterns if pattern.name
+        )
+    return names
@@ -0,0 +1,203 @@
+"""
+Item-item collaborative filtering over the community's UserAnimeEntry rows.
+
+`build_item_similarity()` runs offline (build_item_similarity_task): it turns
+every rated entry into a sparse users x anime matrix, mean-centers each user's
+ratings, and stores the top-K adjusted-cosine neighbours per anime in
+AnimeSimilarity. `recommend_for_user()` then scores a user's candidates from
+those neighbour rows with a handful of vectorized NumPy ops - no API calls.
+"""
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+
+from users.models import UserAnimeEntry
+from .models import AnimeMetadata, AnimeSimilarity
+
+TOP_K = getattr(settings, 'RECOMMENDER_TOP_K', 50)
+# Anime rated by fewer users than this get no neighbours (too noisy)
+MIN_SUPPORT = getattr(settings, 'RECOMMENDER_MIN_SUPPORT', 2)
+
+# Anime rows multiplied per block; bounds the dense similarity block to
+# BLOCK_SIZE x n_anime float32 values
+BLOCK_SIZE = 500
+
+# Rating used for unscored entries, from how far the user got
+IMPLICIT_RATINGS = {
+    'completed': 7.0,
+    'watching': 6.0,
+    'on_hold': 5.0,
+    'dropped': 3.0,
+}
+
+
+def entry_rating(score, status):
+    return float(score) if score else IMPLICIT_RATINGS.get(status, 0.0)
+
+
+def _rating_matrix():
+    """Return (column-normalized centered rating matrix in CSC form, anime ids per column)."""
+    user_index, anime_index = {}, {}
+    rows, cols, values = [], [], []
+    entries = (
+        UserAnimeEntry.objects.exclude(status='plan_to_watch')
+        .values_list('user_id', 'anime_id', 'score', 'status')
+        .iterator(chunk_size=5000)
+    )
+    for user_id, anime_id, score, status in entries:
+        rating = entry_rating(score, status)
+        if not rating:
+            continue
+        rows.append(user_index.setdefault(user_id, len(user_index)))
+        cols.append(anime_index.setdefault(anime_id, len(anime_index)))
+        values.append(rating)
+
+    anime_ids = np.fromiter(anime_index, dtype=np.int64, count=len(anime_index))
+    if not values:
+        return sparse.csc_matrix((0, 0), dtype=np.float32), anime_ids
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(len(user_index), len(anime_index)),
+    )
+
+    # Center each user's ratings on their own mean (adjusted cosine)
+    counts = np.diff(matrix.indptr)
+    means = np.asarray(matrix.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    matrix.data -= np.repeat(means, counts).astype(np.float32)
+    matrix.eliminate_zeros()
+
+    matrix = matrix.tocsc()
+    supported = np.diff(matrix.indptr) >= MIN_SUPPORT
+    matrix, anime_ids = matrix[:, supported], anime_ids[supported]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = matrix @ sparse.diags((1.0 / norms).astype(np.float32))
+    return matrix.tocsc(), anime_ids
+
+
+def _top_neighbours(matrix, anime_ids, top_k):
+    """Yield (anime_id, similar_anime_id, score) for the top_k neighbours of each anime."""
+    n_anime = len(anime_ids)
+    k = min(top_k, n_anime - 1)
+    if k <= 0:
+        return
+
+    transposed = matrix.T.tocsr()
+    for start in range(0, n_anime, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, n_anime)
+        block = (transposed[start:end] @ matrix).toarray()
+        block[np.arange(end - start), np.arange(start, end)] = 0.0  # No self-similarity
+
+        neighbours = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(block, neighbours, axis=1)
+        row, col = np.nonzero(scores > 0)
+        yield from zip(
+            anime_ids[start + row].tolist(),
+            anime_ids[neighbours[row, col]].tolist(),
+            scores[row, col].tolist(),
+        )
+
+
+def build_item_similarity(top_k=TOP_K, batch_size=5000):
+    """Recompute the AnimeSimilarity table. Returns the number of rows written."""
+    matrix, anime_ids = _rating_matrix()
+
+    written = 0
+    with transaction.atomic():
+        AnimeSimilarity.objects.all().delete()
+        batch = []
+        for anime_id, similar_id, score in _top_neighbours(matrix, anime_ids, top_k):
+            batch.append(AnimeSimilarity(anime_id=anime_id, similar_anime_id=similar_id, score=score))
+            if len(batch) >= batch_size:
+                AnimeSimilarity.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        AnimeSimilarity.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def score_candidates(ratings, owned_ids, neighbours, limit):
+    """
+    Rank candidates from neighbour rows.
+
+    `ratings` maps the user's seed anime ids to their rating, `neighbours` is a
+    sequence of (anime_id, similar_anime_id, score) rows for those seeds.
+    Returns [(candidate_id, score, [seed ids, best contributors first])].
+    """
+    if not neighbours:
+        return []
+    rows = np.asarray(neighbours, dtype=np.float64)
+    seeds, candidates, similarity = rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64), rows[:, 2]
+
+    # Ratings mapped to [-1, 1]: neighbours of titles the user disliked count against a candidate
+    seed_ids = np.fromiter(ratings, dtype=np.int64, count=len(ratings))
+    seed_weights = (np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings)) - 5.5) / 4.5
+    order = np.argsort(seed_ids)
+    weights = seed_weights[order][np.searchsorted(seed_ids[order], seeds)]
+    contribution = similarity * weights
+
+    keep = ~np.isin(candidates, np.fromiter(owned_ids, dtype=np.int64, count=len(owned_ids)))
+    seeds, candidates, contribution = seeds[keep], candidates[keep], contribution[keep]
+    if not len(candidates):
+        return []
+
+    unique, inverse = np.unique(candidates, return_inverse=True)
+    totals = np.bincount(inverse, weights=contribution)
+
+    ranked = np.argsort(-totals, kind='stable')[:limit]
+    results = []
+    for idx in ranked[totals[ranked] > 0]:
+        mask = inverse == idx
+        sources = seeds[mask][np.argsort(-contribution[mask], kind='stable')]
+        results.append((int(unique[idx]), float(totals[idx]), sources.tolist()))
+    return results
+
+
+def _anime_cards(anime_ids):
+    """Jikan-shaped anime dicts (what discover.html renders) from local data."""
+    cards = {
+        meta.mal_id: {'mal_id': meta.mal_id, 'title': meta.title, 'image_url': meta.image_url}
+        for meta in AnimeMetadata.objects.filter(mal_id__in=anime_ids)
+    }
+    missing = set(anime_ids) - set(cards)
+    if missing:
+        for row in UserAnimeEntry.objects.filter(anime_id__in=missing).values('anime_id', 'title', 'image_url'):
+            cards.setdefault(row['anime_id'], {'mal_id': row['anime_id'], 'title': row['title'], 'image_url': row['image_url']})
+
+    for card in cards.values():
+        image_url = card.pop('image_url') or ''
+        card['images'] = {'jpg': {'image_url': image_url, 'large_image_url': image_url}}
+    return cards
+
+
+def recommend_for_user(user, limit=20):
+    """
+    Return up to `limit` [{'anime': {...}, 'sources': [seed titles]}] from the
+    precomputed neighbour table, or [] when there is nothing to go on (cold start).
+    """
+    entries = list(UserAnimeEntry.objects.filter(user=user).values_list('anime_id', 'title', 'score', 'status'))
+    owned_ids = {anime_id for anime_id, _, _, _ in entries}
+    titles = {anime_id: title for anime_id, title, _, _ in entries}
+    ratings = {
+        anime_id: entry_rating(score, status)
+        for anime_id, _, score, status in entries
+        if status != 'plan_to_watch' and entry_rating(score, status)
+    }
+    if not ratings:
+        return []
+
+    neighbours = list(
+        AnimeSimilarity.objects.filter(anime_id__in=ratings)
+        .values_list('anime_id', 'similar_anime_id', 'score')
+    )
+    ranked = score_candidates(ratings, owned_ids, neighbours, limit)
+    cards = _anime_cards([candidate for candidate, _, _ in ranked])
+    return [
+        {'anime': cards[candidate], 'sources': [titles[seed] for seed in sources]}
+        for candidate, _, sources in ranked
+        if candidate in cards
+    ]
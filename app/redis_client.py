@@ -0,0 +1,37 @@
+"""
+Shared Redis connection for data structures the cache API can't express
+(sorted sets for leaderboards, membership sets).
+
+`get_redis()` returns None when REDIS_DATA_URL is empty or Redis recently
+failed; callers then fall back to SQL. Callers that hit a RedisError report it
+with `mark_unavailable()`, so an outage costs one timeout, not one per request.
+"""
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before trying Redis again after a failure
+RETRY_AFTER = 30
+
+_client = None
+_down_until = 0.0
+
+
+def get_redis():
+    global _client
+    url = getattr(settings, 'REDIS_DATA_URL', '')
+    if not url or time.monotonic() < _down_until:
+        return None
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=1, decode_responses=True)
+    return _client
+
+
+def mark_unavailable(error):
+    global _down_until
+    logger.warning(f"Redis unavailable, falling back to SQL: {error}")
+    _down_until = time.monotonic() + RETRY_AFTER
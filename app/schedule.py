@@ -0,0 +1,147 @@
+"""
+The weekly release calendar.
+
+refresh_weekly_schedule() runs from Celery beat: it fetches the seven Jikan
+schedule days and stores them as one document, in the cache for the calendar
+page and in an AnimeSchedule row as the durable copy. Jikan gives broadcast
+times in Japan time, so the document also holds the week already bucketed for
+every UTC offset in use (both sides of DST), each anime on its local weekday
+with its local time. calendar_view reads the document once and picks the bucket
+for the viewer's offset.
+"""
+import asyncio
+import datetime
+import zoneinfo
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import AnimeSchedule
+from .services import JIKAN_API_ENDPOINTS, fetch_jikan_data
+
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+SCHEDULE_CACHE_KEY = 'weekly_schedule'
+SCHEDULE_CACHE_TTL = 2 * 86400  # Refreshed every 6 hours; this only bounds a stalled beat
+SCHEDULE_ROW = 'week'
+BROADCAST_TIMEZONE = 'Asia/Tokyo'
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def utc_offsets(now=None):
+    """Every distinct UTC offset, in minutes, of the IANA zones now and half a year from now."""
+    now = now or timezone.now()
+    offsets = {0}
+    for name in zoneinfo.available_timezones():
+        zone = zoneinfo.ZoneInfo(name)
+        for moment in (now, now + datetime.timedelta(days=182)):
+            offsets.add(int(moment.astimezone(zone).utcoffset().total_seconds()) // 60)
+    return sorted(offsets)
+
+
+def _utc_minute(anime, day_index, now):
+    """Minute of the week (Monday 00:00 UTC = 0) the anime airs at, or None without a time."""
+    broadcast = anime.get('broadcast') or {}
+    try:
+        hours, minutes = map(int, (broadcast.get('time') or '').split(':'))
+        zone = zoneinfo.ZoneInfo(broadcast.get('timezone') or BROADCAST_TIMEZONE)
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return None
+    offset = int(now.astimezone(zone).utcoffset().total_seconds()) // 60
+    return (day_index * MINUTES_PER_DAY + hours * 60 + minutes - offset) % MINUTES_PER_WEEK
+
+
+def build_schedule_document(day_results, now=None):
+    """
+    {'anime': [{'mal_id', 'title', 'image_url'}], 'ids': [mal ids], 'views':
+    {offset: seven lists of [anime index, 'HH:MM' or None]}} from the Jikan
+    results for DAYS. Titles without a broadcast time stay on their Jikan day,
+    after the timed ones.
+    """
+    now = now or timezone.now()
+    anime, aired = [], []
+    seen = set()
+    for day_index, result in enumerate(day_results):
+        for item in result.get('data', []):
+            if not item.get('mal_id') or item['mal_id'] in seen:
+                continue
+            seen.add(item['mal_id'])
+            anime.append({
+                'mal_id': item['mal_id'],
+                'title': item.get('title', ''),
+                'image_url': ((item.get('images') or {}).get('jpg') or {}).get('image_url'),
+            })
+            aired.append((day_index, _utc_minute(item, day_index, now)))
+
+    views = {}
+    for offset in utc_offsets(now):
+        week = [[] for _ in DAYS]
+        for index, (day_index, minute) in enumerate(aired):
+            if minute is None:
+                week[day_index].append((MINUTES_PER_DAY, index, None))
+                continue
+            local = (minute + offset) % MINUTES_PER_WEEK
+            week[local // MINUTES_PER_DAY].append(
+                (local % MINUTES_PER_DAY, index, f'{local % MINUTES_PER_DAY // 60:02d}:{local % 60:02d}')
+            )
+        views[str(offset)] = [[[index, time] for _, index, time in sorted(day)] for day in week]
+
+    return {'anime': anime, 'ids': [a['mal_id'] for a in anime], 'views': views, 'updated_at': now.isoformat()}
+
+
+async def build_weekly_schedule():
+    """The schedule document from a fresh Jikan fetch, or None if any day failed to load."""
+    day_results = await asyncio.gather(*[
+        fetch_jikan_data(f'temp_schedule_{day}', f"{JIKAN_API_ENDPOINTS['schedules']}?filter={day}", timeout=60)
+        for day in DAYS
+    ])
+    # Never replace a good week with one that is missing a day
+    if not all(result.get('data') for result in day_results):
+        return None
+    return build_schedule_document(day_results)
+
+
+def store_weekly_schedule(document):
+    AnimeSchedule.objects.update_or_create(day=SCHEDULE_ROW, defaults={'data': document})
+    cache.set(SCHEDULE_CACHE_KEY, document, SCHEDULE_CACHE_TTL)
+
+
+def refresh_weekly_schedule():
+    """Refetch and store the week. Returns the number of scheduled anime, or None on failure."""
+    document = async_to_sync(build_weekly_schedule)()
+    if document is None:
+        return None
+    store_weekly_schedule(document)
+    return len(document['anime'])
+
+
+async def get_weekly_schedule():
+    """The schedule document: the cache, else the stored row, else (first run only) a fetch."""
+    document = cache.get(SCHEDULE_CACHE_KEY)
+    if document is not None:
+        return document
+
+    row = await sync_to_async(AnimeSchedule.objects.filter(day=SCHEDULE_ROW).first)()
+    if row is not None:
+        cache.set(SCHEDULE_CACHE_KEY, row.data, SCHEDULE_CACHE_TTL)
+        return row.data
+
+    document = await build_weekly_schedule()
+    if document is None:
+        return None
+    await sync_to_async(store_weekly_schedule)(document)
+    return document
+
+
+def week_for_offset(document, offset):
+    """[(day, [anime dict with 'time'])] for a UTC offset in minutes, using the nearest bucket."""
+    views = document['views']
+    key = str(offset)
+    if key not in views:
+        key = str(min(map(int, views), key=lambda candidate: abs(candidate - offset)))
+    anime = document['anime']
+    return [
+        (day, [{**anime[index], 'time': time} for index, time in entries])
+        for day, entries in zip(DAYS, views[key])
+    ]
@@ -0,0 +1,272 @@
+"""
+Site search over users, reviews, news and cached anime titles.
+
+On PostgreSQL each searchable model has a stored `search_vector` column, kept
+current by a trigger and covered by a GIN index (see the *_search_vectors
+migrations), so a search is an index lookup instead of a per-row to_tsvector
+over the whole table. Text is indexed twice: with the 'english' config
+(stemmed) and with 'simple' (exact words), which is what keeps Ukrainian and
+other non-English text searchable, since PostgreSQL ships no Ukrainian
+dictionary. Other databases (SQLite in development and tests) fall back to
+icontains.
+
+Anime titles are searched locally in AnimeMetadata, which every Jikan response
+fills. All of a title's names (romaji, English, Japanese, synonyms) live
+lowercased in `search_titles` under a pg_trgm GIN index, so both substring and
+misspelled queries are index lookups; matches that start with the query rank
+first, then by trigram similarity, then by MAL score.
+
+Searches are cached under a canonical form of their parameters (see
+search_params()), so "Naruto ", "naruto" and genres "4,1" vs "1,4" share one
+entry, hashed into a fixed-length key. The cache holds only result ids, which
+are hydrated in bulk on a hit; hits and misses are counted per query shape
+(which parameters were given), readable with search_metrics().
+"""
+import hashlib
+import itertools
+import unicodedata
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import AnimeMetadata, News, Review
+from .services import JIKAN_API_ENDPOINTS
+
+SEARCH_CONFIGS = ('english', 'simple')
+LOCAL_MIN_RESULTS = getattr(settings, 'LOCAL_SEARCH_MIN_RESULTS', 5)
+SEARCH_CACHE_TTL = getattr(settings, 'SEARCH_CACHE_TTL', 900)
+# Jikan rejects larger pages
+JIKAN_PAGE_LIMIT = 25
+# Bump when the cached payloads or their parameters change meaning
+SEARCH_KEY_VERSION = 1
+
+# Parameters per search kind, in canonical order; a query shape is the subset given
+SEARCH_PARAMS = {
+    'anime': ('q', 'genres', 'year', 'type'),
+    'site': ('q',),
+}
+
+# The `type` filter values the search page sends, as Jikan spells them in media_type
+ANIME_TYPES = {
+    'tv': 'TV', 'movie': 'Movie', 'ova': 'OVA', 'ona': 'ONA',
+    'special': 'Special', 'music': 'Music', 'tv_special': 'TV Special',
+}
+
+
+def search_query(text):
+    query = SearchQuery(text, config=SEARCH_CONFIGS[0], search_type='websearch')
+    for config in SEARCH_CONFIGS[1:]:
+        query |= SearchQuery(text, config=config, search_type='websearch')
+    return query
+
+
+def _ranked(queryset, vector_path, text, limit):
+    query = search_query(text)
+    return list(
+        queryset.filter(**{vector_path: query})
+        .annotate(rank=SearchRank(F(vector_path), query))
+        .order_by('-rank')[:limit]
+    )
+
+
+def search_users(text, limit=20):
+    users = User.objects.select_related('profile')
+    if connection.vendor == 'postgresql':
+        return _ranked(users, 'profile__search_vector', text, limit)
+    return list(users.filter(Q(username__icontains=text) | Q(profile__bio__icontains=text))[:limit])
+
+
+def search_reviews(text, limit=20):
+    reviews = Review.objects.select_related('user', 'user__profile')
+    if connection.vendor == 'postgresql':
+        return _ranked(reviews, 'search_vector', text, limit)
+    return list(reviews.filter(content__icontains=text).order_by('-created_at')[:limit])
+
+
+def search_news(text, limit=10):
+    if connection.vendor == 'postgresql':
+        return _ranked(News.objects.all(), 'search_vector', text, limit)
+    return list(News.objects.filter(Q(title__icontains=text) | Q(description__icontains=text))[:limit])
+
+
+def search_anime(text='', genre_ids=(), year=None, anime_type=None, limit=20, newest=False):
+    """
+    Cached anime matching a title query and/or genre, year and type filters,
+    best first, or most recent first with `newest` (the order Jikan alerts use).
+    """
+    text = normalize_text(text)
+    genre_ids = list(genre_ids)
+    anime = AnimeMetadata.objects.all()
+    if year:
+        anime = anime.filter(year=year)
+    if anime_type:
+        anime = anime.filter(media_type=ANIME_TYPES.get(anime_type.lower(), anime_type))
+
+    postgres = connection.vendor == 'postgresql'
+    if genre_ids and postgres:
+        anime = anime.filter(genre_ids__contains=genre_ids)
+
+    order = [F('score').desc(nulls_last=True)]
+    if newest:
+        order = [F('year').desc(nulls_last=True), '-mal_id']
+    if text:
+        prefix = Case(
+            When(Q(search_titles__startswith=text) | Q(search_titles__contains='\n' + text), then=Value(1)),
+            default=Value(0), output_field=IntegerField(),
+        )
+        if postgres:
+            anime = anime.filter(Q(search_titles__contains=text) | Q(search_titles__trigram_word_similar=text))
+            if not newest:
+                anime = anime.annotate(prefix=prefix, similarity=TrigramWordSimilarity(text, 'search_titles'))
+                order = ['-prefix', '-similarity', *order]
+        else:
+            anime = anime.filter(search_titles__contains=text)
+            if not newest:
+                anime = anime.annotate(prefix=prefix)
+                order = ['-prefix', *order]
+    anime = anime.order_by(*order)
+
+    if genre_ids and not postgres:
+        # No JSON containment lookup here; filter while streaming instead
+        wanted = set(genre_ids)
+        results = []
+        for item in anime.iterator():
+            if wanted <= set(item.genre_ids):
+                results.append(item)
+                if len(results) == limit:
+                    break
+        return results
+    return list(anime[:limit])
+
+
+def anime_card(item):
+    """An AnimeMetadata row in the shape of a Jikan search result, for the search page JS."""
+    return {
+        'mal_id': item.mal_id,
+        'title': item.title,
+        'title_english': item.title_english or None,
+        'images': {'jpg': {'large_image_url': item.image_url}},
+        'score': item.score,
+        'type': item.media_type,
+        'year': item.year,
+        'episodes': item.episodes,
+    }
+
+
+def _in_order(queryset, ids):
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def anime_cards(mal_ids):
+    """anime_card()s for cached ids, in order; rows that are not cached (yet) are left out."""
+    return [anime_card(item) for item in _in_order(AnimeMetadata.objects.all(), mal_ids)]
+
+
+def site_results(ids):
+    """(users, reviews, news) for a cached {'users': [...], 'reviews': [...], 'news': [...]} payload."""
+    return (
+        _in_order(User.objects.select_related('profile'), ids['users']),
+        _in_order(Review.objects.select_related('user', 'user__profile'), ids['reviews']),
+        _in_order(News.objects.all(), ids['news']),
+    )
+
+
+# --- Canonical requests and result caching ---
+
+def normalize_text(text):
+    """Query text as it is searched and cached: NFKC, lowercased, single-spaced."""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def search_params(q='', genres=None, year=None, anime_type=None):
+    """
+    The canonical parameters of a search, in SEARCH_PARAMS order with empty
+    and unusable values dropped: genre ids (a comma-separated string or a
+    list) sorted and deduplicated, the year as an int and the type as one of
+    ANIME_TYPES.
+    """
+    params = {}
+    q = normalize_text(q)
+    if q:
+        params['q'] = q
+    if isinstance(genres, (list, tuple)):
+        genres = ','.join(map(str, genres))
+    genre_ids = sorted({int(g) for g in str(genres or '').split(',') if g.strip().isdigit()})
+    if genre_ids:
+        params['genres'] = ','.join(map(str, genre_ids))
+    year = str(year or '').strip()
+    if year.isdigit():
+        params['year'] = int(year)
+    anime_type = normalize_text(anime_type).replace(' ', '_')
+    if anime_type in ANIME_TYPES:
+        params['type'] = anime_type
+    return params
+
+
+def search_canonical(params, limit=20, newest=False):
+    """search_anime() for canonical search_params()."""
+    return search_anime(
+        params.get('q', ''),
+        genre_ids=[int(g) for g in params['genres'].split(',')] if 'genres' in params else (),
+        year=params.get('year'),
+        anime_type=params.get('type'),
+        limit=limit,
+        newest=newest,
+    )
+
+
+def jikan_search_url(params, limit, **extra):
+    """The Jikan /anime search URL for canonical search_params(); `extra` adds e.g. ordering."""
+    query = {'q': params.get('q', ''), 'limit': min(limit, JIKAN_PAGE_LIMIT)}
+    if 'genres' in params:
+        query['genres'] = params['genres']
+    if 'year' in params:
+        # Both ends, so Jikan matches the local exact-year filter
+        query['start_date'] = f"{params['year']}-01-01"
+        query['end_date'] = f"{params['year']}-12-31"
+    if 'type' in params:
+        query['type'] = params['type']
+    return f"{JIKAN_API_ENDPOINTS['anime_base']}?{urlencode({**query, **extra})}"
+
+
+def search_cache_key(kind, params, **extra):
+    """A bounded cache key for a canonical search; `extra` covers things like the page size."""
+    canonical = urlencode(sorted({**params, **extra}.items()))
+    digest = hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:24]
+    return f'search:{kind}:v{SEARCH_KEY_VERSION}:{digest}'
+
+
+def query_shape(kind, params):
+    return f"{kind}:{'+'.join(params) or 'none'}"
+
+
+def record_lookup(kind, params, hit):
+    key = f"search_metrics:{query_shape(kind, params)}:{'hits' if hit else 'misses'}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def search_metrics():
+    """{query shape: {'hits', 'misses', 'hit_rate'}} for every shape that has been searched."""
+    shapes = [
+        query_shape(kind, combo)
+        for kind, names in SEARCH_PARAMS.items()
+        for size in range(len(names) + 1)
+        for combo in itertools.combinations(names, size)
+    ]
+    counts = cache.get_many([f'search_metrics:{shape}:{outcome}' for shape in shapes for outcome in ('hits', 'misses')])
+    metrics = {}
+    for shape in shapes:
+        hits = counts.get(f'search_metrics:{shape}:hits', 0)
+        misses = counts.get(f'search_metrics:{shape}:misses', 0)
+        if hits or misses:
+            metrics[shape] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+    return metrics
@@ -1,5 +1,6 @@
 import httpx
 import asyncio
+import hashlib
 from django.core.cache import cache
 import time
 import logging
@@ -44,11 +45,17 @@ async def cache_anime_metadata(data):
         
         studios = [s.get('name') for s in item.get('studios', [])]
         genres = [g.get('name') for g in item.get('genres', [])]
+        year = item.get('year') or ((item.get('aired') or {}).get('prop') or {}).get('from', {}).get('year')
         
         AnimeMetadata.objects.update_or_create(
             mal_id=item['mal_id'],
             defaults={
                 'title': item.get('title', ''),
+                'title_english': item.get('title_english') or '',
+                'title_japanese': item.get('title_japanese') or '',
+                'title_synonyms': item.get('title_synonyms') or [],
+                'year': year,
+                'genre_ids': [g['mal_id'] for g in item.get('genres', []) if g.get('mal_id')],
                 'image_url': item.get('images', {}).get('jpg', {}).get('large_image_url') if item.get('images') else None,
                 'synopsis': item.get('synopsis', ''),
                 'episodes': item.get('episodes'),
@@ -73,61 +80,72 @@ async def cache_anime_metadata(data):
 
     await sync_to_async(_process_data)()
 
+async def request_jikan(client, url, retries=2):
+    """
+    Perform one Jikan GET under the shared throttle (per-loop semaphore plus
+    0.35s spacing between requests), retrying 429s with exponential backoff
+    and 5xx errors a bounded number of times.
+    Returns (status_code, json_data); status_code is None on connection errors.
+    """
+    global last_request_time
+
+    async with get_jikan_semaphore():
+        for attempt in range(retries + 1):
+            # Small delay to spread requests (0.35s between each)
+            time_since_last = time.time() - last_request_time
+            if time_since_last < 0.35:
+                await asyncio.sleep(0.35 - time_since_last)
+
+            try:
+                last_request_time = time.time()
+                response = await client.get(url, timeout=15.0)
+            except httpx.RequestError as exc:
+                logger.error(f"Connection error: {exc}")
+                return None, None
+
+            if response.status_code == 200:
+                return 200, response.json()
+
+            elif response.status_code == 429:
+                # Exponential backoff
+                wait_time = 2 ** (attempt + 1)
+                logger.warning(f"Rate limited on {url}. Retrying in {wait_time}s...")
+                await asyncio.sleep(wait_time)
+                continue
+
+            elif 500 <= response.status_code < 600:
+                logger.warning(f"Server error {response.status_code} for {url}. Retrying...")
+                await asyncio.sleep(1)
+                continue
+
+            else:
+                logger.error(f"Error {response.status_code} for {url}")
+                return response.status_code, None
+
+    return response.status_code, None
+
 async def fetch_jikan_data(cache_key, url, timeout=86400, retries=2):
     """
     Asynchronously fetch data from Jikan API with caching, throttling, and retry logic.
     Default timeout increased to 24 hours (86400s) to reduce API hits.
     """
-    global last_request_time
-    
     # Check cache first
     data = cache.get(cache_key)
     if data:
         return data
 
-    async with get_jikan_semaphore():
-        # Small delay to spread requests (0.35s between each)
-        current_time = time.time()
-        time_since_last = current_time - last_request_time
-        if time_since_last < 0.35:
-            await asyncio.sleep(0.35 - time_since_last)
-        
-        async with httpx.AsyncClient() as client:
-            for attempt in range(retries + 1):
-                try:
-                    last_request_time = time.time()
-                    response = await client.get(url, timeout=15.0)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        cache.set(cache_key, data, timeout)
-                        cache.delete('jikan_api_unhealthy')  # Clear flag on success
-                        
-                        # Save Anime metadata directly to DB asynchronously
-                        asyncio.create_task(cache_anime_metadata(data))
-                        
-                        return data
-                    
-                    elif response.status_code == 429:
-                        # Exponential backoff
-                        wait_time = 2 ** (attempt + 1)
-                        logger.warning(f"Rate limited on {url}. Retrying in {wait_time}s...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    elif 500 <= response.status_code < 600:
-                         logger.warning(f"Server error {response.status_code} for {url}. Retrying...")
-                         await asyncio.sleep(1)
-                         continue
-    
-                    else:
-                        logger.error(f"Error {response.status_code} for {url}")
-                        break
-                
-                except httpx.RequestError as exc:
-                    logger.error(f"Connection error: {exc}")
-                    break
-    
+    async with httpx.AsyncClient() as client:
+        status_code, data = await request_jikan(client, url, retries)
+
+    if status_code == 200:
+        cache.set(cache_key, data, timeout)
+        cache.delete('jikan_api_unhealthy')  # Clear flag on success
+
+        # Save Anime metadata directly to DB asynchronously
+        asyncio.create_task(cache_anime_metadata(data))
+
+        return data
+
     # If we get here, the API request failed completely
     cache.set('jikan_api_unhealthy', True, 300)  # Unhealthy for 5 mins
     return {'data': []}
@@ -140,62 +158,28 @@ async def fetch_anime_recommendations(cache_key, anime_id, timeout=86400):
     url = f"{JIKAN_API_ENDPOINTS['anime_base']}/{anime_id}/recommendations"
     return await fetch_jikan_data(cache_key, url, timeout)
 
-async def get_daily_schedule(day):
-    """
-    Get schedule for a specific day with DB caching.
-    """
-    from .models import AnimeSchedule
-    from asgiref.sync import sync_to_async
-    from django.utils import timezone
-    import datetime
-
-    # 1. Try to get from DB
-    get_schedule = sync_to_async(lambda: AnimeSchedule.objects.filter(day=day).first())
-    schedule = await get_schedule()
-    
-    # Check if exists and fresh (< 24 hours)
-    if schedule and (timezone.now() - schedule.updated_at) < datetime.timedelta(hours=24):
-        return {'data': schedule.data}
-
-    # 2. Fetch from API if missing or stale
-    # We use a short cache key just for request stability (deduplication)
-    url = f"{JIKAN_API_ENDPOINTS['schedules']}?filter={day}"
-    data = await fetch_jikan_data(f"temp_schedule_{day}", url, timeout=60)
-    
-    anime_list = data.get('data', [])
-    if anime_list:
-        # Save to DB
-        save_schedule = sync_to_async(lambda: AnimeSchedule.objects.update_or_create(
-            day=day,
-            defaults={'data': anime_list}
-        ))
-        await save_schedule()
-        
-    return data
-
-async def fetch_schedule_data(cache_key='anime_schedule', timeout=86400):
-   # Kept for backward compatibility if needed, but we should use get_daily_schedule
-   return await get_daily_schedule('monday') # Placeholder
-
-def get_activity_feed(user):
+async def get_activity_feed(user):
     """
-    Fetch activity feed for a user (actions of people they follow).
+    Fetch activity feed for a user (entries of people they follow).
     """
     from users.models import UserAnimeEntry
     
-    # Get users we follow
-    # This triggers a DB call, so this function should be run in a thread/sync_to_async
-    following_ids = user.following.values_list('following_id', flat=True)
-    
-    # Get entries from these users, ordered by update time
-    return list(
+    # The followed ids stay a subquery, so this is one query
+    following_ids = user.following.values('following_id')
+    entries = (
         UserAnimeEntry.objects.filter(user_id__in=following_ids)
         .select_related('user', 'user__profile')
         .order_by('-updated_at')[:12]
     )
+    return [entry async for entry in entries]
 
 
 
+def _similar_to(sources):
+    if len(sources) > 2:
+        return f"Схоже на {sources[0]}, {sources[1]} та ін."
+    return f"Схоже на {' та '.join(sources)}"
+
 async def get_yui_ai_recommendations(user, limit=20):
     from users.models import UserAnimeEntry
     from app.models import AnimeMetadata
@@ -264,6 +248,15 @@ async def get_yui_ai_recommendations(user, limit=20):
         seed_animes = sorted_seeds[:5]
         ai_message = "Привіт! Я Yui AI 🌸. Я зібрала для тебе рекомендації на основі твоїх улюблених аніме!"
         
+    # Community item-item model (app/recommender.py); Jikan only covers the cold start
+    from .recommender import recommend_for_user
+    local_recommendations = await sync_to_async(recommend_for_user)(user, limit)
+    if local_recommendations:
+        return ai_message, None, [
+            {'anime': rec['anime'], 'context': _similar_to(rec['sources']), 'sources': rec['sources']}
+            for rec in local_recommendations
+        ]
+
     if not seed_animes:
         fallback_data = await fetch_jikan_data('top_anime_fallback', JIKAN_API_ENDPOINTS['top_anime'])
         return ai_message, fallback_data, []
@@ -293,125 +286,207 @@ async def get_yui_ai_recommendations(user, limit=20):
 
     sorted_recs = sorted(rec_scores.values(), key=lambda x: x['score'], reverse=True)
     
-    final_recommendations = []
-    for item in sorted_recs[:limit]:
-        sources = item['sources']
-        if len(sources) > 2:
-            context = f"Схоже на {sources[0]}, {sources[1]} та ін."
-        else:
-            context = f"Схоже на {' та '.join(sources)}"
-        
-        final_recommendations.append({
-            'anime': item['data'],
-            'context': context
-        })
-        
+    final_recommendations = [
+        {'anime': item['data'], 'context': _similar_to(item['sources']), 'sources': item['sources']}
+        for item in sorted_recs[:limit]
+    ]
     return ai_message, None, final_recommendations
 
-async def generate_wrapped_data(user, year):
+def recommendations_cache_key(user_id):
+    return f'user_recs_{user_id}'
+
+
+def list_signature(user_id):
     """
-    Analyzes a user's anime list to generate 'Year in Review' statistics.
-    Returns aggregated data like total episodes, average score, top animes, and a genre breakdown.
+    Hash of what recommendations depend on: which anime are on the list and their
+    status/score. Episode progress is left out, so bumping an episode counter
+    never triggers a recompute.
     """
     from users.models import UserAnimeEntry
+    digest = hashlib.md5()
+    rows = UserAnimeEntry.objects.filter(user_id=user_id).order_by('anime_id').values_list('anime_id', 'status', 'score')
+    for anime_id, status, score in rows.iterator():
+        digest.update(f"{anime_id}:{status}:{score};".encode())
+    return digest.hexdigest()
+
+
+async def refresh_user_recommendations(user, force=False, limit=20):
+    """
+    Materialize the user's recommendations in the cache as a compact payload:
+    {'signature', 'message', 'fallback', 'items': [[mal_id, title, image_url, [source titles]]]}.
+    Recomputes only when the list signature changed (or `force`).
+    """
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+
+    cache_key = recommendations_cache_key(user.id)
+    signature = await sync_to_async(list_signature)(user.id)
+    cached = cache.get(cache_key)
+    if not force and cached and cached['signature'] == signature:
+        return cached
+
+    ai_message, fallback_data, recommendations = await get_yui_ai_recommendations(user, limit=limit)
+    is_fallback = bool(fallback_data) and not recommendations
+    if is_fallback:
+        recommendations = [{'anime': item, 'sources': []} for item in fallback_data.get('data', [])[:limit]]
+
+    payload = {
+        'signature': signature,
+        'message': ai_message,
+        'fallback': is_fallback,
+        'items': [
+            [
+                rec['anime']['mal_id'],
+                rec['anime'].get('title', ''),
+                rec['anime'].get('images', {}).get('jpg', {}).get('large_image_url', ''),
+                rec['sources'],
+            ]
+            for rec in recommendations
+        ],
+    }
+    cache.set(cache_key, payload, getattr(settings, 'RECOMMENDATIONS_CACHE_TTL', 24 * 3600))
+    return payload
+
+
+def expand_recommendations(payload):
+    """Turn a cached payload back into the {'anime', 'context'} dicts the templates render."""
+    return [
+        {
+            'anime': {'mal_id': mal_id, 'title': title, 'images': {'jpg': {'image_url': image_url, 'large_image_url': image_url}}},
+            'context': _similar_to(sources) if sources else 'Популярне зараз',
+        }
+        for mal_id, title, image_url, sources in payload['items']
+    ]
+
+
+def schedule_recommendation_refresh(user_ids, countdown=None):
+    """
+    Queue one debounced background refresh per user, however many edits arrive
+    meanwhile. The task is sent once the current transaction commits, so the
+    worker reads the new list; if sending fails the pending flag is cleared so
+    the next edit tries again instead of being debounced into nothing.
+    """
+    from django.conf import settings
+    from django.db import transaction
+    from .tasks import refresh_user_recommendations_task
+
+    delay = getattr(settings, 'RECOMMENDATIONS_REFRESH_DELAY', 60)
+
+    def _enqueue(user_id):
+        try:
+            refresh_user_recommendations_task.apply_async((user_id,), countdown=delay if countdown is None else countdown)
+        except Exception as e:
+            cache.delete(f'user_recs_pending_{user_id}')
+            logger.warning(f"Could not queue recommendation refresh for user {user_id}: {e}")
+
+    for user_id in user_ids:
+        if cache.add(f'user_recs_pending_{user_id}', True, delay):
+            transaction.on_commit(lambda user_id=user_id: _enqueue(user_id))
+
+
+async def fill_missing_anime_metadata(anime_ids, batch_size=100):
+    """
+    Fetch AnimeMetadata rows we don't have yet from Jikan, sharing one client and
+    the global throttle. Meant for Celery jobs; returns the number of ids fetched.
+    """
     from asgiref.sync import sync_to_async
-    import datetime
+    from .models import AnimeMetadata
+
+    anime_ids = set(anime_ids)
+    known = await sync_to_async(set)(
+        AnimeMetadata.objects.filter(mal_id__in=anime_ids).values_list('mal_id', flat=True)
+    )
+    missing = sorted(anime_ids - known)
+
+    async with httpx.AsyncClient() as client:
+        async def _fetch(anime_id):
+            status_code, data = await request_jikan(client, f"{JIKAN_API_ENDPOINTS['anime_base']}/{anime_id}")
+            if status_code == 200:
+                await cache_anime_metadata(data)
+
+        for start in range(0, len(missing), batch_size):
+            await asyncio.gather(*(_fetch(anime_id) for anime_id in missing[start:start + batch_size]))
+    return len(missing)
+
+
+def compute_wrapped_stats(user_id, year):
+    """
+    Analyzes a user's list history to generate 'Year in Review' statistics from
+    local data only. The year's titles and episode counts come from the
+    EntryEvent log, so later edits don't move an anime into another year.
+    Returns (stats or None, ids missing from AnimeMetadata) - the missing ids
+    are filled in by build_wrapped_snapshot_task.
+    """
+    from users.models import UserAnimeEntry, EntryEvent
+    from users.history import monthly_episodes
+    from .models import AnimeMetadata
     from collections import Counter
+    from django.db.models import Count, Q, Sum
 
-    @sync_to_async
-    def get_yearly_entries():
-        # Get all entries updated in the specified year
-        # We assume 'updated_at' roughly correlates with when they finished it or watched it
-        return list(UserAnimeEntry.objects.filter(
-            user=user,
-            updated_at__year=year
-        ).values('anime_id', 'title', 'score', 'episodes_watched', 'status', 'image_url'))
-
-    entries = await get_yearly_entries()
-    
-    if not entries:
-        return None  # No data for this year
+    activity = {
+        row['anime_id']: row
+        for row in EntryEvent.objects.filter(user_id=user_id, created_at__year=year, baseline=False)
+        .values('anime_id').annotate(episodes=Sum('episode_delta'), completions=Count('id', filter=Q(status='completed')))
+    }
+    if not activity:
+        return None, []  # No data for this year
+
+    entries = list(UserAnimeEntry.objects.filter(
+        user_id=user_id,
+        anime_id__in=activity
+    ).values('anime_id', 'title', 'score', 'episodes_watched', 'status', 'image_url'))
 
     stats = {
-        'total_completed': 0,
-        'total_episodes': 0,
+        'total_completed': sum(1 for row in activity.values() if row['completions']),
+        'total_episodes': max(sum(row['episodes'] or 0 for row in activity.values()), 0),
         'average_score': 0.0,
         'top_anime': [],
         'genres': [],
-        'days_spent': 0.0
+        'days_spent': 0.0,
+        'monthly_episodes': monthly_episodes(user_id, year),
     }
 
-    scored_entries_count = 0
-    total_score = 0
-    anime_ids_to_fetch_genres = []
-
-    for entry in entries:
-        stats['total_episodes'] += entry['episodes_watched']
-        
-        if entry['status'] == 'completed':
-            stats['total_completed'] += 1
-            
-        if entry['score'] > 0:
-            total_score += entry['score']
-            scored_entries_count += 1
-            
-        # Collect IDs to fetch genres later
-        anime_ids_to_fetch_genres.append(entry['anime_id'])
-
-    # Calculate average score
-    if scored_entries_count > 0:
-        stats['average_score'] = round(total_score / scored_entries_count, 1)
+    scores = [e['score'] for e in entries if e['score'] > 0]
+    if scores:
+        stats['average_score'] = round(sum(scores) / len(scores), 1)
 
     # Calculate approximate days spent (assuming 24 mins per episode)
     stats['days_spent'] = round((stats['total_episodes'] * 24.0) / (60.0 * 24.0), 1)
 
     # Find Top Anime (highest scored, then most episodes watched as tie-breaker)
-    # We only want to highlight ones they actually scored highly
+    # If no scored anime, just take the ones with most episodes watched
     top_candidates = sorted(
-        [e for e in entries if e['score'] > 0], 
-        key=lambda x: (x['score'], x['episodes_watched']), 
+        [e for e in entries if e['score'] > 0] or entries,
+        key=lambda x: (x['score'], x['episodes_watched']),
         reverse=True
     )
-    
-    # If no scored anime, just take the ones with most episodes watched
-    if not top_candidates:
-        top_candidates = sorted(
-            entries, 
-            key=lambda x: x['episodes_watched'], 
-            reverse=True
-        )
-
-    stats['top_anime'] = top_candidates[:5] # Top 5
+    stats['top_anime'] = top_candidates[:5]
 
-    # Fetch Genres concurrently for the top ~20 anime to build a genre profile
+    # Genre profile over the whole year, from the local metadata cache
     genre_counter = Counter()
-    
-    # To keep API calls reasonable, we'll only fetch details for up to 20 anime
-    # from their list to build the genre profile.
-    sample_ids = anime_ids_to_fetch_genres[:20] 
-    
-    tasks = []
-    for anime_id in sample_ids:
-        # We use a long cache timeout (7 days) because anime genres rarely change
-        cache_key = f"anime_details_{anime_id}"
-        url = f"{JIKAN_API_ENDPOINTS['anime_base']}/{anime_id}"
-        tasks.append(fetch_jikan_data(cache_key, url, timeout=604800))
-        
-    results = await asyncio.gather(*tasks)
-    
-    for res in results:
-        data = res.get('data')
-        if data and 'genres' in data:
-            for g in data['genres']:
-                genre_counter[g['name']] += 1
-                
+    known = set()
+    for mal_id, genres in AnimeMetadata.objects.filter(mal_id__in=activity).values_list('mal_id', 'genres'):
+        known.add(mal_id)
+        genre_counter.update(genres)
+
     # Top 3 genres
     stats['genres'] = [
-        {'name': name, 'count': count} 
+        {'name': name, 'count': count}
         for name, count in genre_counter.most_common(3)
     ]
+    return stats, sorted(set(activity) - known)
+
+
+def save_wrapped_snapshot(user_id, year):
+    """Recompute and persist one WrappedSnapshot. Returns (snapshot or None, missing metadata ids)."""
+    from .models import WrappedSnapshot
 
-    return stats
+    stats, missing = compute_wrapped_stats(user_id, year)
+    if stats is None:
+        WrappedSnapshot.objects.filter(user_id=user_id, year=year).delete()
+        return None, missing
+    snapshot, _ = WrappedSnapshot.objects.update_or_create(user_id=user_id, year=year, defaults={'stats': stats})
+    return snapshot, missing
 
 import threading
 import requests
@@ -1,62 +1,209 @@
-from django.db.models.signals import post_save
+import datetime
+
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Activity, Review, ReviewLike
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Activity, Review, ReviewLike, Notification
+from .notifications import create_notifications
+from .community import apply_transitions
+from . import outbox
 from users.models import UserAnimeEntry
 
+# "+1 episode" clicks on the same title within this many seconds share a feed item
+PROGRESS_ACTIVITY_WINDOW = 3600
+
+# Receivers only publish an outbox event (one INSERT in the request's transaction);
+# the handlers below do the actual work in the drain_outbox_task worker.
+
 @receiver(post_save, sender=UserAnimeEntry)
 def track_status_update(sender, instance, created, **kwargs):
-    # Invalidate cached profile stats whenever an entry changes
-    from django.core.cache import cache
-    cache.delete(f'profile_stats_{instance.user_id}')
+    # What changed since the entry was loaded, for the EntryEvent log
+    changes = instance.tracked_changes(created)
+    stats = instance.stats_transition(created)
+    tracked = instance.knows_tracked_values(created)
+    instance.remember_tracked_values()
+    outbox.publish(
+        'entry.saved',
+        user_id=instance.user_id,
+        entry_id=instance.id,
+        anime_id=instance.anime_id,
+        title=instance.title,
+        changes=changes,
+        stats=stats,
+        tracked=tracked,
+        at=timezone.now().isoformat(),
+    )
 
-    # For status updates, we track both creation and changes
-    Activity.objects.create(
-        user=instance.user,
-        activity_type='status_update',
+@receiver(post_delete, sender=UserAnimeEntry)
+def track_entry_deletion(sender, instance, **kwargs):
+    outbox.publish(
+        'entry.deleted',
+        user_id=instance.user_id,
         anime_id=instance.anime_id,
-        anime_title=instance.title,
-        related_id=instance.id
+        status=instance.status,
+        score=instance.score,
     )
 
 @receiver(post_save, sender=Review)
 def track_new_review(sender, instance, created, **kwargs):
     if created:
-        # Try to get anime title from UserAnimeEntry if possible
-        anime_title = "Unknown Anime"
-        entry = UserAnimeEntry.objects.filter(user=instance.user, anime_id=instance.anime_id).first()
-        if entry:
-            anime_title = entry.title
-            
-        Activity.objects.create(
-            user=instance.user,
-            activity_type='new_review',
+        outbox.publish(
+            'review.created',
+            user_id=instance.user_id,
+            review_id=instance.id,
             anime_id=instance.anime_id,
-            anime_title=anime_title,
-            related_id=instance.id
         )
 
 @receiver(post_save, sender=ReviewLike)
 def track_review_like(sender, instance, created, **kwargs):
     if created:
-        Activity.objects.create(
-            user=instance.user,
-            activity_type='review_like',
-            anime_id=instance.review.anime_id,
-            # We need title here too.
-            # Usually better to have anime title in Review model too, 
-            # but let's fetch it for now.
-            anime_title=f"Review by {instance.review.user.username}",
-            related_id=instance.review.id
+        outbox.publish('review.liked', user_id=instance.user_id, review_id=instance.review_id)
+
+
+@outbox.handler('entry.saved')
+def record_status_activities(payloads):
+    # Invalidate cached profile stats whenever an entry changes
+    cache.delete_many({f"profile_stats_{p['user_id']}" for p in payloads})
+
+    # For status updates, we track both creation and changes
+    Activity.objects.bulk_create([
+        Activity(
+            user_id=p['user_id'],
+            activity_type='status_update',
+            anime_id=p['anime_id'],
+            anime_title=p['title'],
+            related_id=p['entry_id'],
+        )
+        for p in payloads
+    ])
+
+@outbox.handler('entry.progressed')
+def record_progress_activities(payloads):
+    cache.delete_many({f"profile_stats_{p['user_id']}" for p in payloads})
+
+    # Binge-clicking "+1" shows up as one feed item per title per hour
+    latest = {(p['user_id'], p['anime_id']): p for p in payloads}
+    recent = set(
+        Activity.objects.filter(
+            activity_type='status_update',
+            user_id__in={user_id for user_id, _ in latest},
+            anime_id__in={anime_id for _, anime_id in latest},
+            created_at__gte=timezone.now() - datetime.timedelta(seconds=PROGRESS_ACTIVITY_WINDOW),
+        ).values_list('user_id', 'anime_id')
+    )
+    Activity.objects.bulk_create([
+        Activity(
+            user_id=p['user_id'],
+            activity_type='status_update',
+            anime_id=p['anime_id'],
+            anime_title=p['title'],
+            related_id=p['entry_id'],
         )
+        for key, p in latest.items() if key not in recent
+    ])
+
+@outbox.handler('review.created')
+def record_review_activities(payloads):
+    # Try to get anime title from UserAnimeEntry if possible
+    titles = {
+        (e['user_id'], e['anime_id']): e['title']
+        for e in UserAnimeEntry.objects.filter(
+            user_id__in={p['user_id'] for p in payloads},
+            anime_id__in={p['anime_id'] for p in payloads},
+        ).values('user_id', 'anime_id', 'title')
+    }
+    Activity.objects.bulk_create([
+        Activity(
+            user_id=p['user_id'],
+            activity_type='new_review',
+            anime_id=p['anime_id'],
+            anime_title=titles.get((p['user_id'], p['anime_id']), "Unknown Anime"),
+            related_id=p['review_id'],
+        )
+        for p in payloads
+    ])
+
+@outbox.handler('review.liked')
+def record_review_likes(payloads):
+    users = User.objects.in_bulk({p['user_id'] for p in payloads})
+    reviews = Review.objects.select_related('user').in_bulk({p['review_id'] for p in payloads})
+
+    activities = []
+    notifications = []
+    for p in payloads:
+        liker = users.get(p['user_id'])
+        review = reviews.get(p['review_id'])
+        if liker is None or review is None:
+            continue  # Deleted before the worker got to it
+
+        activities.append(Activity(
+            user=liker,
+            activity_type='review_like',
+            anime_id=review.anime_id,
+            # Usually better to have anime title in Review model too
+            anime_title=f"Review by {review.user.username}",
+            related_id=review.id,
+        ))
 
         # Create a notification for the review owner (if it's not their own like)
-        if instance.user != instance.review.user:
-            from .models import Notification
-            Notification.objects.create(
-                recipient=instance.review.user,
-                sender=instance.user,
+        if liker.id != review.user_id:
+            notifications.append(Notification(
+                recipient_id=review.user_id,
+                sender=liker,
                 notification_type='review_like',
-                message=f"{instance.user.username} liked your review.",
-                link=f"/anime/{instance.review.anime_id}/reviews/"
-            )
+                message=f"{liker.username} liked your review.",
+                link=f"/anime/{review.anime_id}/reviews/",
+                group_key=f"review_like:{review.id}",
+            ))
+
+    Activity.objects.bulk_create(activities)
+    return create_notifications(notifications)
+
+@outbox.handler('list.imported')
+def record_import_activities(payloads):
+    cache.delete_many({f"profile_stats_{p['user_id']}" for p in payloads})
+
+    # One feed item per import instead of one per imported entry
+    Activity.objects.bulk_create([
+        Activity(
+            user_id=p['user_id'],
+            activity_type='list_import',
+            anime_id=0,
+            anime_title=f"{p['count']} anime",
+            related_id=p['job_id'],
+        )
+        for p in payloads
+    ])
+
+@outbox.handler('list.batch_updated')
+def record_batch_activities(payloads):
+    cache.delete_many({f"profile_stats_{p['user_id']}" for p in payloads})
+
+    # One feed item per bulk edit
+    Activity.objects.bulk_create([
+        Activity(
+            user_id=p['user_id'],
+            activity_type='list_batch',
+            anime_id=0,
+            anime_title=f"{p['count']} anime",
+        )
+        for p in payloads
+    ])
+
+@outbox.handler('entry.saved')
+def update_community_stats(payloads):
+    apply_transitions([(p['anime_id'], *p['stats']) for p in payloads if p.get('stats')])
+
+@outbox.handler('entry.deleted')
+def remove_from_community_stats(payloads):
+    apply_transitions([(p['anime_id'], p['status'], p['score'], None, 0) for p in payloads])
+
+@outbox.handler('entry.saved')
+@outbox.handler('list.imported')
+@outbox.handler('list.batch_updated')
+def refresh_recommendations(payloads):
+    # The refresh task itself skips the recompute if nothing relevant changed
+    from .services import schedule_recommendation_refresh
+    schedule_recommendation_refresh({p['user_id'] for p in payloads})
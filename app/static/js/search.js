@@ -11,6 +11,12 @@ document.addEventListener("DOMContentLoaded", () => {
     const applyBtn = document.getElementById("apply-filters");
     const resultsWrapper = document.getElementById("search-results-container"); // Wrapper on homepage
 
+    // Suggestions while typing come from the lighter /api/typeahead/ endpoint
+    const TYPEAHEAD_MIN_LENGTH = 2; // Same as TYPEAHEAD_MIN_LENGTH in app/views.py
+    const TYPEAHEAD_DELAY = 250;
+    let typeaheadTimer = null;
+    let latestRequest = 0;
+
     // Helper: Build Search Params
     const getSearchParams = () => {
         const params = {
@@ -41,10 +47,12 @@ document.addEventListener("DOMContentLoaded", () => {
         container.appendChild(link);
     }
 
-    // Perform Search
-    const performSearch = () => {
+    // Perform Search; `typeahead` fetches suggestions for the text typed so far
+    const performSearch = (typeahead = false) => {
+        clearTimeout(typeaheadTimer);
         const params = getSearchParams();
         if (!params.q && !params.genres && !params.year && !params.type) return;
+        const request = ++latestRequest;
 
         // Show loading state
         if (container) {
@@ -74,7 +82,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
         if (resultsWrapper) {
             resultsWrapper.style.display = "block";
-            window.scrollTo({ top: resultsWrapper.offsetTop - 100, behavior: 'smooth' });
+            if (!typeahead) window.scrollTo({ top: resultsWrapper.offsetTop - 100, behavior: 'smooth' });
         }
 
         const queryParams = new URLSearchParams();
@@ -83,9 +91,11 @@ document.addEventListener("DOMContentLoaded", () => {
         if (params.year) queryParams.append('year', params.year);
         if (params.type) queryParams.append('type', params.type);
 
-        fetch(`/api/search/?${queryParams.toString()}`)
+        fetch(`${typeahead ? '/api/typeahead/' : '/api/search/'}?${queryParams.toString()}`)
             .then(res => res.json())
             .then(data => {
+                // A later keystroke or search has replaced this one
+                if (request !== latestRequest) return;
                 if (container) {
                     container.innerHTML = "";
                     if (!data.data || data.data.length === 0) {
@@ -96,17 +106,18 @@ document.addEventListener("DOMContentLoaded", () => {
                 }
             })
             .catch(err => {
+                if (request !== latestRequest) return;
                 console.error("Search failed:", err);
                 if (container) container.innerHTML = "<div style='color: white; grid-column: 1/-1; text-align: center;'>Error occurred.</div>";
             });
     };
 
     if (searchBtn) {
-        searchBtn.addEventListener("click", performSearch);
+        searchBtn.addEventListener("click", () => performSearch());
     }
 
     if (applyBtn) {
-        applyBtn.addEventListener("click", performSearch);
+        applyBtn.addEventListener("click", () => performSearch());
     }
 
     // Enter key support
@@ -116,6 +127,13 @@ document.addEventListener("DOMContentLoaded", () => {
                 performSearch();
             }
         });
+
+        // Autocomplete once typing pauses
+        inputBox.addEventListener("input", () => {
+            clearTimeout(typeaheadTimer);
+            if (inputBox.value.trim().length < TYPEAHEAD_MIN_LENGTH) return;
+            typeaheadTimer = setTimeout(() => performSearch(true), TYPEAHEAD_DELAY);
+        });
     }
 
     // Close logic
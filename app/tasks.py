@@ -1,86 +1,398 @@
-import time
-import requests
 import logging
 from celery import shared_task
 from django.utils import timezone
-from django.contrib.auth.models import User
-from users.models import UserAnimeEntry
+from django.db import transaction
+from users.models import UserAnimeEntry, ImportJob, EntryEvent, ListSequence
+from users.signals import record_episode_deltas
+from users.membership import add_to_sets
+from . import outbox
+from .community import apply_transitions
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def import_mal_username_task(user_id, mal_username):
+# Entries written per bulk upsert statement during list imports
+IMPORT_CHUNK_SIZE = 500
+
+# MAL XML export status to MitsuList status mapping
+MAL_XML_STATUS_MAP = {
+    'Watching': 'watching',
+    'Completed': 'completed',
+    'On-Hold': 'on_hold',
+    'Dropped': 'dropped',
+    'Plan to Watch': 'plan_to_watch'
+}
+
+
+def bulk_upsert_entries(user_id, rows, update_fields):
     """
-    Background Celery worker to import MAL user list via Jikan API.
-    Handles pagination sequentially.
+    Insert or update a chunk of list entries with a single INSERT ... ON CONFLICT.
+    bulk_create skips the per-entry post_save handlers; callers publish one
+    'list.imported' outbox event when the whole import is done instead.
     """
-    # MAL API status mapping
-    status_map = {
-        1: 'watching',
-        2: 'completed',
-        3: 'on_hold',
-        4: 'dropped',
-        6: 'plan_to_watch'
+    # ON CONFLICT can't touch the same row twice in one statement - last row wins
+    entries = {row['anime_id']: UserAnimeEntry(user_id=user_id, **row) for row in rows}
+
+    # Log what the import changed, against the rows as they were before the upsert
+    existing = {
+        anime_id: (status, score, episodes_watched)
+        for anime_id, status, score, episodes_watched in UserAnimeEntry.objects.filter(
+            user_id=user_id, anime_id__in=entries
+        ).values_list('anime_id', 'status', 'score', 'episodes_watched')
+    }
+    now = timezone.now()
+    events = []
+    transitions = []
+    for anime_id, entry in entries.items():
+        old_status, old_score, old_episodes = existing.get(anime_id, (None, 0, 0))
+        new_status = entry.status if anime_id not in existing or 'status' in update_fields else old_status
+        new_score = entry.score if anime_id not in existing or 'score' in update_fields else old_score
+        new_episodes = entry.episodes_watched if anime_id not in existing or 'episodes_watched' in update_fields else old_episodes
+        if (new_status, new_score) != (old_status, old_score):
+            transitions.append((anime_id, old_status, old_score, new_status, new_score))
+        if (new_status, new_score, new_episodes) != (old_status, old_score, old_episodes):
+            events.append(EntryEvent(
+                user_id=user_id,
+                anime_id=anime_id,
+                status=new_status if new_status != old_status else '',
+                score_delta=new_score - old_score,
+                episode_delta=new_episodes - old_episodes,
+                created_at=now,
+            ))
+
+    with transaction.atomic():
+        # One block of sequence values for the chunk, for delta sync clients
+        first_seq = ListSequence.reserve(user_id, len(entries))
+        for offset, entry in enumerate(entries.values()):
+            entry.change_seq = first_seq + offset
+        UserAnimeEntry.objects.bulk_create(
+            list(entries.values()),
+            update_conflicts=True,
+            unique_fields=['user', 'anime_id'],
+            update_fields=[*update_fields, 'change_seq'],
+        )
+        EntryEvent.objects.bulk_create(events)
+        record_episode_deltas(events)
+        apply_transitions(transitions)
+        add_to_sets((user_id, anime_id) for anime_id in entries if anime_id not in existing)
+    return len(entries)
+
+
+def report_import_progress(job):
+    """Push the job's progress to the owner's notification socket."""
+    outbox.send_group_messages([(
+        f'user_{job.user_id}_notifications',
+        {
+            'type': 'import_progress',
+            'job_id': job.id,
+            'status': job.status,
+            'processed': job.processed,
+        }
+    )])
+
+
+def finish_import(job, count):
+    """One stats/badge/activity recompute for the whole import instead of one per entry."""
+    if count:
+        outbox.publish('list.imported', user_id=job.user_id, job_id=job.id, count=count)
+    report_import_progress(job)
+
+
+def _parse_mal_xml_anime(elem):
+    mal_id_elem = elem.find('series_animedb_id')
+    if mal_id_elem is None:
+        return None
+
+    title_elem = elem.find('series_title')
+    status_elem = elem.find('my_status')
+    score_elem = elem.find('my_score')
+    episodes_elem = elem.find('my_watched_episodes')
+
+    my_status = status_elem.text if status_elem is not None else "Plan to Watch"
+    return {
+        'anime_id': int(mal_id_elem.text),
+        # We save title to avoid API lookups for simple lists
+        'title': title_elem.text if title_elem is not None and title_elem.text else "Unknown Title",
+        'status': MAL_XML_STATUS_MAP.get(my_status, 'plan_to_watch'),
+        'score': int(score_elem.text) if score_elem is not None and score_elem.text else 0,
+        'episodes_watched': int(episodes_elem.text) if episodes_elem is not None and episodes_elem.text else 0,
     }
 
+
+@shared_task
+def import_mal_xml_task(job_id):
+    """
+    Background import of an uploaded MAL XML export.
+    The file is parsed incrementally with iterparse and written in chunks, so
+    memory stays flat and the request that uploaded it returns immediately.
+    """
+    import xml.etree.ElementTree as ET
+
+    job = ImportJob.objects.get(id=job_id)
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+    report_import_progress(job)
+
+    update_fields = ['title', 'status', 'score', 'episodes_watched', 'updated_at']
+    chunk = []
+
+    def flush():
+        job.processed += bulk_upsert_entries(job.user_id, chunk, update_fields)
+        chunk.clear()
+        ImportJob.objects.filter(id=job.id).update(processed=job.processed, updated_at=timezone.now())
+        report_import_progress(job)
+
     try:
-        user = User.objects.get(id=user_id)
-        has_next_page = True
-        page = 1
-        count = 0
-        
-        while has_next_page:
-            url = f"https://api.jikan.moe/v4/users/{mal_username}/animelist/all?page={page}"
-            response = requests.get(url, timeout=15.0)
-            
-            if response.status_code == 200:
-                data = response.json()
-                entries = data.get('data', [])
-                
-                for entry in entries:
-                    anime = entry.get('anime', {})
-                    mal_id = anime.get('mal_id')
-                    title = anime.get('title')
-                    images = anime.get('images', {}).get('jpg', {}).get('image_url', '')
-                    
-                    my_status = entry.get('watching_status', 6)
-                    my_score = entry.get('score', 0)
-                    my_episodes = entry.get('episodes_watched', 0)
-                    
-                    db_status = status_map.get(my_status, 'plan_to_watch')
-                    
-                    UserAnimeEntry.objects.update_or_create(
-                        user=user,
-                        anime_id=mal_id,
-                        defaults={
-                            'title': title,
-                            'status': db_status,
-                            'score': my_score,
-                            'episodes_watched': my_episodes,
-                            'image_url': images,
-                            'updated_at': timezone.now()
-                        }
-                    )
-                    count += 1
-                
-                pagination = data.get('pagination', {})
-                has_next_page = pagination.get('has_next_page', False)
+        with job.file.open('rb') as xml_file:
+            context = ET.iterparse(xml_file, events=('start', 'end'))
+            _, root = next(context)
+            for event, elem in context:
+                if event != 'end' or elem.tag != 'anime':
+                    continue
+                try:
+                    row = _parse_mal_xml_anime(elem)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Skipping bad entry in XML import: {e}")
+                    row = None
+                # Drop parsed elements so memory doesn't grow with the file
+                root.clear()
+
+                if row:
+                    chunk.append(row)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    flush()
+        if chunk:
+            flush()
+        job.status = 'completed'
+    except Exception as e:
+        logger.error(f"XML import error for job {job.id}: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.file.delete(save=False)
+    job.save(update_fields=['status', 'error', 'processed', 'file', 'updated_at'])
+    finish_import(job, job.processed)
+
+# MAL API status mapping
+MAL_API_STATUS_MAP = {
+    1: 'watching',
+    2: 'completed',
+    3: 'on_hold',
+    4: 'dropped',
+    6: 'plan_to_watch'
+}
+
+# Animelist pages requested at once; the shared Jikan semaphore still caps
+# how many are actually in flight
+MAL_IMPORT_PAGE_WINDOW = 3
+
+
+class ImportFetchError(Exception):
+    """A page could not be fetched even after request_jikan's own retries."""
+
+
+def _parse_mal_api_entry(entry):
+    anime = entry.get('anime', {})
+    if not anime.get('mal_id'):
+        return None
+    return {
+        'anime_id': anime['mal_id'],
+        'title': anime.get('title') or "Unknown Title",
+        'image_url': anime.get('images', {}).get('jpg', {}).get('image_url', ''),
+        'status': MAL_API_STATUS_MAP.get(entry.get('watching_status', 6), 'plan_to_watch'),
+        'score': entry.get('score') or 0,
+        'episodes_watched': entry.get('episodes_watched') or 0,
+    }
+
+
+def _write_page_checkpoint(job, page, total_pages, rows):
+    """Upsert one page of entries and advance the job's checkpoint in the same transaction."""
+    from django.db import transaction
+
+    update_fields = ['title', 'image_url', 'status', 'score', 'episodes_watched', 'updated_at']
+    with transaction.atomic():
+        if rows:
+            job.processed += bulk_upsert_entries(job.user_id, rows, update_fields)
+        job.last_page = page
+        job.total_pages = total_pages
+        job.save(update_fields=['processed', 'last_page', 'total_pages', 'updated_at'])
+    report_import_progress(job)
+
+
+async def _import_mal_pages(job):
+    """
+    Fetch the remaining animelist pages in overlapping windows and write them
+    in page order. Page N+1's window is already in flight while page N is
+    being written, and the checkpoint only ever moves over a contiguous prefix.
+    """
+    import asyncio
+    import httpx
+    from urllib.parse import quote
+    from asgiref.sync import sync_to_async
+    from .services import request_jikan
+
+    write_page = sync_to_async(_write_page_checkpoint)
+    base_url = f"https://api.jikan.moe/v4/users/{quote(job.mal_username)}/animelist/all"
+
+    async with httpx.AsyncClient() as client:
+        async def fetch(page):
+            status_code, data = await request_jikan(client, f"{base_url}?page={page}")
+            if status_code == 404:
+                raise LookupError(f"MAL user {job.mal_username} not found.")
+            if status_code != 200:
+                raise ImportFetchError(f"Page {page} failed with status {status_code}")
+            return data
+
+        # The first pending page also tells us how many pages there are
+        page = job.last_page + 1
+        data = await fetch(page)
+        total_pages = data.get('pagination', {}).get('last_visible_page') or page
+        in_flight = {}
+        next_page = page + 1
+
+        try:
+            while True:
+                # Keep a window of page fetches running ahead of the writer
+                while next_page <= total_pages and len(in_flight) < MAL_IMPORT_PAGE_WINDOW:
+                    in_flight[next_page] = asyncio.ensure_future(fetch(next_page))
+                    next_page += 1
+
+                rows = [row for row in map(_parse_mal_api_entry, data.get('data', [])) if row]
+                await write_page(job, page, total_pages, rows)
+
                 page += 1
-                
-                # Sleep to respect Jikan's strict rate limits (3 req/sec)
-                time.sleep(0.5)
-                
-            elif response.status_code == 429:
-                logger.warning(f"Rate limited during MAL background import. Retrying...")
-                time.sleep(2) # Backoff
-            elif response.status_code == 404:
-                logger.warning(f"MAL user {mal_username} not found via background import.")
-                break
-            else:
-                logger.warning(f"Failed to fetch MAL list for {mal_username}. Status: {response.status_code}")
-                break
-                
-        logger.info(f"Successfully imported {count} anime for user {user.username} from MAL username {mal_username}")
-        
+                if page not in in_flight:
+                    break
+                data = await in_flight.pop(page)
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+
+
+@shared_task(bind=True, max_retries=5)
+def import_mal_username_task(self, job_id):
+    """
+    Background Celery worker to import MAL user list via Jikan API.
+    Pages are fetched concurrently under the shared Jikan throttle and each
+    page is bulk upserted together with a checkpoint, so a retry (or a rerun
+    after a worker crash) resumes after the last written page. Upserts are
+    idempotent, so replaying a page is harmless. The page writes run back on
+    this thread, on the task's own database connection.
+    """
+    from asgiref.sync import async_to_sync
+
+    job = ImportJob.objects.get(id=job_id)
+    if job.status in ('completed', 'failed'):
+        return
+
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+    report_import_progress(job)
+
+    try:
+        async_to_sync(_import_mal_pages)(job)
+        job.status = 'completed'
+        logger.info(f"Successfully imported {job.processed} anime for user {job.user_id} from MAL username {job.mal_username}")
+    except ImportFetchError as e:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"MAL import {job.id} paused at page {job.last_page}: {e}. Retrying...")
+            raise self.retry(exc=e, countdown=30 * 2 ** self.request.retries)
+        job.status = 'failed'
+        job.error = str(e)
     except Exception as e:
         logger.error(f"Background MAL import error: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    finish_import(job, job.processed)
+
+@shared_task(ignore_result=True)
+def drain_outbox_task(max_batches=20):
+    """
+    Periodic worker (see CELERY_BEAT_SCHEDULE) that processes pending outbox
+    events: activities, badges, notifications and their websocket broadcasts.
+    """
+    from .outbox import drain
+
+    for _ in range(max_batches):
+        if not drain():
+            break
+
+
+@shared_task(ignore_result=True)
+def flush_notification_push_task(group):
+    """Send the notification push that was held back by the per-user rate limit."""
+    from .notifications import flush_deferred_push
+    outbox.send_group_messages(flush_deferred_push(group))
+
+
+@shared_task
+def build_item_similarity_task():
+    """Nightly rebuild of the item-item neighbour table used by Yui AI recommendations."""
+    from .recommender import build_item_similarity
+    written = build_item_similarity()
+    logger.info(f"Rebuilt anime similarity table: {written} neighbour rows")
+    return written
+
+
+@shared_task
+def refresh_user_recommendations_task(user_id):
+    """Recompute one user's cached recommendations after their list changed."""
+    import asyncio
+    from django.contrib.auth.models import User
+    from .services import refresh_user_recommendations
+
+    user = User.objects.filter(id=user_id).first()
+    if user is not None:
+        asyncio.run(refresh_user_recommendations(user))
+
+
+@shared_task
+def build_wrapped_snapshot_task(user_id, year):
+    """Fetch any genre metadata Wrapped is missing for this user, then rebuild the snapshot."""
+    import asyncio
+    from .services import fill_missing_anime_metadata, save_wrapped_snapshot
+
+    _, missing = save_wrapped_snapshot(user_id, year)
+    if missing:
+        asyncio.run(fill_missing_anime_metadata(missing))
+        save_wrapped_snapshot(user_id, year)
+
+
+@shared_task
+def precompute_wrapped_task(year=None):
+    """
+    Seasonal batch: build Wrapped for every user active in `year` ahead of launch.
+    Missing metadata is fetched once for the union of everyone's titles.
+    """
+    import asyncio
+    from .services import fill_missing_anime_metadata, save_wrapped_snapshot
+
+    year = year or timezone.now().year
+    yearly = EntryEvent.objects.filter(created_at__year=year, baseline=False)
+    asyncio.run(fill_missing_anime_metadata(list(yearly.values_list('anime_id', flat=True).distinct())))
+
+    user_ids = list(yearly.values_list('user_id', flat=True).distinct().order_by('user_id'))
+    for user_id in user_ids:
+        save_wrapped_snapshot(user_id, year)
+    logger.info(f"Precomputed Wrapped {year} for {len(user_ids)} users")
+    return len(user_ids)
+
+
+@shared_task
+def rebuild_community_stats_task():
+    """Nightly full rebuild of AnimeCommunityStats, healing any drift in the deltas."""
+    from .community import rebuild_community_stats
+    count = rebuild_community_stats()
+    logger.info(f"Rebuilt community stats for {count} anime")
+    return count
+
+
+@shared_task
+def refresh_weekly_schedule_task():
+    """Refetch the release calendar week from Jikan (see app/schedule.py)."""
+    from .schedule import refresh_weekly_schedule
+    count = refresh_weekly_schedule()
+    if count is None:
+        logger.warning("Weekly schedule refresh failed; keeping the previous week")
+    return count
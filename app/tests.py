@@ -1,7 +1,13 @@
-from django.test import TransactionTestCase, AsyncClient
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, AsyncClient, override_settings
 from django.urls import reverse
+from django.db import transaction
+from django.contrib.auth.models import User
 from unittest.mock import patch, AsyncMock
-from .models import News
+from .models import News, Review, ReviewLike, Activity, Notification, OutboxEvent, AnimeSimilarity
+from .notifications import WS_MIN_INTERVAL
+from .outbox import drain
+from users.models import UserAnimeEntry, Follow
 
 class AppViewsTest(TransactionTestCase):
     def setUp(self):
@@ -48,3 +54,813 @@ class AppViewsTest(TransactionTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'anime-view.html')
         self.assertContains(response, 'Test Anime')
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='liker', password='password123')
+        self.author = User.objects.create_user(username='author', password='password123')
+        self.review = Review.objects.create(user=self.author, anime_id=1, content='Great show')
+        drain()
+
+    def test_signals_only_write_outbox_rows(self):
+        ReviewLike.objects.create(user=self.user, review=self.review)
+
+        self.assertEqual(OutboxEvent.objects.filter(topic='review.liked').count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    @patch('app.outbox.send_group_messages')
+    def test_drain_runs_handlers_and_broadcasts_in_one_batch(self, mock_send):
+        ReviewLike.objects.create(user=self.user, review=self.review)
+        UserAnimeEntry.objects.create(user=self.user, anime_id=5, title='Test Anime')
+
+        drain()
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(Activity.objects.filter(activity_type='review_like').count(), 1)
+        self.assertEqual(Activity.objects.filter(activity_type='status_update').count(), 1)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.notification_type, 'review_like')
+        mock_send.assert_called_once()
+        (group, message), = mock_send.call_args[0][0]
+        self.assertEqual(group, f'user_{self.author.id}_notifications')
+
+    @patch('app.outbox.send_group_messages')
+    def test_failed_handler_is_retried_alone(self, mock_send):
+        UserAnimeEntry.objects.create(user=self.user, anime_id=5, title='Test Anime', status='watching')
+
+        with patch('app.services.schedule_recommendation_refresh', side_effect=RuntimeError) as mock_refresh:
+            drain()
+            drain()
+        self.assertEqual(mock_refresh.call_count, 2)
+        event = OutboxEvent.objects.get(topic='entry.saved')
+        self.assertEqual(event.attempts, 2)
+        self.assertNotIn('app.signals.refresh_recommendations', event.done_handlers)
+
+        with patch('app.services.schedule_recommendation_refresh') as mock_refresh:
+            drain()
+        mock_refresh.assert_called_once_with({self.user.id})
+        self.assertFalse(OutboxEvent.objects.exists())
+        # The handlers that succeeded the first time ran once
+        self.assertEqual(Activity.objects.filter(activity_type='status_update').count(), 1)
+
+    def test_rolled_back_write_leaves_no_event(self):
+        try:
+            with transaction.atomic():
+                ReviewLike.objects.create(user=self.user, review=self.review)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class NotificationDigestTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='password123')
+        self.review = Review.objects.create(user=self.author, anime_id=1, content='Great show')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='password123') for i in range(3)]
+        drain()
+
+    @patch('app.outbox.send_group_messages')
+    def test_likes_on_one_review_fold_into_one_row(self, mock_send):
+        for fan in self.fans[:2]:
+            ReviewLike.objects.create(user=fan, review=self.review)
+        drain()
+        ReviewLike.objects.create(user=self.fans[2], review=self.review)
+        drain()
+
+        notification = Notification.objects.get(recipient=self.author, notification_type='review_like')
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.message, "fan2 and 2 others liked your review.")
+        self.assertEqual(notification.sender, self.fans[2])
+
+    @patch('app.outbox.send_group_messages')
+    def test_read_digest_starts_a_new_row(self, mock_send):
+        ReviewLike.objects.create(user=self.fans[0], review=self.review)
+        drain()
+        Notification.objects.update(is_read=True)
+        ReviewLike.objects.create(user=self.fans[1], review=self.review)
+        drain()
+
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 2)
+
+    @patch('app.outbox.send_group_messages')
+    def test_one_socket_message_per_recipient_per_batch(self, mock_send):
+        for fan in self.fans:
+            Follow.objects.create(user=fan, following=self.author)
+            ReviewLike.objects.create(user=fan, review=self.review)
+        drain()
+
+        messages = mock_send.call_args[0][0]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][1]['unread'], 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'notification-push-tests'}})
+class NotificationPushThrottleTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def message(self, text, unread):
+        return {'type': 'send_notification', 'title': 'Like', 'message': text, 'link': '', 'unread': unread}
+
+    @patch('app.tasks.flush_notification_push_task.apply_async')
+    def test_throttled_pushes_are_deferred_not_dropped(self, mock_flush):
+        from .notifications import coalesce_notification_messages, flush_deferred_push
+        group = 'user_1_notifications'
+
+        self.assertEqual(coalesce_notification_messages(group, [self.message('a', 1)]), [self.message('a', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(coalesce_notification_messages(group, [self.message('b', 2)]), [])
+            self.assertEqual(coalesce_notification_messages(group, [self.message('c', 3)]), [])
+        mock_flush.assert_called_once_with((group,), countdown=WS_MIN_INTERVAL)
+
+        (flushed_group, message), = flush_deferred_push(group)
+        self.assertEqual(flushed_group, group)
+        self.assertEqual((message['message'], message['unread']), ('You have 2 new notifications', 3))
+        self.assertEqual(flush_deferred_push(group), [])
+
+
+class ItemSimilarityRecommenderTest(TestCase):
+    def setUp(self):
+        ratings = {
+            'fan1': {1: 10, 2: 9, 3: 3},
+            'fan2': {1: 9, 2: 10, 3: 4},
+            'fan3': {1: 10, 2: 9, 4: 2},
+        }
+        for username, scores in ratings.items():
+            user = User.objects.create_user(username=username, password='password123')
+            for anime_id, score in scores.items():
+                UserAnimeEntry.objects.create(user=user, anime_id=anime_id, title=f'Anime {anime_id}', status='completed', score=score)
+        self.user = User.objects.create_user(username='newcomer', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Anime 1', status='completed', score=10)
+
+    def test_build_keeps_positive_neighbours_with_support(self):
+        from .recommender import build_item_similarity
+        build_item_similarity(top_k=5)
+
+        neighbours = dict(AnimeSimilarity.objects.filter(anime_id=1).values_list('similar_anime_id', 'score'))
+        self.assertEqual(set(neighbours), {2})
+        self.assertGreater(neighbours[2], 0.9)
+        # Rated by a single user - below RECOMMENDER_MIN_SUPPORT
+        self.assertFalse(AnimeSimilarity.objects.filter(anime_id=4).exists())
+
+    def test_score_candidates_skips_owned_and_disliked(self):
+        from .recommender import score_candidates
+        neighbours = [(1, 2, 0.9), (1, 3, 0.5), (6, 3, 0.8), (6, 7, 0.4), (1, 7, 0.6)]
+
+        ranked = score_candidates({1: 10.0, 6: 2.0}, {1, 6, 2}, neighbours, limit=10)
+
+        # 3 is liked-neighbour of 1 but a closer neighbour of the disliked 6
+        self.assertEqual([candidate for candidate, _, _ in ranked], [7])
+
+    @patch('app.services.fetch_anime_recommendations', new_callable=AsyncMock)
+    async def test_yui_uses_local_model_before_jikan(self, mock_recommendations):
+        from asgiref.sync import sync_to_async
+        from .recommender import build_item_similarity
+        from .services import get_yui_ai_recommendations
+        await sync_to_async(build_item_similarity)()
+
+        _, fallback, recommendations = await get_yui_ai_recommendations(self.user, limit=5)
+
+        self.assertIsNone(fallback)
+        self.assertEqual([rec['anime']['mal_id'] for rec in recommendations], [2])
+        self.assertIn('Anime 1', recommendations[0]['context'])
+        mock_recommendations.assert_not_called()
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'recommendations-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RecommendationCacheTest(TestCase):
+    yui_result = ("Привіт!", None, [
+        {'anime': {'mal_id': 2, 'title': 'Anime 2', 'images': {'jpg': {'large_image_url': 'url'}}}, 'context': '', 'sources': ['Anime 1']},
+    ])
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password123')
+        self.entry = UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Anime 1', status='watching', score=9)
+
+    async def test_refresh_skips_recompute_for_episode_progress(self):
+        from asgiref.sync import sync_to_async
+        from .services import refresh_user_recommendations
+
+        with patch('app.services.get_yui_ai_recommendations', new_callable=AsyncMock, return_value=self.yui_result) as mock_yui:
+            await refresh_user_recommendations(self.user)
+            await UserAnimeEntry.objects.filter(id=self.entry.id).aupdate(episodes_watched=5)
+            await refresh_user_recommendations(self.user)
+            self.assertEqual(mock_yui.await_count, 1)
+
+            await UserAnimeEntry.objects.filter(id=self.entry.id).aupdate(status='completed')
+            payload = await refresh_user_recommendations(self.user)
+            self.assertEqual(mock_yui.await_count, 2)
+
+        self.assertEqual(payload['items'], [[2, 'Anime 2', 'url', ['Anime 1']]])
+
+    async def test_discover_is_a_cache_read(self):
+        from .services import refresh_user_recommendations
+        with patch('app.services.get_yui_ai_recommendations', new_callable=AsyncMock, return_value=self.yui_result):
+            await refresh_user_recommendations(self.user)
+
+        await self.async_client.aforce_login(self.user)
+        with patch('app.services.get_yui_ai_recommendations', new_callable=AsyncMock) as mock_yui:
+            response = await self.async_client.get(reverse('discover'))
+
+        mock_yui.assert_not_called()
+        self.assertContains(response, 'Anime 2')
+
+    @patch('app.tasks.refresh_user_recommendations_task.apply_async')
+    def test_list_changes_queue_one_debounced_refresh(self, mock_apply):
+        UserAnimeEntry.objects.create(user=self.user, anime_id=3, title='Anime 3', status='completed')
+        self.entry.status = 'completed'
+        self.entry.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            drain()
+            drain()
+
+        mock_apply.assert_called_once()
+        self.assertEqual(mock_apply.call_args.args[0], (self.user.id,))
+
+    def test_failed_enqueue_clears_the_debounce(self):
+        from .services import schedule_recommendation_refresh
+
+        with patch('app.tasks.refresh_user_recommendations_task.apply_async', side_effect=ConnectionError) as mock_apply:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                schedule_recommendation_refresh([self.user.id])
+                mock_apply.assert_not_called()  # Not before the commit
+            self.assertEqual(len(callbacks), 1)
+        with patch('app.tasks.refresh_user_recommendations_task.apply_async') as mock_apply:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_recommendation_refresh([self.user.id])
+
+        mock_apply.assert_called_once()
+
+
+class WrappedSnapshotTest(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        from .models import AnimeMetadata
+        self.year = timezone.now().year
+        AnimeMetadata.objects.create(mal_id=1, title='Bebop', genres=['Action', 'Sci-Fi'])
+        AnimeMetadata.objects.create(mal_id=2, title='Gundam', genres=['Sci-Fi'])
+        self.user = User.objects.create_user(username='wrapped', password='password123')
+        for anime_id, score in ((1, 10), (2, 8), (3, 0)):
+            UserAnimeEntry.objects.create(user=self.user, anime_id=anime_id, title=f'Anime {anime_id}', status='completed', score=score, episodes_watched=12)
+        # Wrapped reads the EntryEvent log written by the outbox
+        with patch('app.outbox.send_group_messages'):
+            drain()
+
+    def test_stats_use_local_metadata(self):
+        from .services import compute_wrapped_stats
+        stats, missing = compute_wrapped_stats(self.user.id, self.year)
+
+        self.assertEqual(stats['genres'], [{'name': 'Sci-Fi', 'count': 2}, {'name': 'Action', 'count': 1}])
+        self.assertEqual((stats['total_episodes'], stats['average_score']), (36, 9.0))
+        self.assertEqual(missing, [3])
+
+    def test_later_edits_do_not_move_titles_into_another_year(self):
+        from users.models import EntryEvent
+        from .services import compute_wrapped_stats
+        EntryEvent.objects.filter(anime_id=3).update(created_at=EntryEvent.objects.get(anime_id=3).created_at.replace(year=self.year - 1))
+        UserAnimeEntry.objects.filter(anime_id=3).update(title='Renamed')  # updated_at stays in this year
+
+        stats, _ = compute_wrapped_stats(self.user.id, self.year)
+
+        self.assertEqual(stats['total_episodes'], 24)
+        self.assertNotIn('Renamed', [anime['title'] for anime in stats['top_anime']])
+
+    @patch('app.tasks.build_wrapped_snapshot_task.delay')
+    def test_view_persists_snapshot_and_queues_missing_metadata(self, mock_delay):
+        from .models import WrappedSnapshot
+        self.client.login(username='wrapped', password='password123')
+
+        self.client.get(reverse('wrapped', args=[self.year]))
+        mock_delay.assert_called_once_with(self.user.id, self.year)
+        self.assertTrue(WrappedSnapshot.objects.filter(user=self.user, year=self.year).exists())
+
+        with patch('app.services.compute_wrapped_stats') as mock_compute:
+            response = self.client.get(reverse('wrapped', args=[self.year]))
+        mock_compute.assert_not_called()
+        self.assertEqual(response.context['stats']['total_episodes'], 36)
+
+    @override_settings(CACHES=LOCMEM_CACHE, WRAPPED_SNAPSHOT_MAX_AGE=0)
+    @patch('app.tasks.build_wrapped_snapshot_task.delay')
+    def test_stale_snapshot_queues_one_refresh(self, mock_delay):
+        from django.core.cache import cache
+        from .services import save_wrapped_snapshot
+        cache.clear()
+        save_wrapped_snapshot(self.user.id, self.year)
+        self.client.login(username='wrapped', password='password123')
+
+        for _ in range(3):
+            self.client.get(reverse('wrapped', args=[self.year]))
+
+        mock_delay.assert_called_once_with(self.user.id, self.year)
+
+    @patch('app.services.fill_missing_anime_metadata', new_callable=AsyncMock, return_value=0)
+    def test_seasonal_batch_covers_active_users(self, mock_fill):
+        from .models import WrappedSnapshot
+        from .tasks import precompute_wrapped_task
+        User.objects.create_user(username='idle', password='password123')
+
+        self.assertEqual(precompute_wrapped_task(self.year), 1)
+
+        self.assertEqual(sorted(mock_fill.await_args.args[0]), [1, 2, 3])
+        self.assertEqual(list(WrappedSnapshot.objects.values_list('user__username', flat=True)), ['wrapped'])
+
+
+@patch('app.outbox.send_group_messages')
+class CommunityStatsTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'member{i}', password='password123') for i in range(3)]
+        for user, status, score in zip(self.users, ('completed', 'completed', 'watching'), (9, 7, 0)):
+            UserAnimeEntry.objects.create(user=user, anime_id=1, title='Bebop', status=status, score=score)
+
+    def stats(self):
+        from .models import AnimeCommunityStats
+        return AnimeCommunityStats.objects.get(anime_id=1)
+
+    def test_saves_apply_deltas(self, mock_send):
+        drain()
+        stats = self.stats()
+        self.assertEqual((stats.members, stats.completed, stats.watching, stats.scored_count), (3, 2, 1, 2))
+        self.assertEqual(stats.mean_score, 8.0)
+
+        entry = UserAnimeEntry.objects.get(user=self.users[2], anime_id=1)
+        entry.status, entry.score = 'dropped', 3
+        entry.save()
+        UserAnimeEntry.objects.get(user=self.users[0], anime_id=1).delete()
+        drain()
+
+        stats = self.stats()
+        self.assertEqual((stats.members, stats.completed, stats.watching, stats.dropped), (2, 1, 0, 1))
+        self.assertEqual(stats.score_distribution, [0, 0, 1, 0, 0, 0, 1, 0, 0, 0])
+        self.assertEqual(stats.mean_score, 5.0)
+
+    def test_rebuild_matches_deltas(self, mock_send):
+        from .community import rebuild_community_stats
+        drain()
+        by_delta = self.stats()
+        UserAnimeEntry.objects.filter(anime_id=1).update(score=10)  # Bypasses the outbox
+
+        rebuild_community_stats()
+
+        rebuilt = self.stats()
+        self.assertEqual((rebuilt.members, rebuilt.completed), (by_delta.members, by_delta.completed))
+        self.assertEqual((rebuilt.scored_count, rebuilt.mean_score), (3, 10.0))
+
+    def test_imports_and_rankings(self, mock_send):
+        from .community import top_on_mitsulist
+        from .tasks import bulk_upsert_entries
+        bulk_upsert_entries(self.users[0].id, [
+            {'anime_id': 2, 'title': 'Trigun', 'status': 'completed', 'score': 10, 'episodes_watched': 26},
+        ], ['status', 'score', 'episodes_watched'])
+        drain()
+
+        self.assertEqual([s.anime_id for s in top_on_mitsulist('members')], [1, 2])
+        self.assertEqual([s.anime_id for s in top_on_mitsulist(min_scored=1)], [2, 1])
+
+    def test_top_endpoint(self, mock_send):
+        from .models import AnimeMetadata
+        drain()
+        AnimeMetadata.objects.create(mal_id=1, title='Bebop')
+
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            data = self.client.get(reverse('api-top'), {'order': 'members'}).json()['data']
+
+        self.assertEqual([card['mal_id'] for card in data], [1])
+        self.assertEqual(data[0]['mitsulist'], {'members': 3, 'mean_score': 8.0, 'scored_count': 2})
+
+
+class SiteSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='critic', password='password123')
+        Review.objects.create(user=self.user, anime_id=1, content='An emotional finale')
+        Review.objects.create(user=self.user, anime_id=2, content='Нудний сюжет')
+        News.objects.create(title='Season preview', description='Winter lineup')
+
+    def test_search_finds_each_kind(self):
+        from .search import search_news, search_reviews, search_users
+
+        self.assertEqual([r.anime_id for r in search_reviews('finale')], [1])
+        self.assertEqual([r.anime_id for r in search_reviews('сюжет')], [2])
+        self.assertEqual([n.title for n in search_news('winter')], ['Season preview'])
+        self.assertEqual([u.username for u in search_users('critic')], ['critic'])
+
+    def test_benchmark_requires_postgres(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('benchmark_search', reviews=0)
+
+
+class LocalAnimeSearchTest(TransactionTestCase):
+    def setUp(self):
+        from .models import AnimeMetadata
+        self.client = AsyncClient()
+        rows = [
+            (1, 'Shingeki no Kyojin', 'Attack on Titan', ['AoT'], 'TV', 2013, [1, 8], 8.5),
+            (2, 'Shingeki no Kyojin Season 2', 'Attack on Titan Season 2', [], 'TV', 2017, [1, 8], 8.4),
+            (3, 'Kimi no Na wa.', 'Your Name.', [], 'Movie', 2016, [8, 22], 8.8),
+            (4, 'Ore no Titan', '', [], 'OVA', 2013, [4], 6.0),
+        ]
+        for mal_id, title, english, synonyms, media_type, year, genre_ids, score in rows:
+            AnimeMetadata.objects.create(
+                mal_id=mal_id, title=title, title_english=english, title_synonyms=synonyms,
+                media_type=media_type, year=year, genre_ids=genre_ids, score=score,
+            )
+
+    def test_alternative_titles_and_prefix_ranking(self):
+        from .search import search_anime
+
+        # "titan" starts the English titles of 1 and 2 but is mid-title in 4
+        self.assertEqual([a.mal_id for a in search_anime('Titan')], [1, 2, 4])
+        self.assertEqual([a.mal_id for a in search_anime('aot')], [1])
+        self.assertEqual([a.mal_id for a in search_anime('  YOUR   name')], [3])
+
+    def test_filters(self):
+        from .search import search_anime
+
+        self.assertEqual([a.mal_id for a in search_anime(genre_ids=[8], anime_type='movie')], [3])
+        self.assertEqual([a.mal_id for a in search_anime('titan', year=2013)], [1, 4])
+        self.assertEqual([a.mal_id for a in search_anime(genre_ids=[1, 8], limit=1)], [1])
+
+    @patch('app.views.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_falls_back_to_jikan_when_local_results_are_thin(self, mock_fetch_jikan):
+        mock_fetch_jikan.return_value = {'data': [{'mal_id': 99, 'title': 'Remote'}]}
+
+        with patch('app.search.LOCAL_MIN_RESULTS', 2):
+            response = await self.client.get('/api/typeahead/', {'q': 'shingeki'})
+            self.assertEqual([a['mal_id'] for a in response.json()['data']], [1, 2])
+            mock_fetch_jikan.assert_not_called()
+
+            response = await self.client.get('/api/search/', {'q': 'your name'})
+            self.assertEqual(response.json()['data'], [{'mal_id': 99, 'title': 'Remote'}])
+
+            mock_fetch_jikan.return_value = {'data': []}
+            response = await self.client.get('/api/search/', {'q': 'kimi'})
+            self.assertEqual([a['mal_id'] for a in response.json()['data']], [3])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'search-cache-tests'}})
+class SearchCacheTest(TransactionTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import AnimeMetadata
+        cache.clear()
+        self.client = AsyncClient()
+        self.user = User.objects.create_user(username='critic', password='password123')
+        Review.objects.create(user=self.user, anime_id=1, content='An emotional finale')
+        for mal_id in (1, 2):
+            AnimeMetadata.objects.create(mal_id=mal_id, title=f'Naruto {mal_id}', media_type='TV', genre_ids=[1, 4])
+
+    def test_equivalent_requests_share_a_key(self):
+        from .search import search_cache_key, search_params
+
+        a = search_params('  Naruto   Shippuden', genres='4,1,4', year='2007', anime_type='TV')
+        b = search_params('naruto shippuden', genres='1,4', year=2007, anime_type='tv')
+        self.assertEqual(a, {'q': 'naruto shippuden', 'genres': '1,4', 'year': 2007, 'type': 'tv'})
+        self.assertEqual(search_cache_key('anime', a, limit=20), search_cache_key('anime', b, limit=20))
+        self.assertNotEqual(search_cache_key('anime', a, limit=20), search_cache_key('anime', a, limit=8))
+        self.assertLessEqual(len(search_cache_key('anime', search_params('x' * 5000))), 60)
+        self.assertEqual(search_params('', genres='action', anime_type='bogus'), {})
+
+    def test_jikan_year_filter_is_the_local_one(self):
+        from urllib.parse import parse_qs, urlsplit
+        from .search import jikan_search_url, search_params
+
+        query = parse_qs(urlsplit(jikan_search_url(search_params('', year='2013'), 20)).query)
+        self.assertEqual((query['start_date'], query['end_date']), (['2013-01-01'], ['2013-12-31']))
+
+    @patch('app.views.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_cached_ids_are_hydrated_and_counted(self, mock_fetch_jikan):
+        from .search import search_metrics
+
+        with patch('app.search.LOCAL_MIN_RESULTS', 2):
+            first = await self.client.get('/api/search/', {'q': 'Naruto', 'genres': '4,1'})
+            second = await self.client.get('/api/search/', {'q': ' NARUTO ', 'genres': '1,4'})
+        self.assertEqual([a['mal_id'] for a in first.json()['data']], [1, 2])
+        self.assertEqual(second.json()['data'], first.json()['data'])
+        mock_fetch_jikan.assert_not_called()
+
+        mock_fetch_jikan.return_value = {'data': []}
+        for query in ('Finale', 'finale'):
+            response = await self.client.get('/search/global/', {'q': query})
+            self.assertEqual([r.anime_id for r in response.context['reviews']], [1])
+
+        metrics = search_metrics()
+        self.assertEqual(metrics['anime:q+genres'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual(metrics['site:q'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+
+class WeeklyScheduleTest(TransactionTestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        self.user = User.objects.create_user(username='viewer', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=2, title='Late Show', status='watching')
+
+    def schedule_day(self, day):
+        broadcasts = {
+            # Monday 01:00 in Tokyo is still Sunday in UTC
+            'monday': [{'mal_id': 1, 'title': 'Early Show', 'broadcast': {'time': '01:00', 'timezone': 'Asia/Tokyo'}}],
+            'tuesday': [
+                {'mal_id': 2, 'title': 'Late Show', 'broadcast': {'time': '23:30', 'timezone': 'Asia/Tokyo'}},
+                {'mal_id': 3, 'title': 'Unknown Time', 'broadcast': {'time': None}},
+            ],
+        }
+        return {'data': broadcasts.get(day, [{'mal_id': sum(map(ord, day)), 'title': day}])}
+
+    @patch('app.schedule.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_week_is_bucketed_per_offset(self, mock_fetch_jikan):
+        from asgiref.sync import sync_to_async
+        from .schedule import build_weekly_schedule, store_weekly_schedule, week_for_offset
+
+        mock_fetch_jikan.side_effect = lambda key, url, timeout: self.schedule_day(url.rsplit('=', 1)[1])
+        document = await build_weekly_schedule()
+        await sync_to_async(store_weekly_schedule)(document)
+
+        def titles(offset, day):
+            return [(a['title'], a['time']) for d, anime in week_for_offset(document, offset) if d == day for a in anime]
+
+        self.assertEqual(titles(0, 'sunday'), [('Early Show', '16:00'), ('sunday', None)])
+        self.assertEqual(titles(540, 'monday'), [('Early Show', '01:00')])
+        self.assertEqual(titles(540, 'tuesday'), [('Late Show', '23:30'), ('Unknown Time', None)])
+        self.assertEqual(titles(-300, 'tuesday'), [('Late Show', '09:30'), ('Unknown Time', None)])
+
+        await self.client.aforce_login(self.user)
+        self.client.cookies['tz'] = 'Asia/Tokyo'
+        response = await self.client.get(reverse('calendar'))
+        self.assertEqual(response.context['watching_ids'], {2})
+        self.assertEqual(response.context['utc_offset'], '+0900')
+        self.assertContains(response, '23:30')
+
+    @patch('app.schedule.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_partial_fetch_keeps_previous_week(self, mock_fetch_jikan):
+        from .schedule import build_weekly_schedule
+
+        mock_fetch_jikan.side_effect = lambda key, url, timeout: {'data': []} if url.endswith('friday') else {'data': [{'mal_id': 1}]}
+        self.assertIsNone(await build_weekly_schedule())
+
+
+class AsyncOrmViewsTest(TransactionTestCase):
+    def setUp(self):
+        from users.models import CustomList
+        self.client = AsyncClient()
+        self.user = User.objects.create_user(username='viewer', password='password123')
+        self.friend = User.objects.create_user(username='friend', password='password123')
+        Follow.objects.create(user=self.user, following=self.friend)
+        entry = UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Test Anime', status='watching')
+        CustomList.objects.create(user=self.user, name='Favourites').entries.add(entry)
+        Review.objects.create(user=self.user, anime_id=1, content='Mine')
+        for i in range(25):
+            Activity.objects.create(user=self.friend, activity_type='status_update', anime_id=i, anime_title=f'Show {i}')
+        Notification.objects.create(recipient=self.user, notification_type='system', message='Hello')
+
+    @patch('app.views.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_anime_detail_rows(self, mock_fetch_jikan):
+        mock_fetch_jikan.return_value = {'data': {'mal_id': 1, 'title': 'Test Anime', 'type': 'TV', 'status': 'Airing'}}
+        await self.client.aforce_login(self.user)
+
+        response = await self.client.get(reverse('anime-view', args=[1]))
+
+        self.assertEqual(response.context['user_review'].content, 'Mine')
+        self.assertEqual([r.content for r in response.context['reviews']], ['Mine'])
+        custom_lists = response.context['user_custom_lists']
+        self.assertEqual([(c.name, len(c.current_anime)) for c in custom_lists], [('Favourites', 1)])
+
+        mock_fetch_jikan.return_value = {'data': None}
+        response = await self.client.get(reverse('anime-view', args=[2]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_feeds_and_notifications(self):
+        await self.client.aforce_login(self.user)
+
+        response = await self.client.get(reverse('activity-feed'), {'page': 2})
+        page_obj = response.context['page_obj']
+        self.assertEqual((page_obj.number, page_obj.paginator.count, len(page_obj.object_list)), (2, 25, 5))
+        response = await self.client.get(reverse('global-feed'))
+        self.assertEqual(len(response.context['page_obj'].object_list), 20)
+
+        self.assertEqual((await self.client.get(reverse('api-notifications-unread'))).json(), {'unread': 1})
+        response = await self.client.get(reverse('notifications'))
+        self.assertEqual([n.message for n in response.context['notifications']], ['Hello'])
+        self.assertEqual((await self.client.get(reverse('api-notifications-unread'))).json(), {'unread': 0})
+
+
+class QueryBudgetTest(TestCase):
+    """Every route in query_budgets, requested against a fixture with several rows per relation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from chat.models import ChatMessage, ChatThread
+        from clubs.models import Club, ClubMessage, ClubRecommendation
+        from users.models import Badge, CustomList, ImportJob, Profile, SavedSearch, TasteProfile, UserBadge
+        from .models import AnimeMetadata, AnimeSchedule, ReviewComment, WatchParty
+        from .schedule import build_schedule_document
+
+        cls.viewer = User.objects.create_user(username='viewer', password='password123')
+        others = [User.objects.create_user(username=f'user{i}', password='password123') for i in range(3)]
+        cls.other = others[0]
+        Profile.objects.filter(user=cls.other).update(discord_id='42')
+        TasteProfile.objects.create(user=cls.viewer, similar_users=[[u.id, 50] for u in others])
+        for user in others:
+            Follow.objects.create(user=cls.viewer, following=user)
+            Follow.objects.create(user=user, following=cls.viewer)
+        for user in [cls.viewer, *others]:
+            for anime_id in range(1, 4):
+                UserAnimeEntry.objects.create(
+                    user=user, anime_id=anime_id, title=f'Show {anime_id}', status='watching', score=anime_id, episodes_watched=2,
+                )
+                Activity.objects.create(user=user, activity_type='status_update', anime_id=anime_id, anime_title=f'Show {anime_id}')
+        for anime_id in range(1, 4):
+            AnimeMetadata.objects.create(mal_id=anime_id, title=f'Show {anime_id}', studios=['Studio'], genres=['Action'])
+        custom_list = CustomList.objects.create(user=cls.viewer, name='Favourites')
+        custom_list.entries.set(UserAnimeEntry.objects.filter(user=cls.viewer))
+        cls.custom_list = custom_list
+        for i in range(3):
+            News.objects.create(title=f'News {i}', image='news_images/news.jpg', description='Text')
+            Notification.objects.create(recipient=cls.viewer, sender=others[i], notification_type='system', message=f'Hello {i}')
+            badge = Badge.objects.create(name=f'Badge {i}', description='', icon='fa-star', category='anime_count')
+            UserBadge.objects.create(user=cls.viewer, badge=badge)
+        cls.badge = badge
+
+        cls.reviews = [Review.objects.create(user=user, anime_id=1, content=f'Review by {user}') for user in others]
+        for review in cls.reviews:
+            for user in others:
+                ReviewLike.objects.create(user=user, review=review)
+                ReviewComment.objects.create(user=user, review=review, content='Agreed')
+        cls.own_review = Review.objects.create(user=cls.viewer, anime_id=2, content='Mine')
+        cls.own_comment = ReviewComment.objects.create(user=cls.viewer, review=cls.reviews[0], content='Mine too')
+
+        cls.thread = ChatThread.objects.create(user1=cls.viewer, user2=cls.other)
+        for sender in [cls.viewer, *others[:1]] * 3:
+            ChatMessage.objects.create(thread=cls.thread, sender=sender, text='Hi')
+        for i in range(3):
+            club = Club.objects.create(name=f'Club {i}', owner=others[i], cover_image='')
+            club.members.add(*others)
+            for user in others:
+                ClubMessage.objects.create(club=club, sender=user, text='Hi')
+                ClubRecommendation.objects.create(club=club, suggester=user, anime_id=user.id, anime_title='Show')
+        cls.club = club
+        club.members.add(cls.viewer)
+
+        cls.import_job = ImportJob.objects.create(user=cls.viewer, source='mal_username', mal_username='viewer')
+        SavedSearch.objects.create(user=cls.viewer, name='Saved', params={'q': 'show'})
+        WatchParty.objects.create(host=cls.viewer, room_code='PARTY1', video_url='https://example.com/video')
+        AnimeSchedule.objects.create(day='week', data=build_schedule_document([{'data': []}] * 7))
+
+    def setUp(self):
+        anime = {'mal_id': 1, 'title': 'Show 1', 'images': {'jpg': {}}}
+        # One anime for detail URLs, a list of them for everything else
+        jikan = AsyncMock(side_effect=lambda cache_key, url, *args, **kwargs: {
+            'data': anime if url.endswith('/full') else [anime]
+        })
+        for target, mock in [
+            ('app.views.fetch_jikan_data', jikan),
+            ('clubs.views.fetch_jikan_data', jikan),
+            ('app.services.fetch_anime_recommendations', AsyncMock(return_value={'data': []})),
+            ('app.services.schedule_recommendation_refresh', None),
+            ('app.tasks.build_wrapped_snapshot_task.delay', None),
+        ]:
+            patcher = patch(target, mock) if mock else patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def route_requests(self):
+        """{url name: (method, url args, data)}; 'json' posts the data as a JSON body."""
+        from django.contrib.auth.tokens import default_token_generator
+        from django.utils.encoding import force_bytes
+        from django.utils.http import urlsafe_base64_encode
+        from users.exporters import export_token
+
+        uid = urlsafe_base64_encode(force_bytes(self.viewer.pk))
+        token = default_token_generator.make_token(self.viewer)
+        review, thread, club = self.reviews[0], self.thread, self.club
+        return {
+            # app
+            'home': ('get', [], None),
+            'anime-view': ('get', [1], None),
+            'api-proxy': ('get', [], {'q': 'show'}),
+            'api-typeahead': ('get', [], {'q': 'show'}),
+            'api-top': ('get', [], {'order': 'members'}),
+            'api-genres': ('get', [], None),
+            'calendar': ('get', [], None),
+            'activity-feed': ('get', [], None),
+            'global-feed': ('get', [], None),
+            'notifications': ('get', [], None),
+            'api-notifications-unread': ('get', [], None),
+            'global_search': ('get', [], {'q': 'show'}),
+            'discover': ('get', [], None),
+            'wrapped_current': ('get', [], None),
+            'wrapped': ('get', [2025], None),
+            'create_party': ('post', [], {'video_url': 'https://example.com/video'}),
+            'party_room': ('get', ['PARTY1'], None),
+            # users
+            'profile': ('get', [], None),
+            'edit_profile': ('get', [], None),
+            'create_review': ('get', [], None),
+            'public_profile': ('get', [self.other.username], None),
+            'follow_user': ('get', [self.other.username], None),
+            'unfollow_user': ('get', [self.other.username], None),
+            'register': ('get', [], None),
+            'activate': ('get', [uid, token], None),
+            'login': ('get', [], None),
+            'logout': ('get', [], None),
+            'save-search': ('json', [], {'name': 'New', 'params': {'q': 'naruto'}}),
+            'saved-searches': ('get', [], None),
+            'update-status': ('json', [], {'anime_id': 1, 'status': 'completed', 'episodes_watched': 12}),
+            'batch-update-status': ('json', [], {'changes': [
+                {'anime_id': anime_id, 'status': 'completed'} for anime_id in range(1, 6)
+            ]}),
+            'import_list': ('get', [], None),
+            'import_job_status': ('get', [self.import_job.id], None),
+            'export_list': ('get', [], {'format': 'csv'}),
+            'download_export': ('get', [export_token(self.viewer.id, 'exports/missing.csv', 'list.csv')], None),
+            'get_user_anime_status': ('get', [1], None),
+            'get_user_anime_statuses': ('get', [], {'ids': '1,2,3,4'}),
+            'list_sync': ('get', [], None),
+            'anime_reviews_list': ('get', [1], None),
+            'toggle_review_like': ('post', [review.id], None),
+            'add_review_comment': ('post', [review.id], {'content': 'Nice'}),
+            'delete_review': ('get', [self.own_review.id], None),
+            'delete_review_comment': ('get', [self.own_comment.id], None),
+            'password_reset': ('get', [], None),
+            'password_reset_done': ('get', [], None),
+            'password_reset_confirm': ('get', [uid, token], None),
+            'password_reset_complete': ('get', [], None),
+            'discord_login': ('get', [], None),
+            'discord_callback': ('get', [], None),
+            'discord_disconnect': ('post', [], None),
+            'discord_presence_api': ('get', ['42'], None),
+            'toggle_theme': ('json', [], {'theme': 'light'}),
+            'leaderboard': ('get', [], None),
+            'toggle_pin_badge': ('post', [self.badge.id], None),
+            'quick_update_anime_episode': ('post', [1], None),
+            'htmx_add_to_plan': ('post', [3], None),
+            'create_custom_list': ('post', [], {'name': 'Later'}),
+            'custom_list_detail': ('get', [self.viewer.username, self.custom_list.id], None),
+            'toggle_custom_list_entry': ('post', [self.custom_list.id, 1], None),
+            # chat
+            'chat:inbox': ('get', [], None),
+            'chat:room': ('get', [thread.id], None),
+            'chat:start_chat': ('get', [self.other.username], None),
+            'chat:get_messages': ('get', [thread.id], None),
+            # clubs
+            'clubs:club_list': ('get', [], None),
+            'clubs:create_club': ('get', [], None),
+            'clubs:club_detail': ('get', [club.pk], None),
+            'clubs:join_club': ('get', [club.pk], None),
+            'clubs:leave_club': ('get', [club.pk], None),
+            'clubs:recommend_anime': ('post', [club.pk], {'anime_id': 5}),
+            'clubs:get_club_messages': ('get', [club.pk], None),
+        }
+
+    def request(self, method, path, data):
+        if method == 'json':
+            response = self.client.post(path, data, content_type='application/json')
+        else:
+            response = getattr(self.client, method)(path, data or {})
+        if response.streaming and response.is_async:
+            async def consume():
+                return [chunk async for chunk in response.streaming_content]
+            async_to_sync(consume)()
+        elif response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_every_route_has_a_budget(self):
+        from .query_budget import budgeted_routes, declared_budgets
+
+        self.assertEqual(sorted(budgeted_routes() - set(declared_budgets())), [])
+        self.assertEqual(sorted(set(declared_budgets()) - budgeted_routes()), [])
+        self.assertEqual(sorted(budgeted_routes() ^ set(self.route_requests())), [])
+
+    def test_routes_stay_within_budget(self):
+        from .query_budget import declared_budgets, query_budget
+
+        budgets = declared_budgets()
+        for name, (method, args, data) in self.route_requests().items():
+            with self.subTest(name), transaction.atomic():
+                self.client.force_login(self.viewer)
+                path = reverse(name, args=args)
+                with query_budget(budgets[name], label=name):
+                    response = self.request(method, path, data)
+                self.assertLess(response.status_code, 500)
+                transaction.set_rollback(True)
+
+    def test_repeated_query_shapes_are_flagged(self):
+        from django.db.models import Count
+        from .query_budget import QueryBudgetExceeded, query_budget
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'repeated 3 times'):
+            with query_budget(10):
+                [review.likes.count() for review in Review.objects.filter(anime_id=1)]
+        with query_budget(1):
+            reviews = Review.objects.filter(anime_id=1).annotate(likes_count=Count('likes'))
+            self.assertEqual([review.like_count for review in reviews], [3, 3, 3])
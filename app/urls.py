@@ -5,6 +5,8 @@ urlpatterns = [
     path("", views.index, name="home"),
     path("anime/<int:anime_id>/", views.anime_detail, name="anime-view"),
     path("api/search/", views.api_proxy_search, name="api-proxy"), # Changed to use query params
+    path("api/typeahead/", views.api_typeahead, name="api-typeahead"),
+    path("api/top/", views.api_top_mitsulist, name="api-top"),
     path("api/genres/", views.get_genres, name="api-genres"),
     path("calendar/", views.calendar_view, name="calendar"),
     path("feed/", views.activity_feed_view, name="activity-feed"),
@@ -17,4 +19,25 @@ urlpatterns = [
     path("wrapped/<int:year>/", views.wrapped_view, name="wrapped"),
     path("party/create/", views.create_party, name="create_party"),
     path("party/<str:room_code>/", views.party_room, name="party_room"),
-]
\ No newline at end of file
+]
+
+# Most SQL queries per request with caching off, checked by QueryBudgetTest (see app/query_budget.py)
+query_budgets = {
+    'home': 5,
+    'anime-view': 10,
+    'api-proxy': 1,
+    'api-typeahead': 1,
+    'api-top': 2,
+    'api-genres': 0,
+    'calendar': 5,
+    'activity-feed': 5,
+    'global-feed': 5,
+    'notifications': 5,
+    'api-notifications-unread': 4,
+    'global_search': 6,
+    'discover': 8,
+    'wrapped_current': 6,
+    'wrapped': 6,
+    'create_party': 3,
+    'party_room': 5,
+}
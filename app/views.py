@@ -4,11 +4,14 @@ import asyncio
 from datetime import datetime
 import math
 import time
+import urllib.parse
 from django.core.cache import cache
+from django.db.models import Count
 from django_ratelimit.decorators import ratelimit
 from .services import fetch_jikan_data, JIKAN_API_ENDPOINTS
+from .async_helpers import paginate, prefetch_user_profile
 
-from .models import News, Review, Activity
+from .models import News, Review, Activity, AnimeCommunityStats
 from users.models import UserAnimeEntry
 from .forms import ReviewForm
 import random
@@ -21,42 +24,35 @@ async def get_jikan_data(cache_key, url, timeout=300):
     return await fetch_jikan_data(cache_key, url, timeout)
 
 
-async def _prefetch_user_profile(request):
-    """
-    Resolve the async user AND pre-warm the related Profile in the ORM
-    field cache. This prevents SynchronousOnlyOperation when the template
-    accesses user.profile inside an async view.
-    """
-    from asgiref.sync import sync_to_async
-    from django.contrib.auth import aget_user
-    
-    # Properly resolve the user asynchronously without triggering lazy evaluation
-    request.user = await aget_user(request)
+async def _home_news():
+    news_items = cache.get('home_news')
+    if news_items is None:
+        news_items = [item async for item in News.objects.order_by('-created_at')[:5]]
+        cache.set('home_news', news_items, 3600)  # Кеш на 1 годину
+    return news_items
 
-    if request.user.is_authenticated:
-        # Accessing user.profile runs a sync ORM query; wrapping it with
-        # sync_to_async executes it in a thread and caches the result on
-        # the user instance so subsequent template lookups are free.
-        def _get_profile():
-            try:
-                return request.user.profile
-            except Exception: # RelatedObjectDoesNotExist
-                return None
-        await sync_to_async(_get_profile)()
-    return request.user
+
+async def _home_activity_feed(user):
+    from .services import get_activity_feed
+
+    if not user.is_authenticated:
+        return []
+    feed_cache_key = f'activity_feed_{user.id}'
+    activity_feed = cache.get(feed_cache_key)
+    if activity_feed is None:
+        activity_feed = await get_activity_feed(user)
+        cache.set(feed_cache_key, activity_feed, 120)  # Кеш на 2 хвилини
+    return activity_feed
 
 
 async def index(request):
-    await _prefetch_user_profile(request)
-    # Fetch News (Database - synchronous for now, Django handles it)
+    await prefetch_user_profile(request)
     from asgiref.sync import sync_to_async
-    news_items = cache.get('home_news')
-    if news_items is None:
-        news_items = await sync_to_async(list)(News.objects.all().order_by('-created_at')[:5])
-        cache.set('home_news', news_items, 3600)  # Кеш на 1 годину
 
-    # Fetch API Data using new async helper
-    airing_now_data, top_anime_data, popular_anime_data, anime_movie = await asyncio.gather(
+    # News, the user's feed and the API data are independent; fetch them together
+    news_items, activity_feed, airing_now_data, top_anime_data, popular_anime_data, anime_movie = await asyncio.gather(
+        _home_news(),
+        _home_activity_feed(request.user),
         fetch_jikan_data('airing_now', JIKAN_API_ENDPOINTS['airing_now']),
         fetch_jikan_data('top_anime', JIKAN_API_ENDPOINTS['top_anime']),
         fetch_jikan_data('popular_anime', JIKAN_API_ENDPOINTS['popular_anime']),
@@ -75,40 +71,18 @@ async def index(request):
     # Title translation disabled - anime names should stay in original language
     # (Literal translation looks bad for proper nouns)
     # Translation is still available for status, synopsis, etc. on detail pages
-    recommendations_data = None
+    recommendations = None
     source_anime_title = None
     
     if request.user.is_authenticated:
-        # Get user's completed or watching anime
-        user_entries = await sync_to_async(list)(
-            UserAnimeEntry.objects.filter(
-                user=request.user, 
-                status__in=['completed', 'watching']
-            ).values('anime_id', 'title')
-        )
-        
-        if user_entries:
-            # Pick a random one for variety
-            random_entry = random.choice(user_entries)
-            source_id = random_entry['anime_id']
-            source_anime_title = random_entry['title']
-            
-            # Fetch recommendations
-            from .services import fetch_anime_recommendations
-            rec_key = f'rec_{source_id}'
-            recommendations_data = await fetch_anime_recommendations(rec_key, source_id)
-            
-        # Activity Feed (Social)
-        from .services import get_activity_feed
-        # Wrap sync DB call and Cache
-        feed_cache_key = f'activity_feed_{request.user.id}'
-        activity_feed = cache.get(feed_cache_key)
-        if activity_feed is None:
-            get_feed_async = sync_to_async(get_activity_feed)
-            activity_feed = await get_feed_async(request.user)
-            cache.set(feed_cache_key, activity_feed, 120)  # Кеш на 2 хвилини
-    else:
-        activity_feed = []
+        # Materialized by refresh_user_recommendations_task; a miss just queues a build
+        from .services import recommendations_cache_key, expand_recommendations, schedule_recommendation_refresh
+        cached_recommendations = cache.get(recommendations_cache_key(request.user.id))
+        if cached_recommendations is None:
+            await sync_to_async(schedule_recommendation_refresh)([request.user.id], countdown=0)
+        elif cached_recommendations['items'] and not cached_recommendations['fallback']:
+            recommendations = expand_recommendations(cached_recommendations)
+            source_anime_title = cached_recommendations['items'][0][3][0]
         
     context = {
         'news_items': news_items,
@@ -116,20 +90,66 @@ async def index(request):
         'top_anime_data': top_anime_data,
         'popular_anime_data': popular_anime_data,
         'anime_movie': anime_movie,
-        'recommendations_data': recommendations_data,
+        'recommendations': recommendations,
         'source_anime_title': source_anime_title,
         'activity_feed': activity_feed,
     }
     return render(request, 'index.html', context)
 
+async def _anime_reviews(anime_id):
+    review_cache_key = f'anime_reviews_{anime_id}'
+    reviews = cache.get(review_cache_key)
+    if reviews is None:
+        # The page shows only the like and comment counts, so count instead of prefetching the rows
+        reviews = [
+            review async for review in Review.objects.filter(anime_id=anime_id).order_by('-created_at')
+            .select_related('user', 'user__profile')
+            .annotate(likes_count=Count('likes', distinct=True), comments_count=Count('comments', distinct=True))
+        ]
+        cache.set(review_cache_key, reviews, 300)  # Кеш на 5 хвилин
+    return reviews
+
+
+async def _anime_detail_rows(user, anime_id):
+    """
+    (reviews, community summary, user's review, user's custom lists, friends
+    watching) for anime_detail. The queries run one after another: the async
+    ORM sends each to the one sync thread anyway, and gathering them only
+    queues them together ahead of other requests' work.
+    """
+    from asgiref.sync import sync_to_async
+    from django.db.models import Prefetch
+    from users.models import CustomList
+    from users.social import friends_watching
+    from .community import community_summary
+
+    reviews = await _anime_reviews(anime_id)
+    # MitsuList's own numbers, one indexed row maintained from the lists
+    stats = await AnimeCommunityStats.objects.filter(anime_id=anime_id).afirst()
+    if not user.is_authenticated:
+        return reviews, community_summary(stats), None, [], None
+
+    user_review = await Review.objects.filter(user_id=user.id, anime_id=anime_id).afirst()
+    user_custom_lists = [
+        custom_list async for custom_list in CustomList.objects.filter(user_id=user.id).prefetch_related(
+            Prefetch('entries', queryset=UserAnimeEntry.objects.filter(anime_id=anime_id), to_attr='current_anime')
+        )
+    ]
+    friends = await sync_to_async(friends_watching)(user.id, anime_id)
+    return reviews, community_summary(stats), user_review, user_custom_lists, friends
+
+
 async def anime_detail(request, anime_id):
     # Fix for SynchronousOnlyOperation in template
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
+    # The page's own rows don't need the API data; load them while it is fetched
+    rows = asyncio.ensure_future(_anime_detail_rows(request.user, anime_id))
     cache_key = f'anime_detail_{anime_id}'
     raw_data = await fetch_jikan_data(cache_key, f"{JIKAN_API_ENDPOINTS['anime_base']}/{anime_id}/full", timeout=600)
     
     anime_data = raw_data.get('data')
     if not anime_data or not isinstance(anime_data, dict):
+        rows.cancel()
         return render(request, '404.html', status=404)
 
     # Data extraction
@@ -153,49 +173,17 @@ async def anime_detail(request, anime_id):
     from .translation import translate_anime_data
     from asgiref.sync import sync_to_async
     
-    # Wrap sync translation logic
-    translate_data_async = sync_to_async(translate_anime_data)
-    anime_data = await translate_data_async(anime_data, get_language())
+    reviews, community, user_review, user_custom_lists, friends = await rows
+    # Wrap sync translation logic (cache table + HTTP); it queues on the same
+    # sync thread as the rows, so it runs after them rather than alongside
+    anime_data = await sync_to_async(translate_anime_data)(anime_data, get_language())
+    review_form = None
     
     # Update local variables from translated data
     status = anime_data.get('status')
     media_type = anime_data.get('type')
     source = anime_data.get('source')
 
-    # Review Logic
-    from asgiref.sync import sync_to_async
-    
-    review_cache_key = f'anime_reviews_{anime_id}'
-    reviews = cache.get(review_cache_key)
-    if reviews is None:
-        get_reviews = sync_to_async(lambda: list(Review.objects.filter(anime_id=anime_id).order_by('-created_at').select_related('user', 'user__profile').prefetch_related('likes', 'comments', 'comments__user', 'comments__user__profile')))
-        reviews = await get_reviews()
-        cache.set(review_cache_key, reviews, 300)  # Кеш на 5 хвилин
-    
-    user_review = None
-    review_form = None
-
-    user_custom_lists = []
-    if request.user.is_authenticated:
-        # Check if user already reviewed
-        get_existing_review = sync_to_async(lambda: Review.objects.filter(user=request.user, anime_id=anime_id).first())
-        existing_review = await get_existing_review()
-        
-        if existing_review:
-            user_review = existing_review
-            
-        # Get custom lists for dropdown
-        from django.db.models import Prefetch
-        from users.models import CustomList, UserAnimeEntry
-        
-        @sync_to_async
-        def get_user_lists():
-            return list(CustomList.objects.filter(user=request.user).prefetch_related(
-                Prefetch('entries', queryset=UserAnimeEntry.objects.filter(anime_id=anime_id), to_attr='current_anime')
-            ))
-            
-        user_custom_lists = await get_user_lists()
-
     context = {
         'anime_data': anime_data,
         'relation_length': len(relations),
@@ -210,14 +198,49 @@ async def anime_detail(request, anime_id):
         'review_form': review_form,
         'user_review': user_review,
         'user_custom_lists': user_custom_lists,
+        'community': community,
+        'friends_watching': friends,
     }
     return render(request, 'anime-view.html', context)
 
+async def _search_anime(search_query, genres, year, anime_type, limit):
+    """
+    Local title index first; Jikan only when it has fewer than LOCAL_MIN_RESULTS
+    matches. Result ids are cached per canonical request (see app/search.py).
+    """
+    from asgiref.sync import sync_to_async
+    from . import search
+
+    params = search.search_params(search_query, genres, year, anime_type)
+    cache_key = search.search_cache_key('anime', params, limit=limit)
+    cached_ids = cache.get(cache_key)
+    if cached_ids is not None:
+        cards = await sync_to_async(search.anime_cards)(cached_ids)
+        # A Jikan result whose metadata hasn't been stored yet counts as a miss
+        if len(cards) == len(cached_ids):
+            search.record_lookup('anime', params, hit=True)
+            return {'data': cards}
+    search.record_lookup('anime', params, hit=False)
+
+    local = await sync_to_async(search.search_canonical)(params, limit=limit)
+    if len(local) >= min(search.LOCAL_MIN_RESULTS, limit):
+        cache.set(cache_key, [item.mal_id for item in local], search.SEARCH_CACHE_TTL)
+        return {'data': [search.anime_card(item) for item in local], 'source': 'local'}
+
+    url = search.jikan_search_url(params, limit)
+    data = await fetch_jikan_data(search.search_cache_key('jikan', params, limit=limit), url, timeout=60)
+    if data.get('data'):
+        cache.set(cache_key, [item['mal_id'] for item in data['data']], search.SEARCH_CACHE_TTL)
+    elif local:
+        # Jikan is down or found nothing: the thin local results beat an empty page
+        return {'data': [search.anime_card(item) for item in local], 'source': 'local'}
+    return data
+
 async def api_proxy_search(request):
     from django.http import JsonResponse
     
     # Extract optional filters from query parameters
-    search_query = request.GET.get('q', '')
+    search_query = request.GET.get('q', '').strip()
     genres = request.GET.get('genres')
     year = request.GET.get('year')
     anime_type = request.GET.get('type') # 'tv', 'movie', etc.
@@ -225,18 +248,47 @@ async def api_proxy_search(request):
     if not search_query and not genres and not year and not anime_type:
         return JsonResponse({'data': []})
 
-    # Build Jikan Search URL
-    base_url = f"{JIKAN_API_ENDPOINTS['anime_base']}?q={search_query}&limit=20"
-    
-    if genres:
-        base_url += f'&genres={genres}'
-    if year:
-        base_url += f'&start_date={year}-01-01'
-    if anime_type:
-        base_url += f'&type={anime_type}'
-    
-    cache_key = f'search_advanced_{search_query.lower()}_{genres}_{year}_{anime_type}'
-    data = await fetch_jikan_data(cache_key, base_url, timeout=60)
+    data = await _search_anime(search_query, genres, year, anime_type, limit=20)
+    return JsonResponse(data)
+
+TYPEAHEAD_MIN_LENGTH = 2
+
+async def api_typeahead(request):
+    """Title suggestions while typing, in the same shape as /api/search/."""
+    from django.http import JsonResponse
+
+    search_query = request.GET.get('q', '').strip()
+    if len(search_query) < TYPEAHEAD_MIN_LENGTH:
+        return JsonResponse({'data': []})
+    data = await _search_anime(
+        search_query, request.GET.get('genres'), request.GET.get('year'), request.GET.get('type'), limit=8,
+    )
+    return JsonResponse(data)
+
+TOP_ON_MITSULIST_LIMIT = 20
+
+async def api_top_mitsulist(request):
+    """
+    MitsuList's own rankings from the community stats, by mean score or by
+    members (`?order=members`), as anime cards in the shape of /api/search/
+    plus the local numbers. Titles not in AnimeMetadata yet are left out.
+    """
+    from asgiref.sync import sync_to_async
+    from django.http import JsonResponse
+    from . import search
+    from .community import top_on_mitsulist
+
+    order = 'members' if request.GET.get('order') == 'members' else 'score'
+    cache_key = f'top_on_mitsulist_{order}'
+    data = cache.get(cache_key)
+    if data is None:
+        stats = {row.anime_id: row async for row in top_on_mitsulist(order, limit=TOP_ON_MITSULIST_LIMIT)}
+        cards = await sync_to_async(search.anime_cards)(list(stats))
+        for card in cards:
+            row = stats[card['mal_id']]
+            card['mitsulist'] = {'members': row.members, 'mean_score': row.mean_score, 'scored_count': row.scored_count}
+        data = {'data': cards}
+        cache.set(cache_key, data, 600)  # Кеш на 10 хвилин
     return JsonResponse(data)
 
 async def get_genres(request):
@@ -247,80 +299,54 @@ async def get_genres(request):
 
 async def calendar_view(request):
     """
-    Display anime release calendar.
+    Display anime release calendar, in the viewer's time zone.
     """
     # Fix for SynchronousOnlyOperation
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     
-    from .services import get_daily_schedule
+    import zoneinfo
+    from django.utils import timezone
+    from .schedule import get_weekly_schedule, week_for_offset
     
-    days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    
-    # Fetch schedule for each day in parallel
-    # Now using get_daily_schedule which handles DB caching
-    tasks = [get_daily_schedule(day) for day in days]
-    day_results = await asyncio.gather(*tasks)
+    # The calendar page stores the browser's zone in this cookie
+    try:
+        viewer_zone = zoneinfo.ZoneInfo(request.COOKIES.get('tz') or 'UTC')
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        viewer_zone = zoneinfo.ZoneInfo('UTC')
+    now = timezone.now().astimezone(viewer_zone)
+    offset = int(now.utcoffset().total_seconds()) // 60
     
-    today = datetime.datetime.now().strftime('%A').lower()
+    document = await get_weekly_schedule() or {'ids': [], 'views': {'0': [[] for _ in range(7)]}, 'anime': []}
     
-    # Highlight User's Anime
+    # Highlight User's Anime: their watching ids that are on the schedule
     user_watching_ids = set()
     if request.user.is_authenticated:
-        from asgiref.sync import sync_to_async
-        get_ids = sync_to_async(lambda: list(
-            UserAnimeEntry.objects.filter(
-                user=request.user, 
-                status='watching'
-            ).values_list('anime_id', flat=True)
-        ))
-        user_watching_ids = set(await get_ids())
-
-    calendar_data = [] # List of (day_name, anime_list) tuples
-    for i, day in enumerate(days):
-        anime_list = day_results[i].get('data', [])
-        
-        # Mark anime as 'following'
-        for anime in anime_list:
-             if anime.get('mal_id') in user_watching_ids:
-                anime['is_following'] = True
-                
-        calendar_data.append((day, anime_list))
+        watching = UserAnimeEntry.objects.filter(user_id=request.user.id, status='watching').values_list('anime_id', flat=True)
+        user_watching_ids = {anime_id async for anime_id in watching} & set(document['ids'])
                 
     context = {
-        'calendar_data': calendar_data,
-        'today': today
+        'calendar_data': week_for_offset(document, offset),
+        'watching_ids': user_watching_ids,
+        'today': now.strftime('%A').lower(),
+        'timezone_name': viewer_zone.key,
+        'utc_offset': now.strftime('%z'),
     }
     return render(request, 'calendar.html', context)
 
 async def activity_feed_view(request):
     """Feed of people you follow."""
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     if not request.user.is_authenticated:
         from django.shortcuts import redirect
         return redirect('login')
 
-    from asgiref.sync import sync_to_async
-    from django.core.paginator import Paginator
-
-    # Fetch users we follow
-    # Note: user.following is related name from Follow model
-    def get_following_ids():
-        return list(request.user.following.values_list('following_id', flat=True))
-    
-    get_following = sync_to_async(get_following_ids)
-    following_ids = await get_following()
-
-    # Fetch activities
+    # Activities of users we follow; user.following is related name from Follow
+    # model, kept as a subquery
     from .models import Activity
+    following_ids = request.user.following.values('following_id')
     activities_qs = Activity.objects.filter(user_id__in=following_ids).select_related('user', 'user__profile')
     
-    # Pagination
-    def paginate(qs, page_num):
-        paginator = Paginator(qs, 20)
-        return paginator.get_page(page_num)
-
-    get_page = sync_to_async(paginate)
-    page_obj = await get_page(activities_qs, request.GET.get('page'))
+    page_obj = await paginate(activities_qs, request.GET.get('page'))
 
     context = {
         'page_obj': page_obj,
@@ -334,20 +360,12 @@ async def activity_feed_view(request):
 
 async def global_feed_view(request):
     """Feed of everyone."""
-    await _prefetch_user_profile(request)
-    from asgiref.sync import sync_to_async
-    from django.core.paginator import Paginator
+    await prefetch_user_profile(request)
 
     from .models import Activity
     activities_qs = Activity.objects.all().select_related('user', 'user__profile')
     
-    # Pagination
-    def paginate(qs, page_num):
-        paginator = Paginator(qs, 20)
-        return paginator.get_page(page_num)
-
-    get_page = sync_to_async(paginate)
-    page_obj = await get_page(activities_qs, request.GET.get('page'))
+    page_obj = await paginate(activities_qs, request.GET.get('page'))
 
     context = {
         'page_obj': page_obj,
@@ -361,28 +379,23 @@ async def global_feed_view(request):
 
 async def notifications_view(request):
     """View to list user notifications."""
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     if not request.user.is_authenticated:
         from django.shortcuts import redirect
         return redirect('login')
 
-    from asgiref.sync import sync_to_async
     from .models import Notification
 
     # Fetch all notifications for the user
-    get_notifications = sync_to_async(lambda: list(
+    notifications = [
+        notification async for notification in
         Notification.objects.filter(recipient=request.user).select_related('sender', 'sender__profile')
-    ))
-    notifications = await get_notifications()
+    ]
 
     # Mark them all as read when viewed? Or let the user click them?
     # Usually, viewing the drop down might not mark them, but visiting the page does.
     # Let's mark all as read automatically to keep it simple.
-    @sync_to_async
-    def mark_all_read():
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
-    
-    await mark_all_read()
+    await Notification.objects.filter(recipient=request.user, is_read=False).aupdate(is_read=True)
 
     context = {
         'notifications': notifications
@@ -391,60 +404,76 @@ async def notifications_view(request):
 
 async def check_unread_notifications(request):
     """AJAX endpoint to check unread notification count."""
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     from django.http import JsonResponse
     if not request.user.is_authenticated:
         return JsonResponse({'unread': 0})
         
-    from asgiref.sync import sync_to_async
     from .models import Notification
     
-    get_unread = sync_to_async(lambda: Notification.objects.filter(recipient=request.user, is_read=False).count())
-    count = await get_unread()
+    count = await Notification.objects.filter(recipient=request.user, is_read=False).acount()
     
     return JsonResponse({'unread': count})
 
 async def discovery_view(request):
     """View to display AI recommendations based on user's anime list."""
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     if not request.user.is_authenticated:
         from django.shortcuts import redirect
         return redirect('login')
         
-    from .services import get_yui_ai_recommendations
+    from .services import recommendations_cache_key, refresh_user_recommendations, expand_recommendations
     
-    ai_message, fallback_data, recommendations = await get_yui_ai_recommendations(request.user, limit=20)
-    
-    if fallback_data and not recommendations:
-        recommendations = [{'anime': item, 'context': 'Популярне зараз'} for item in fallback_data.get('data', [])]
+    # Single cache read; only the very first visit (or an expired entry) computes inline
+    payload = cache.get(recommendations_cache_key(request.user.id))
+    if payload is None:
+        payload = await refresh_user_recommendations(request.user, force=True)
         
     context = {
-        'ai_message': ai_message,
-        'recommendations': recommendations
+        'ai_message': payload['message'],
+        'recommendations': expand_recommendations(payload)
     }
     return render(request, 'discover.html', context)
 
+# Seconds a queued Wrapped rebuild suppresses further ones for the same user and year
+WRAPPED_REFRESH_DEBOUNCE = 300
+
 async def wrapped_view(request, year=None):
     """View to display MitsuList Wrapped (Year in Review) statistics."""
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     if not request.user.is_authenticated:
         from django.shortcuts import redirect
         return redirect('login')
         
-    from .services import generate_wrapped_data
-    from datetime import datetime
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+    from django.utils import timezone
+    from .models import WrappedSnapshot
+    from .services import save_wrapped_snapshot
+    from .tasks import build_wrapped_snapshot_task
     
     # Use current year if not provided
     if not year:
-        year = datetime.now().year
+        year = timezone.now().year
         
-    # Generate stats
-    stats = await generate_wrapped_data(request.user, year)
+    # Precomputed by precompute_wrapped_task; a first visit builds it from local
+    # metadata and lets the worker fill in genres we haven't cached yet
+    snapshot = await WrappedSnapshot.objects.filter(user=request.user, year=year).afirst()
+    if snapshot is None:
+        snapshot, missing = await sync_to_async(save_wrapped_snapshot)(request.user.id, year)
+        refresh = bool(missing)
+    else:
+        # The current year is still changing; serve the snapshot and refresh it behind the scenes
+        refresh = year == timezone.now().year and (timezone.now() - snapshot.updated_at).total_seconds() > settings.WRAPPED_SNAPSHOT_MAX_AGE
+    # One rebuild in flight per user and year, however often the page is reloaded meanwhile
+    if refresh and await cache.aadd(f'wrapped_pending_{request.user.id}_{year}', True, WRAPPED_REFRESH_DEBOUNCE):
+        await sync_to_async(build_wrapped_snapshot_task.delay)(request.user.id, year)
     
-    if not stats:
+    if snapshot is None:
         # User has no entries for this year
         return render(request, 'wrapped_empty.html', {'year': year})
         
+    stats = snapshot.stats
     context = {
         'year': year,
         'stats': stats,
@@ -463,12 +492,10 @@ async def global_search(request):
     """
     Advanced Global Search using PostgreSQL Full-Text Search and Jikan API.
     """
-    from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-    from django.contrib.auth.models import User
     from asgiref.sync import sync_to_async
-    import urllib.parse
+    from . import search
     
-    await _prefetch_user_profile(request)
+    await prefetch_user_profile(request)
     query = request.GET.get('q', '').strip()
     
     users = []
@@ -476,44 +503,31 @@ async def global_search(request):
     news = []
     anime_results = []
     
-    if query:
+    params = search.search_params(query)
+    if 'q' in params:
         @sync_to_async
         def do_db_search():
-            search_query = SearchQuery(query)
-            
-            # Users: Username (A weight) and Bio (B weight)
-            u_vector = SearchVector('username', weight='A') + SearchVector('profile__bio', weight='B')
-            found_users = list(User.objects.annotate(
-                rank=SearchRank(u_vector, search_query)
-            ).filter(rank__gte=0.01).select_related('profile').order_by('-rank')[:20])
-            
-            # Reviews: Content
-            r_vector = SearchVector('content')
-            found_reviews = list(Review.objects.annotate(
-                rank=SearchRank(r_vector, search_query)
-            ).filter(rank__gte=0.01).select_related('user', 'user__profile').order_by('-rank')[:20])
-            
-            # News: Title and Description
-            n_vector = SearchVector('title', weight='A') + SearchVector('description', weight='B')
-            found_news = list(News.objects.annotate(
-                rank=SearchRank(n_vector, search_query)
-            ).filter(rank__gte=0.01).order_by('-rank')[:10])
-            
-            return found_users, found_reviews, found_news
+            # Stored, GIN-indexed vectors on PostgreSQL (see app/search.py)
+            text = params['q']
+            return search.search_users(text), search.search_reviews(text), search.search_news(text)
             
-        # Execute DB Search with Caching
-        cache_key = f"global_search_db_{query}"
-        results = cache.get(cache_key)
-        if results is None:
+        # Execute DB Search with Caching; only ids are cached and hydrated in bulk
+        cache_key = search.search_cache_key('site', params)
+        cached_ids = cache.get(cache_key)
+        search.record_lookup('site', params, hit=cached_ids is not None)
+        if cached_ids is None:
             users, reviews, news = await do_db_search()
-            cache.set(cache_key, (users, reviews, news), 3600)  # Кеш на 1 годину
+            cache.set(cache_key, {
+                'users': [u.pk for u in users],
+                'reviews': [r.pk for r in reviews],
+                'news': [n.pk for n in news],
+            }, search.SEARCH_CACHE_TTL)
         else:
-            users, reviews, news = results
+            users, reviews, news = await sync_to_async(search.site_results)(cached_ids)
         
         # Execute Jikan API Search in parallel
-        encoded_query = urllib.parse.quote(query)
-        url = f"https://api.jikan.moe/v4/anime?q={encoded_query}&sfw=true&limit=12"
-        jikan_data = await fetch_jikan_data(f"search_global_{encoded_query}", url)
+        url = f"https://api.jikan.moe/v4/anime?{urllib.parse.urlencode({'q': params['q'], 'sfw': 'true', 'limit': 12})}"
+        jikan_data = await fetch_jikan_data(search.search_cache_key('jikan_global', params), url)
         if jikan_data and 'data' in jikan_data:
             anime_results = jikan_data['data']
 
@@ -528,6 +542,7 @@ async def global_search(request):
 
 import uuid
 from django.shortcuts import redirect, get_object_or_404
+from django.contrib.auth.decorators import login_required
 from .models import WatchParty
 
 @login_required
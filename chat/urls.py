@@ -9,3 +9,11 @@ urlpatterns = [
     path('start/<str:username>/', views.start_chat, name='start_chat'),
     path('api/<int:thread_id>/messages/', views.get_messages, name='get_messages'),
 ]
+
+# Most SQL queries per request with caching off, checked by QueryBudgetTest (see app/query_budget.py)
+query_budgets = {
+    'inbox': 6,
+    'room': 6,
+    'start_chat': 4,
+    'get_messages': 4,
+}
@@ -3,9 +3,11 @@ from django.contrib.auth.decorators import login_required
 from .models import ChatThread, ChatMessage
 from django.contrib.auth.models import User
 from django.http import JsonResponse
-from django.core.paginator import Paginator
 from django.db.models import Q
 
+# Messages shown when the room opens and per page of history before them
+MESSAGES_PER_PAGE = 50
+
 @login_required
 def inbox(request):
     """List all conversations for the current user."""
@@ -27,7 +29,7 @@ def room(request, thread_id):
     if request.user != thread.user1 and request.user != thread.user2:
         return redirect('chat:inbox')
         
-    messages = list(thread.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')[:50])
+    messages = list(thread.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')[:MESSAGES_PER_PAGE])
     messages.reverse()
     
     # Determine the other user
@@ -63,31 +65,36 @@ def start_chat(request, username):
 def get_messages(request, thread_id):
     """API endpoint to get paginated chat history."""
     thread = get_object_or_404(ChatThread, id=thread_id)
-    if request.user != thread.user1 and request.user != thread.user2:
+    if request.user.id not in (thread.user1_id, thread.user2_id):
         return JsonResponse({'error': 'Unauthorized'}, status=403)
         
     page_number = request.GET.get('page', 1)
     messages_query = thread.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')
-    paginator = Paginator(messages_query, 50)
-    
     try:
-        page_obj = paginator.page(page_number)
-    except Exception:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        return JsonResponse({'messages': [], 'has_next': False})
+    if page_number < 1:
         return JsonResponse({'messages': [], 'has_next': False})
+    # History only pages forward, so one extra row stands in for a COUNT
+    offset = (page_number - 1) * MESSAGES_PER_PAGE
+    messages_page = list(messages_query[offset:offset + MESSAGES_PER_PAGE + 1])
+    has_next = len(messages_page) > MESSAGES_PER_PAGE
+    messages_page = messages_page[:MESSAGES_PER_PAGE]
         
     messages_data = []
     # Reverse to keep chronological order within the prepended chunk
-    for msg in reversed(page_obj.object_list):
+    for msg in reversed(messages_page):
         # Escape text to prevent XSS is good, but template parsing handles it normally. Since JSON is used, we'll escape on frontend.
         messages_data.append({
             'text': msg.text,
             'timestamp': msg.timestamp.strftime("%H:%M"),
             'sender': msg.sender.username,
             'avatar_url': msg.sender.profile.avatar_url,
-            'is_sent': msg.sender == request.user
+            'is_sent': msg.sender_id == request.user.id
         })
         
     return JsonResponse({
         'messages': messages_data,
-        'has_next': page_obj.has_next()
+        'has_next': has_next
     })
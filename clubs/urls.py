@@ -12,3 +12,14 @@ urlpatterns = [
     path('<int:pk>/recommend/', views.recommend_anime, name='recommend_anime'),
     path('api/<int:pk>/messages/', views.get_club_messages, name='get_club_messages'),
 ]
+
+# Most SQL queries per request with caching off, checked by QueryBudgetTest (see app/query_budget.py)
+query_budgets = {
+    'club_list': 4,
+    'create_club': 3,
+    'club_detail': 8,
+    'join_club': 4,
+    'leave_club': 6,
+    'recommend_anime': 6,
+    'get_club_messages': 4,
+}
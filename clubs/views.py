@@ -1,13 +1,17 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import Club, ClubRecommendation
-from app.services import fetch_jikan_data
+from app.services import fetch_jikan_data, JIKAN_API_ENDPOINTS
 from django.http import JsonResponse
-from django.core.paginator import Paginator
+from django.db.models import Count
+
+# Messages shown when the room opens and per page of history before them
+MESSAGES_PER_PAGE = 50
 
 def club_list(request):
-    clubs = Club.objects.select_related('owner', 'owner__profile').prefetch_related('members').order_by('-created_at')
+    # The cards only show how many members a club has
+    clubs = Club.objects.annotate(members_count=Count('members')).order_by('-created_at')
     return render(request, 'clubs/club_list.html', {'clubs': clubs})
 
 @login_required
@@ -41,8 +45,9 @@ def create_club(request):
 def club_detail(request, pk):
     club = get_object_or_404(Club.objects.select_related('owner', 'owner__profile').prefetch_related('members', 'members__profile'), pk=pk)
     
-    messages_list = list(club.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')[:50])
+    messages_list = list(club.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')[:MESSAGES_PER_PAGE])
     messages_list.reverse()
+    # members are prefetched, so this reads the cache
     is_member = request.user.is_authenticated and request.user in club.members.all()
     
     recommendations = club.recommendations.all().select_related('suggester', 'suggester__profile')
@@ -75,9 +80,10 @@ def leave_club(request, pk):
     return redirect('clubs:club_detail', pk=pk)
 
 @login_required
-def recommend_anime(request, pk):
-    club = get_object_or_404(Club, pk=pk)
-    if request.user not in club.members.all():
+async def recommend_anime(request, pk):
+    user = await request.auser()
+    club = await aget_object_or_404(Club, pk=pk)
+    if not await club.members.filter(pk=user.pk).aexists():
         messages.error(request, "You must be a member to recommend anime.")
         return redirect('clubs:club_detail', pk=pk)
 
@@ -95,34 +101,32 @@ def recommend_anime(request, pk):
             messages.error(request, "Invalid Anime ID.")
             return redirect('clubs:club_detail', pk=pk)
 
-        if ClubRecommendation.objects.filter(club=club, suggester=request.user, anime_id=anime_id).exists():
+        if await ClubRecommendation.objects.filter(club=club, suggester=user, anime_id=anime_id).aexists():
             messages.error(request, "You have already recommended this anime to this club.")
             return redirect('clubs:club_detail', pk=pk)
 
-        # We must fetch the title and image from Jikan to store locally
-        url = f"https://api.jikan.moe/v4/anime/{anime_id}"
-        # We need to run sync code here or use httpx directly. We will use requests for simplicity since views are sync.
-        import requests
-        try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json().get('data', {})
-                title = data.get('title')
-                image_url = data.get('images', {}).get('jpg', {}).get('image_url')
-                
-                ClubRecommendation.objects.create(
-                    club=club,
-                    suggester=request.user,
-                    anime_id=anime_id,
-                    anime_title=title,
-                    anime_image_url=image_url,
-                    reason=reason
-                )
-                messages.success(request, f"Recommended {title} to the club!")
-            else:
-                messages.error(request, "Could not find anime via Jikan API.")
-        except Exception as e:
-            messages.error(request, "Failed to connect to Jikan API.")
+        # We must fetch the title and image from Jikan to store locally. Same
+        # request and cache entry as the anime page, so a title someone just
+        # viewed costs no API call.
+        raw_data = await fetch_jikan_data(
+            f'anime_detail_{anime_id}', f"{JIKAN_API_ENDPOINTS['anime_base']}/{anime_id}/full", timeout=600
+        )
+        data = raw_data.get('data')
+        if data and isinstance(data, dict):
+            title = data.get('title')
+            image_url = data.get('images', {}).get('jpg', {}).get('image_url')
+            
+            await ClubRecommendation.objects.acreate(
+                club=club,
+                suggester=user,
+                anime_id=anime_id,
+                anime_title=title,
+                anime_image_url=image_url,
+                reason=reason
+            )
+            messages.success(request, f"Recommended {title} to the club!")
+        else:
+            messages.error(request, "Could not find anime via Jikan API.")
 
     return redirect('clubs:club_detail', pk=pk)
 
@@ -132,24 +136,29 @@ def get_club_messages(request, pk):
     
     page_number = request.GET.get('page', 1)
     messages_query = club.messages.all().select_related('sender', 'sender__profile').order_by('-timestamp')
-    paginator = Paginator(messages_query, 50)
-    
     try:
-        page_obj = paginator.page(page_number)
-    except Exception:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        return JsonResponse({'messages': [], 'has_next': False})
+    if page_number < 1:
         return JsonResponse({'messages': [], 'has_next': False})
+    # History only pages forward, so one extra row stands in for a COUNT
+    offset = (page_number - 1) * MESSAGES_PER_PAGE
+    messages_page = list(messages_query[offset:offset + MESSAGES_PER_PAGE + 1])
+    has_next = len(messages_page) > MESSAGES_PER_PAGE
+    messages_page = messages_page[:MESSAGES_PER_PAGE]
         
     messages_data = []
-    for msg in reversed(page_obj.object_list):
+    for msg in reversed(messages_page):
         messages_data.append({
             'text': msg.text,
             'timestamp': msg.timestamp.strftime("%H:%M"),
             'sender': msg.sender.username,
             'avatar_url': msg.sender.profile.avatar_url,
-            'is_sent': request.user.is_authenticated and msg.sender == request.user
+            'is_sent': request.user.is_authenticated and msg.sender_id == request.user.id
         })
         
     return JsonResponse({
         'messages': messages_data,
-        'has_next': page_obj.has_next()
+        'has_next': has_next
     })
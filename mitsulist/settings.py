@@ -124,6 +124,8 @@ STATICFILES_DIRS = [BASE_DIR / "app/static"]
 # Media files (Uploaded by user)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# List imports and exports: only ever served through a permission-checking view, not under MEDIA_URL
+PRIVATE_MEDIA_ROOT = BASE_DIR / 'private_media'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # =============================================================================
@@ -137,6 +139,11 @@ if os.getenv('CLOUDINARY_URL'):
         "default": {
             "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
         },
+        # The default backend only accepts images; XML/CSV/gzip files go up as raw
+        # resources, shared by web and worker processes, under random names
+        "private": {
+            "BACKEND": "cloudinary_storage.storage.RawMediaCloudinaryStorage",
+        },
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
         },
@@ -147,6 +154,10 @@ else:
         "default": {
             "BACKEND": "django.core.files.storage.FileSystemStorage",
         },
+        "private": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": PRIVATE_MEDIA_ROOT, "base_url": None},
+        },
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
         },
@@ -333,6 +344,60 @@ DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID', '')
 DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET', '')
 DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'http://127.0.0.1:8000/users/discord/callback/')
 
+# =============================================================================
+# NOTIFICATIONS
+# =============================================================================
+# Unread likes/comments/follows on the same target within this window are folded
+# into a single "X and N others ..." notification
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv('NOTIFICATION_DIGEST_WINDOW', 6 * 3600))  # seconds
+# Minimum gap between websocket pushes to the same user
+NOTIFICATION_WS_MIN_INTERVAL = int(os.getenv('NOTIFICATION_WS_MIN_INTERVAL', 5))  # seconds
+
+# =============================================================================
+# LIST EXPORTS & SYNC
+# =============================================================================
+# Lists longer than this are exported by a Celery worker into storage instead
+# of being streamed in the request
+LIST_EXPORT_STREAM_LIMIT = int(os.getenv('LIST_EXPORT_STREAM_LIMIT', 5000))
+# How long the download link of a background export stays valid, in seconds
+LIST_EXPORT_LINK_MAX_AGE = int(os.getenv('LIST_EXPORT_LINK_MAX_AGE', 7 * 86400))
+# Delta sync API: changes per page, and how long deletions (and so cursors) are kept
+LIST_SYNC_PAGE_SIZE = int(os.getenv('LIST_SYNC_PAGE_SIZE', 500))
+LIST_SYNC_TOMBSTONE_DAYS = int(os.getenv('LIST_SYNC_TOMBSTONE_DAYS', 90))
+
+# =============================================================================
+# RECOMMENDATIONS
+# =============================================================================
+# Neighbours kept per anime in the item-item similarity table
+RECOMMENDER_TOP_K = int(os.getenv('RECOMMENDER_TOP_K', 50))
+# Minimum number of users who rated an anime before it gets neighbours
+RECOMMENDER_MIN_SUPPORT = int(os.getenv('RECOMMENDER_MIN_SUPPORT', 2))
+# Per-user recommendation results are cached this long...
+RECOMMENDATIONS_CACHE_TTL = int(os.getenv('RECOMMENDATIONS_CACHE_TTL', 24 * 3600))  # seconds
+# ...and refreshed this long after the first list change in a burst
+RECOMMENDATIONS_REFRESH_DELAY = int(os.getenv('RECOMMENDATIONS_REFRESH_DELAY', 60))  # seconds
+# "Users like you" kept per profile by the nightly taste batch
+TASTE_SIMILAR_USERS = int(os.getenv('TASTE_SIMILAR_USERS', 10))
+# Current-year Wrapped snapshots older than this are refreshed in the background
+WRAPPED_SNAPSHOT_MAX_AGE = int(os.getenv('WRAPPED_SNAPSHOT_MAX_AGE', 6 * 3600))  # seconds
+# Votes an anime needs before it ranks by mean score in "top on MitsuList"
+COMMUNITY_MIN_SCORED = int(os.getenv('COMMUNITY_MIN_SCORED', 3))
+# Anime search answers from the local title index when it finds at least this
+# many matches, and only asks Jikan otherwise
+LOCAL_SEARCH_MIN_RESULTS = int(os.getenv('LOCAL_SEARCH_MIN_RESULTS', 5))
+# Search results (as id lists) are cached this long per canonical query
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 900))  # seconds
+# Saved-search alerts: top results diffed per query, and Jikan requests allowed per hourly run
+SAVED_SEARCH_ALERT_DEPTH = int(os.getenv('SAVED_SEARCH_ALERT_DEPTH', 50))
+SAVED_SEARCH_JIKAN_BUDGET = int(os.getenv('SAVED_SEARCH_JIKAN_BUDGET', 30))
+
+# =============================================================================
+# REDIS DATA STRUCTURES
+# =============================================================================
+# Sorted sets for leaderboards etc. (app/redis_client.py). Empty disables them
+# and every reader falls back to SQL.
+REDIS_DATA_URL = os.getenv('REDIS_DATA_URL', '' if DEBUG else os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/3'))
+
 # =============================================================================
 # CELERY CONFIGURATION
 # =============================================================================
@@ -342,3 +407,50 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+from celery.schedules import crontab
+
+CELERY_BEAT_SCHEDULE = {
+    # Signal side effects are written to the outbox table and processed here
+    'drain-outbox': {
+        'task': 'app.tasks.drain_outbox_task',
+        'schedule': float(os.getenv('OUTBOX_DRAIN_INTERVAL', 2.0)),
+    },
+    'build-item-similarity': {
+        'task': 'app.tasks.build_item_similarity_task',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'build-similar-users': {
+        'task': 'users.tasks.build_similar_users_task',
+        'schedule': crontab(hour=4, minute=30),
+    },
+    'rollup-entry-events': {
+        'task': 'users.tasks.rollup_entry_events_task',
+        'schedule': crontab(minute=15),
+    },
+    'rebuild-community-stats': {
+        'task': 'app.tasks.rebuild_community_stats_task',
+        'schedule': crontab(hour=3, minute=45),
+    },
+    'purge-list-tombstones': {
+        'task': 'users.tasks.purge_list_tombstones_task',
+        'schedule': crontab(hour=4, minute=45),
+    },
+    'refresh-weekly-schedule': {
+        'task': 'app.tasks.refresh_weekly_schedule_task',
+        'schedule': crontab(minute=5, hour='*/6'),
+    },
+    'evaluate-saved-searches': {
+        'task': 'users.tasks.evaluate_saved_searches_task',
+        'schedule': crontab(minute=40),
+    },
+    'reconcile-leaderboards': {
+        'task': 'users.tasks.reconcile_leaderboards_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    # Wrapped for the whole active user base, ready before the December launch
+    'precompute-wrapped': {
+        'task': 'app.tasks.precompute_wrapped_task',
+        'schedule': crontab(hour=2, minute=0, day_of_month=1, month_of_year=12),
+    },
+}
@@ -19,3 +19,6 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     }
 }
+
+# No Redis in tests; leaderboards and friends fall back to SQL
+REDIS_DATA_URL = ''
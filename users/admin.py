@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, SavedSearch, UserAnimeEntry, Follow
+from .models import Profile, SavedSearch, UserAnimeEntry, Follow, ImportJob
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -22,3 +22,9 @@ class SavedSearchAdmin(admin.ModelAdmin):
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'following', 'created_at')
     search_fields = ('user__username', 'following__username')
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'source', 'status', 'processed', 'created_at')
+    list_filter = ('source', 'status')
+    search_fields = ('user__username',)
@@ -0,0 +1,111 @@
+"""
+Saved-search alerts.
+
+evaluate_saved_searches() runs from Celery beat. Saved searches are grouped by
+their canonical parameters (app.search.search_params), so each distinct query
+runs once however many users saved it: against the local catalogue, or against
+Jikan when the catalogue answers thinly and the run's JIKAN_BUDGET allows,
+most-subscribed queries first. Both sources are read newest first, so a title
+that just started airing lands in the top ALERT_DEPTH. The top ids are diffed against the query's
+SearchAlertState and the new ones go out as one outbox event per query, which
+notifies every subscriber in bulk. The first run of a query only records a
+baseline, and so does a run whose source differs from the previous one, since
+local and Jikan rankings aren't comparable.
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from app import outbox, search
+from app.services import fetch_jikan_data
+from .models import SavedSearch, SearchAlertState
+
+ALERT_DEPTH = getattr(settings, 'SAVED_SEARCH_ALERT_DEPTH', 50)
+JIKAN_BUDGET = getattr(settings, 'SAVED_SEARCH_JIKAN_BUDGET', 30)
+# Ids remembered per query, so a title dropping out of the top and back in doesn't alert twice
+SEEN_LIMIT = ALERT_DEPTH * 4
+
+
+def saved_search_groups():
+    """{canonical key: (params, [(saved search id, user id, name), ...])}, skipping empty searches."""
+    groups = {}
+    rows = SavedSearch.objects.values_list('id', 'user_id', 'name', 'params')
+    for pk, user_id, name, params in rows.iterator():
+        if not isinstance(params, dict):
+            continue
+        canonical = search.search_params(
+            params.get('q'), params.get('genres'), params.get('year'), params.get('type'),
+        )
+        if canonical:
+            key = search.search_cache_key('alert', canonical)
+            groups.setdefault(key, (canonical, []))[1].append((pk, user_id, name))
+    return groups
+
+
+async def _fetch_jikan(params_list):
+    # One request at a time: the budget is there to stay inside Jikan's rate limit
+    results = [
+        await fetch_jikan_data(
+            search.search_cache_key('jikan_alert', params),
+            search.jikan_search_url(params, ALERT_DEPTH, order_by='start_date', sort='desc'),
+            timeout=600,
+        )
+        for params in params_list
+    ]
+    # fetch_jikan_data stores the metadata in background tasks; finish them before the loop closes
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+def evaluate_saved_searches(jikan_budget=JIKAN_BUDGET):
+    """Run every distinct saved search once and alert subscribers to new matches. Returns run stats."""
+    groups = saved_search_groups()
+    by_popularity = sorted(groups, key=lambda key: -len(groups[key][1]))
+
+    results = {}
+    thin = []
+    for key in by_popularity:
+        params = groups[key][0]
+        results[key] = ('local', [item.mal_id for item in search.search_canonical(params, limit=ALERT_DEPTH, newest=True)])
+        if len(results[key][1]) < search.LOCAL_MIN_RESULTS and len(thin) < jikan_budget:
+            thin.append(key)
+    if thin:
+        for key, data in zip(thin, async_to_sync(_fetch_jikan)([groups[key][0] for key in thin])):
+            # An empty answer may just be Jikan failing; keep the local result then
+            if data.get('data'):
+                results[key] = ('jikan', [item['mal_id'] for item in data['data']])
+
+    now = timezone.now()
+    states = SearchAlertState.objects.in_bulk(list(groups), field_name='query_key')
+    to_create, to_update, alerted = [], [], 0
+    with transaction.atomic():
+        for key in by_popularity:
+            source, ids = results[key]
+            state = states.get(key)
+            if state is None:
+                to_create.append(SearchAlertState(query_key=key, source=source, seen_ids=ids, checked_at=now))
+                continue
+
+            seen = set(state.seen_ids)
+            new_ids = [anime_id for anime_id in ids if anime_id not in seen] if state.source == source else []
+            if new_ids:
+                alerted += 1
+                outbox.publish(
+                    'saved_search.matched',
+                    anime_ids=new_ids,
+                    subscribers=[list(subscriber) for subscriber in groups[key][1]],
+                )
+            kept = ids + [anime_id for anime_id in state.seen_ids if anime_id not in set(ids)]
+            state.source, state.seen_ids, state.checked_at = source, kept[:SEEN_LIMIT], now
+            to_update.append(state)
+
+        SearchAlertState.objects.bulk_create(to_create)
+        SearchAlertState.objects.bulk_update(to_update, ['source', 'seen_ids', 'checked_at'], batch_size=500)
+        # Nobody saves these any more
+        SearchAlertState.objects.exclude(query_key__in=list(groups)).delete()
+
+    return {'queries': len(groups), 'jikan_requests': len(thin), 'alerted_queries': alerted}
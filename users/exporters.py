@@ -0,0 +1,160 @@
+"""
+Constant-memory writers for list exports.
+
+Each format is a header, a line per entry row and a footer, batched into text
+chunks. Every writer comes as a sync generator over `.iterator()` and an async
+one over `.aiterator()`, and the view picks the one its handler streams: under
+ASGI a sync iterator is collected into memory before sending, and under WSGI
+an async one is. The background export task uses the sync generator. Either
+way rows come from a server-side cursor, never a list.
+"""
+import csv
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core import signing
+
+from .models import UserAnimeEntry
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows joined into one chunk before it is handed to the response
+ROWS_PER_WRITE = 200
+
+EXPORT_FIELDS = ['anime_id', 'title', 'status', 'score', 'episodes_watched', 'updated_at']
+
+EXPORT_FORMATS = {
+    'xml': ('application/xml', 'xml'),
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# MitsuList status to MAL XML export status
+MAL_XML_STATUS = {
+    'watching': 'Watching',
+    'completed': 'Completed',
+    'on_hold': 'On-Hold',
+    'dropped': 'Dropped',
+    'plan_to_watch': 'Plan to Watch',
+}
+
+
+def _entries(user):
+    # values() rather than values_list(): its iterable is a lazy generator, which aiterator() needs
+    return UserAnimeEntry.objects.filter(user=user).order_by('anime_id').values(*EXPORT_FIELDS)
+
+
+def _mal_xml_header(user):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n<myanimelist>\n'
+        '\t<myinfo>\n'
+        f'\t\t<user_name>{escape(user.username)}</user_name>\n'
+        '\t\t<user_export_type>1</user_export_type>\n'
+        '\t</myinfo>\n'
+    )
+
+
+def _mal_xml_row(row):
+    return (
+        '\t<anime>\n'
+        f'\t\t<series_animedb_id>{row["anime_id"]}</series_animedb_id>\n'
+        f'\t\t<series_title>{escape(row["title"])}</series_title>\n'
+        f'\t\t<my_watched_episodes>{row["episodes_watched"]}</my_watched_episodes>\n'
+        f'\t\t<my_score>{row["score"]}</my_score>\n'
+        f'\t\t<my_status>{MAL_XML_STATUS.get(row["status"], "Plan to Watch")}</my_status>\n'
+        '\t\t<update_on_import>1</update_on_import>\n'
+        '\t</anime>\n'
+    )
+
+
+class _Echo:
+    """csv.writer target that hands back the formatted line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+_csv_writer = csv.writer(_Echo())
+
+
+def _csv_row(row):
+    return _csv_writer.writerow([*(row[field] for field in EXPORT_FIELDS[:-1]), row['updated_at'].isoformat()])
+
+
+def _ndjson_row(row):
+    return json.dumps({**row, 'updated_at': row['updated_at'].isoformat()}, ensure_ascii=False) + '\n'
+
+
+# format -> (header for the user, line per row, footer)
+_WRITERS = {
+    'xml': (_mal_xml_header, _mal_xml_row, '</myanimelist>\n'),
+    'csv': (lambda user: _csv_writer.writerow(EXPORT_FIELDS), _csv_row, ''),
+    'ndjson': (lambda user: '', _ndjson_row, ''),
+}
+
+
+def export_chunks(user, fmt):
+    """Yield the user's list in `fmt` as text chunks, reading rows through a server-side cursor."""
+    header, line, footer = _WRITERS[fmt]
+    batch = [header(user)]
+    for row in _entries(user).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        batch.append(line(row))
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    batch.append(footer)
+    yield ''.join(batch)
+
+
+async def aexport_chunks(user, fmt):
+    """export_chunks() as an async generator, which ASGI servers stream without buffering."""
+    header, line, footer = _WRITERS[fmt]
+    batch = [header(user)]
+    async for row in _entries(user).aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        batch.append(line(row))
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    batch.append(footer)
+    yield ''.join(batch)
+
+
+def _gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+
+
+def gzip_chunks(chunks):
+    """Incrementally gzip an iterator of text chunks."""
+    compressor = _gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_chunks(chunks):
+    """gzip_chunks() for an async iterator."""
+    compressor = _gzip_compressor()
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_token(user_id, name, filename):
+    """Signed reference to a stored export, for the download link."""
+    return signing.dumps([user_id, name, filename], salt='users.export', compress=True)
+
+
+def read_export_token(token):
+    """(user id, storage name, filename); raises BadSignature if tampered with or older than LIST_EXPORT_LINK_MAX_AGE."""
+    return signing.loads(token, salt='users.export', max_age=settings.LIST_EXPORT_LINK_MAX_AGE)
+
+
+def export_filename(user, fmt, gzipped):
+    extension = EXPORT_FORMATS[fmt][1]
+    return f"mitsulist_{user.username}_animelist.{extension}" + ('.gz' if gzipped else '')
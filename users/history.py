@@ -0,0 +1,74 @@
+"""
+Time-series stats over the EntryEvent log.
+
+EntryEvent rows are append-only; rollup_entry_events() folds them into one
+EntryMonthlyRollup row per user and month, so charts and Wrapped read a
+handful of indexed rows instead of rescanning the log.
+"""
+import datetime
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import EntryEvent, EntryMonthlyRollup
+
+
+def month_start(moment):
+    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_entry_events(since=None, event_model=EntryEvent, rollup_model=EntryMonthlyRollup):
+    """
+    Recompute the monthly rollups of every (user, month) with events since
+    `since` (default: the start of the previous month, so late events still
+    land). Whole months are recomputed, which keeps the job idempotent.
+    Returns the number of rollup rows written. Migrations pass their
+    historical models.
+    """
+    if since is None:
+        since = month_start(month_start(timezone.now()) - datetime.timedelta(days=1))
+    else:
+        since = month_start(since)
+
+    totals = (
+        event_model.objects.filter(created_at__gte=since, baseline=False)
+        .annotate(month=TruncMonth('created_at'))
+        .values('user_id', 'month')
+        .annotate(
+            episode_total=Sum('episode_delta'),
+            completed_total=Count('id', filter=Q(status='completed')),
+            started_total=Count('id', filter=Q(status='watching')),
+            event_total=Count('id'),
+        )
+    )
+    rollups = [
+        rollup_model(
+            user_id=row['user_id'],
+            month=row['month'].date() if isinstance(row['month'], datetime.datetime) else row['month'],
+            episodes=row['episode_total'] or 0,
+            completed=row['completed_total'],
+            started=row['started_total'],
+            events=row['event_total'],
+        )
+        for row in totals
+    ]
+    rollup_model.objects.bulk_create(
+        rollups,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'month'],
+        update_fields=['episodes', 'completed', 'started', 'events'],
+    )
+    return len(rollups)
+
+
+def monthly_episodes(user_id, year):
+    """Episodes watched per month of `year` (12 values) from the rollups."""
+    series = [0] * 12
+    for month, episodes in EntryMonthlyRollup.objects.filter(
+        user_id=user_id, month__year=year
+    ).values_list('month', 'episodes'):
+        series[month.month - 1] = episodes
+    return series
@@ -0,0 +1,145 @@
+"""
+Leaderboards kept in Redis sorted sets.
+
+Each board (episodes, reviews, badges) has an all-time set plus one set per
+calendar month and ISO week. The outbox handlers and importers bump them with
+ZINCRBY as things happen, reconcile_leaderboards() rebuilds every set from SQL
+nightly to absorb drift (deleted entries), and the view only reads ZREVRANGE.
+A set loaded from SQL holds a sentinel member; one without it (evicted, flushed,
+or started by an increment before any load) is rebuilt from SQL on the next
+read. Without Redis every read falls back to the SQL aggregation.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from app.models import Review
+from app.redis_client import get_redis, mark_unavailable
+from .models import UserAnimeEntry, EntryEvent, UserBadge
+
+BOARDS = ('episodes', 'reviews', 'badges')
+WINDOWS = ('all', 'month', 'week')
+
+# Windowed sets outlive their period a little, then expire on their own
+WINDOW_TTL = {
+    'month': 40 * 86400,
+    'week': 10 * 86400,
+}
+
+# Sentinel member of every set loaded from SQL; it scores below any real user
+RECONCILED = 'reconciled'
+
+
+def window_start(window, now=None):
+    now = timezone.localtime(now or timezone.now())
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'month':
+        return midnight.replace(day=1)
+    if window == 'week':
+        return midnight - datetime.timedelta(days=now.weekday())
+    return None
+
+
+def board_key(board, window, at=None):
+    at = timezone.localtime(at or timezone.now())
+    if window == 'month':
+        return f'lb:{board}:m:{at:%Y-%m}'
+    if window == 'week':
+        year, week, _ = at.isocalendar()
+        return f'lb:{board}:w:{year}-{week:02d}'
+    return f'lb:{board}:all'
+
+
+def record(board, increments, at=None):
+    """Add {user_id: amount} to all of the board's windows once the transaction commits."""
+    increments = {user_id: amount for user_id, amount in increments.items() if amount}
+    if not increments:
+        return
+
+    def _apply():
+        client = get_redis()
+        if client is None:
+            return  # The nightly reconcile catches up
+        try:
+            pipe = client.pipeline(transaction=False)
+            for window in WINDOWS:
+                key = board_key(board, window, at)
+                for user_id, amount in increments.items():
+                    pipe.zincrby(key, amount, user_id)
+                if window in WINDOW_TTL:
+                    pipe.expire(key, WINDOW_TTL[window])
+            pipe.execute()
+        except RedisError as e:
+            mark_unavailable(e)
+
+    transaction.on_commit(_apply)
+
+
+def sql_scores(board, window):
+    """The board computed from SQL: a (user_id, total) queryset, best first."""
+    start = window_start(window)
+    if board == 'episodes':
+        if start is None:
+            rows = UserAnimeEntry.objects.values('user_id').annotate(total=Sum('episodes_watched'))
+        else:
+            rows = EntryEvent.objects.filter(created_at__gte=start, baseline=False).values('user_id').annotate(total=Sum('episode_delta'))
+    elif board == 'reviews':
+        rows = Review.objects.all()
+        if start is not None:
+            rows = rows.filter(created_at__gte=start)
+        rows = rows.values('user_id').annotate(total=Count('id'))
+    else:
+        rows = UserBadge.objects.all()
+        if start is not None:
+            rows = rows.filter(earned_at__gte=start)
+        rows = rows.values('user_id').annotate(total=Count('id'))
+    return rows.filter(total__gt=0).order_by('-total').values_list('user_id', 'total')
+
+
+def _load(pipe, board, window):
+    """Queue replacing the board's current set with the SQL totals; returns them."""
+    key = board_key(board, window)
+    rows = list(sql_scores(board, window))
+    pipe.delete(key)
+    pipe.zadd(key, {RECONCILED: -1, **{str(user_id): total for user_id, total in rows}})
+    if window in WINDOW_TTL:
+        pipe.expire(key, WINDOW_TTL[window])
+    return rows
+
+
+def top(board, window='all', limit=10):
+    """[(user_id, score)] for the top `limit` users of a board."""
+    client = get_redis()
+    if client is not None:
+        key = board_key(board, window)
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.zscore(key, RECONCILED)
+            pipe.zrevrange(key, 0, limit - 1, withscores=True)
+            reconciled, rows = pipe.execute()
+            if reconciled is not None:
+                return [(int(member), int(score)) for member, score in rows if score > 0]
+            pipe = client.pipeline(transaction=True)
+            rows = _load(pipe, board, window)
+            pipe.execute()
+            return rows[:limit]
+        except RedisError as e:
+            mark_unavailable(e)
+    return list(sql_scores(board, window)[:limit])
+
+
+def reconcile_leaderboards():
+    """Rebuild every current set from SQL. Returns the number of sets written."""
+    client = get_redis()
+    if client is None:
+        return 0
+
+    pipe = client.pipeline(transaction=True)
+    for board in BOARDS:
+        for window in WINDOWS:
+            _load(pipe, board, window)
+    pipe.execute()
+    return len(BOARDS) * len(WINDOWS)
@@ -0,0 +1,108 @@
+"""
+Per-user "is this anime in my list" sets for card grids.
+
+Each user's list is mirrored as a Redis set of MAL ids (`list:{user_id}`)
+holding a sentinel member 0 once it has been loaded in full. A grid lookup is
+one SMISMEMBER; only the ids that are actually in the list go to SQL, as one
+query on the (user, anime_id) unique index. Entry saves, deletes and imports
+SADD/SREM after commit. A set without the sentinel (evicted, or created by an
+increment before the first load) is rebuilt from SQL on the next read.
+Without Redis every lookup is just the SQL query.
+"""
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from app.redis_client import get_redis, mark_unavailable
+from .models import UserAnimeEntry
+
+# Ids accepted per request by the batch endpoint
+BATCH_LIMIT = 100
+
+# Idle sets expire; the next read reloads them
+SET_TTL = 30 * 86400
+
+LOADED = 0
+
+
+def _key(user_id):
+    return f'list:{user_id}'
+
+
+def _load(client, user_id):
+    anime_ids = list(UserAnimeEntry.objects.filter(user_id=user_id).values_list('anime_id', flat=True))
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(_key(user_id))
+    pipe.sadd(_key(user_id), LOADED, *anime_ids)
+    pipe.expire(_key(user_id), SET_TTL)
+    pipe.execute()
+    return set(anime_ids)
+
+
+def _members(user_id, anime_ids):
+    """The subset of `anime_ids` in the user's list, or None without Redis."""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        flags = client.smismember(_key(user_id), [LOADED, *anime_ids])
+        if flags[0]:
+            return {anime_id for anime_id, present in zip(anime_ids, flags[1:]) if present}
+        return _load(client, user_id) & set(anime_ids)
+    except RedisError as e:
+        mark_unavailable(e)
+        return None
+
+
+def list_statuses(user_id, anime_ids):
+    """{anime_id: {'status', 'score', 'episodes_watched'}} for the ids in the user's list."""
+    anime_ids = list(dict.fromkeys(anime_ids))
+    if not anime_ids:
+        return {}
+    members = _members(user_id, anime_ids)
+    if members is not None:
+        anime_ids = [anime_id for anime_id in anime_ids if anime_id in members]
+    if not anime_ids:
+        return {}
+    return {
+        anime_id: {'status': status, 'score': score, 'episodes_watched': episodes}
+        for anime_id, status, score, episodes in UserAnimeEntry.objects.filter(
+            user_id=user_id, anime_id__in=anime_ids
+        ).values_list('anime_id', 'status', 'score', 'episodes_watched')
+    }
+
+
+def _apply(user_id, added=(), removed=()):
+    def _write():
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            if added:
+                pipe.sadd(_key(user_id), *added)
+            if removed:
+                pipe.srem(_key(user_id), *removed)
+            pipe.expire(_key(user_id), SET_TTL)
+            pipe.execute()
+        except RedisError as e:
+            mark_unavailable(e)
+
+    transaction.on_commit(_write)
+
+
+def add_to_sets(pairs):
+    """SADD [(user_id, anime_id)] after commit."""
+    by_user = {}
+    for user_id, anime_id in pairs:
+        by_user.setdefault(user_id, set()).add(anime_id)
+    for user_id, anime_ids in by_user.items():
+        _apply(user_id, added=anime_ids)
+
+
+def remove_from_sets(pairs):
+    """SREM [(user_id, anime_id)] after commit."""
+    by_user = {}
+    for user_id, anime_id in pairs:
+        by_user.setdefault(user_id, set()).add(anime_id)
+    for user_id, anime_ids in by_user.items():
+        _apply(user_id, removed=anime_ids)
@@ -0,0 +1,67 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_events(apps, schema_editor):
+    """One baseline event per existing entry, dated at its last update and kept out of windowed stats."""
+    UserAnimeEntry = apps.get_model('users', 'UserAnimeEntry')
+    EntryEvent = apps.get_model('users', 'EntryEvent')
+    batch = []
+    for entry in UserAnimeEntry.objects.values_list('user_id', 'anime_id', 'status', 'score', 'episodes_watched', 'updated_at').iterator(chunk_size=2000):
+        user_id, anime_id, status, score, episodes_watched, updated_at = entry
+        batch.append(EntryEvent(
+            user_id=user_id, anime_id=anime_id, status=status,
+            score_delta=score, episode_delta=episodes_watched, created_at=updated_at, baseline=True,
+        ))
+        if len(batch) >= 2000:
+            EntryEvent.objects.bulk_create(batch)
+            batch = []
+    EntryEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_tasteprofile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anime_id', models.IntegerField()),
+                ('status', models.CharField(blank=True, choices=[('watching', 'Watching'), ('completed', 'Completed'), ('plan_to_watch', 'Plan to Watch'), ('dropped', 'Dropped'), ('on_hold', 'On Hold')], default='', max_length=20)),
+                ('score_delta', models.SmallIntegerField(default=0)),
+                ('episode_delta', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('baseline', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entry_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='users_entry_user_id_d2e821_idx'), models.Index(fields=['created_at'], name='users_entry_created_1c89ae_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntryMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('episodes', models.IntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('started', models.PositiveIntegerField(default=0)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['month'],
+                'unique_together': {('user', 'month')},
+            },
+        ),
+        migrations.RunPython(seed_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_entry_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useranimeentry',
+            index=models.Index(fields=['anime_id', 'user'], name='entry_anime_user_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Number each user's existing entries 1..n by last update and start their sequence at n."""
+    UserAnimeEntry = apps.get_model('users', 'UserAnimeEntry')
+    ListSequence = apps.get_model('users', 'ListSequence')
+    batch, sequences = [], {}
+    for entry in UserAnimeEntry.objects.only('id', 'user_id').order_by('user_id', 'updated_at', 'id').iterator(chunk_size=2000):
+        sequences[entry.user_id] = entry.change_seq = sequences.get(entry.user_id, 0) + 1
+        batch.append(entry)
+        if len(batch) >= 2000:
+            UserAnimeEntry.objects.bulk_update(batch, ['change_seq'])
+            batch = []
+    UserAnimeEntry.objects.bulk_update(batch, ['change_seq'])
+    ListSequence.objects.bulk_create(
+        [ListSequence(user_id=user_id, value=value) for user_id, value in sequences.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0017_useranimeentry_entry_anime_user_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='list_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anime_id', models.IntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='useranimeentry',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='useranimeentry',
+            index=models.Index(fields=['user', 'change_seq'], name='entry_user_seq_idx'),
+        ),
+        migrations.AddField(
+            model_name='listtombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='list_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='listtombstone',
+            index=models.Index(fields=['user', 'change_seq'], name='users_listt_user_id_8ab5fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listtombstone',
+            index=models.Index(fields=['created_at'], name='users_listt_created_12e090_idx'),
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
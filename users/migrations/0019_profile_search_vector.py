@@ -0,0 +1,71 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:30
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Stored full-text vector for Profile: the username (exact words) plus the bio in
+# the 'english' and 'simple' configs (see app/search.py). PostgreSQL only.
+PROFILE_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce((SELECT username FROM auth_user WHERE id = NEW.user_id), '')), 'A')"
+    " || setweight(to_tsvector('english', coalesce(NEW.bio, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce(NEW.bio, '')), 'B')"
+)
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"""
+        CREATE OR REPLACE FUNCTION users_profile_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {PROFILE_VECTOR};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    schema_editor.execute(
+        "CREATE TRIGGER users_profile_search_vector_trigger BEFORE INSERT OR UPDATE ON users_profile "
+        "FOR EACH ROW EXECUTE FUNCTION users_profile_search_vector_update()"
+    )
+    # Renames re-run the profile trigger
+    schema_editor.execute("""
+        CREATE OR REPLACE FUNCTION auth_user_profile_search_update() RETURNS trigger AS $$
+        BEGIN
+            UPDATE users_profile SET search_vector = NULL WHERE user_id = NEW.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    schema_editor.execute(
+        "CREATE TRIGGER auth_user_profile_search_trigger AFTER UPDATE OF username ON auth_user "
+        "FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username) "
+        "EXECUTE FUNCTION auth_user_profile_search_update()"
+    )
+    schema_editor.execute("UPDATE users_profile SET search_vector = NULL")
+    schema_editor.execute("CREATE INDEX users_profile_search_vector_gin ON users_profile USING gin (search_vector)")
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS users_profile_search_vector_gin")
+    schema_editor.execute("DROP TRIGGER IF EXISTS auth_user_profile_search_trigger ON auth_user")
+    schema_editor.execute("DROP FUNCTION IF EXISTS auth_user_profile_search_update()")
+    schema_editor.execute("DROP TRIGGER IF EXISTS users_profile_search_vector_trigger ON users_profile")
+    schema_editor.execute("DROP FUNCTION IF EXISTS users_profile_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0018_list_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
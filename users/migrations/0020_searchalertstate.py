@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_profile_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchAlertState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query_key', models.CharField(max_length=64, unique=True)),
+                ('source', models.CharField(default='local', max_length=10)),
+                ('seen_ids', models.JSONField(default=list)),
+                ('checked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
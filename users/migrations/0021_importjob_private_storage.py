@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:05
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_searchalertstate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, storage=users.models.private_storage, upload_to='imports/'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:50
+
+import datetime
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    """The nightly job only rolls up the previous month onwards; fold in the whole log once."""
+    EntryEvent = apps.get_model('users', 'EntryEvent')
+    EntryMonthlyRollup = apps.get_model('users', 'EntryMonthlyRollup')
+    totals = (
+        EntryEvent.objects.filter(baseline=False)
+        .annotate(month=TruncMonth('created_at'))
+        .values('user_id', 'month')
+        .annotate(
+            episode_total=Sum('episode_delta'),
+            completed_total=Count('id', filter=Q(status='completed')),
+            started_total=Count('id', filter=Q(status='watching')),
+            event_total=Count('id'),
+        )
+    )
+    EntryMonthlyRollup.objects.bulk_create(
+        [
+            EntryMonthlyRollup(
+                user_id=row['user_id'],
+                month=row['month'].date() if isinstance(row['month'], datetime.datetime) else row['month'],
+                episodes=row['episode_total'] or 0,
+                completed=row['completed_total'],
+                started=row['started_total'],
+                events=row['event_total'],
+            )
+            for row in totals.iterator(chunk_size=2000)
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'month'],
+        update_fields=['episodes', 'completed', 'started', 'events'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_importjob_private_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
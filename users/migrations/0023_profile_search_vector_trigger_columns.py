@@ -0,0 +1,48 @@
+# Generated by Django 6.0.2 on 2026-10-19 17:05
+
+from django.db import migrations
+
+# A changed or cleared vector also recomputes: renames (auth_user_profile_search_update)
+# and backfills clear it, and a stale vector written back by a save is rebuilt
+PROFILE_CHANGED = (
+    "OLD.bio IS DISTINCT FROM NEW.bio OR OLD.user_id IS DISTINCT FROM NEW.user_id"
+    " OR OLD.search_vector IS DISTINCT FROM NEW.search_vector OR NEW.search_vector IS NULL"
+)
+
+
+def restrict_search_trigger(apps, schema_editor):
+    """Recompute the profile vector on insert and when its inputs change, not on every XP or avatar update."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP TRIGGER IF EXISTS users_profile_search_vector_trigger ON users_profile")
+    schema_editor.execute(
+        "CREATE TRIGGER users_profile_search_vector_insert_trigger BEFORE INSERT ON users_profile "
+        "FOR EACH ROW EXECUTE FUNCTION users_profile_search_vector_update()"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER users_profile_search_vector_update_trigger "
+        "BEFORE UPDATE OF bio, user_id, search_vector ON users_profile "
+        f"FOR EACH ROW WHEN ({PROFILE_CHANGED}) EXECUTE FUNCTION users_profile_search_vector_update()"
+    )
+
+
+def unrestrict_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP TRIGGER IF EXISTS users_profile_search_vector_update_trigger ON users_profile")
+    schema_editor.execute("DROP TRIGGER IF EXISTS users_profile_search_vector_insert_trigger ON users_profile")
+    schema_editor.execute(
+        "CREATE TRIGGER users_profile_search_vector_trigger BEFORE INSERT OR UPDATE ON users_profile "
+        "FOR EACH ROW EXECUTE FUNCTION users_profile_search_vector_update()"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_backfill_entrymonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(restrict_search_trigger, unrestrict_search_trigger),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.functions import Greatest
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from PIL import Image
@@ -7,6 +10,11 @@ from io import BytesIO
 from django.core.files.base import ContentFile
 import os
 
+# XP needed per level; every watched episode earns XP_PER_EPISODE
+XP_PER_LEVEL = 200
+XP_PER_EPISODE = 10
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     favorites = models.JSONField(default=list, blank=True)
@@ -18,6 +26,8 @@ class Profile(models.Model):
     # New Fields
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
     bio = models.TextField(blank=True, max_length=500)
+    # Username + bio, maintained by a database trigger on PostgreSQL (see app/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
     
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -74,13 +84,22 @@ class Profile(models.Model):
                 
         super().save(*args, **kwargs)
         
+    @classmethod
+    def add_xp(cls, user_id, amount):
+        """Add XP and raise the level to match in one UPDATE, so concurrent requests can't lose XP."""
+        if amount > 0:
+            cls.objects.filter(user_id=user_id).update(
+                xp=models.F('xp') + amount,
+                level=Greatest('level', (models.F('xp') + amount) / XP_PER_LEVEL + 1),
+            )
+
     @property
     def xp_progress(self):
-        return (self.xp % 200) / 200 * 100
+        return (self.xp % XP_PER_LEVEL) / XP_PER_LEVEL * 100
         
     @property
     def xp_to_next_level(self):
-        return 200 - (self.xp % 200)
+        return XP_PER_LEVEL - (self.xp % XP_PER_LEVEL)
 
     @property
     def avatar_url(self):
@@ -107,6 +126,16 @@ class SavedSearch(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.name}"
 
+class SearchAlertState(models.Model):
+    """The ids one distinct saved-search query returned last time (see users/alerts.py)."""
+    query_key = models.CharField(max_length=64, unique=True)
+    source = models.CharField(max_length=10, default='local')  # 'local' or 'jikan'
+    seen_ids = models.JSONField(default=list)
+    checked_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.query_key} ({len(self.seen_ids)} seen)"
+
 class UserAnimeEntry(models.Model):
     STATUS_CHOICES = [
         ('watching', 'Watching'),
@@ -127,14 +156,230 @@ class UserAnimeEntry(models.Model):
     
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Position in the owner's change sequence (see ListSequence), for delta sync
+    change_seq = models.BigIntegerField(default=0)
 
     class Meta:
         unique_together = ('user', 'anime_id')
         ordering = ['-updated_at']
+        indexes = [
+            # "Who has this anime": anime first, then the followed users' ids
+            models.Index(fields=['anime_id', 'user'], name='entry_anime_user_idx'),
+            models.Index(fields=['user', 'change_seq'], name='entry_user_seq_idx'),
+        ]
+
+    # Fields whose changes are logged as EntryEvents
+    TRACKED_FIELDS = ('status', 'score', 'episodes_watched')
 
     def __str__(self):
         return f"{self.user.username} - {self.title} ({self.get_status_display()})"
 
+    def save(self, *args, **kwargs):
+        # The sequence row stays locked until the entry is written, so a
+        # client never sees seq N+1 committed before seq N
+        with transaction.atomic():
+            self.change_seq = ListSequence.reserve(self.user_id)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_tracked_values()
+        return instance
+
+    def remember_tracked_values(self):
+        """Snapshot the tracked fields so the next save can log what changed."""
+        self._tracked_values = {
+            name: getattr(self, name) for name in self.TRACKED_FIELDS if name in self.__dict__
+        }
+
+    def knows_tracked_values(self, created):
+        """
+        Whether the status and score before this save are known, so a None from
+        stats_transition() means they did not change rather than "unknown".
+        """
+        old = getattr(self, '_tracked_values', {})
+        return created or ('status' in old and 'score' in old)
+
+    def tracked_changes(self, created):
+        """
+        (status or '' if unchanged, score delta, episode delta) since the last
+        load/save, or None when nothing tracked changed or the old values are unknown.
+        """
+        if created:
+            old = {'status': None, 'score': 0, 'episodes_watched': 0}
+        else:
+            old = getattr(self, '_tracked_values', None)
+            if old is None or len(old) < len(self.TRACKED_FIELDS):
+                return None
+        status = self.status if self.status != old['status'] else ''
+        score_delta = self.score - old['score']
+        episode_delta = self.episodes_watched - old['episodes_watched']
+        if not (status or score_delta or episode_delta):
+            return None
+        return status, score_delta, episode_delta
+
+    def stats_transition(self, created):
+        """
+        [old status, old score, new status, new score] for the community stats
+        since the last load/save (old status is None for new entries), or None
+        when neither changed or the old values are unknown.
+        """
+        if created:
+            old_status, old_score = None, 0
+        else:
+            old = getattr(self, '_tracked_values', {})
+            if 'status' not in old or 'score' not in old:
+                return None
+            old_status, old_score = old['status'], old['score']
+        if (old_status, old_score) == (self.status, self.score):
+            return None
+        return [old_status, old_score, self.status, self.score]
+
+
+class EntryEvent(models.Model):
+    """
+    Append-only log of list changes: the status an entry moved to (blank if it
+    didn't change) and the score/episode deltas. Written in bulk by the outbox
+    handler and by the importers; rolled up per month into EntryMonthlyRollup.
+    Baseline rows hold each entry as it stood when the log began; they are not
+    changes, so windowed stats (boards, Wrapped, rollups) leave them out.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='entry_events')
+    anime_id = models.IntegerField()
+    status = models.CharField(max_length=20, choices=UserAnimeEntry.STATUS_CHOICES, blank=True, default='')
+    score_delta = models.SmallIntegerField(default=0)
+    episode_delta = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    baseline = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.anime_id} @ {self.created_at:%Y-%m-%d}"
+
+
+class EntryMonthlyRollup(models.Model):
+    """Per-user monthly totals over EntryEvent, maintained by rollup_entry_events_task."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups')
+    month = models.DateField(help_text="First day of the month")
+    episodes = models.IntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    started = models.PositiveIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'month')
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.user_id} - {self.month:%Y-%m}"
+
+
+class ListSequence(models.Model):
+    """
+    Per-user monotonically increasing counter for list changes. Every entry
+    write and ListTombstone takes the next value while holding this row's lock.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='list_sequence')
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def reserve(cls, user_id, count=1):
+        """Reserve `count` sequence values for `user_id`; returns the first."""
+        with transaction.atomic():
+            if not cls.objects.filter(user_id=user_id).update(value=models.F('value') + count):
+                cls.objects.get_or_create(user_id=user_id)
+                cls.objects.filter(user_id=user_id).update(value=models.F('value') + count)
+            return cls.objects.filter(user_id=user_id).values_list('value', flat=True).get() - count + 1
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.value}"
+
+
+class ListTombstone(models.Model):
+    """A deleted list entry, kept for LIST_SYNC_TOMBSTONE_DAYS so sync clients learn about it."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='list_tombstones')
+    anime_id = models.IntegerField()
+    change_seq = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'change_seq']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.anime_id} deleted @ {self.change_seq}"
+
+
+class TasteProfile(models.Model):
+    """
+    Compact taste vector for compatibility scores, maintained by users/taste.py
+    whenever the user's list changes.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='taste_profile')
+    # {name: weight}; each watched title adds its rating / 10
+    genres = models.JSONField(default=dict, blank=True)
+    studios = models.JSONField(default=dict, blank=True)
+    # Bitset of watched MAL ids (bit n set = anime n watched)
+    watched = models.BinaryField(default=bytes, blank=True)
+    entry_count = models.PositiveIntegerField(default=0)
+    # [[user_id, percent], ...] from the nightly "users like you" batch
+    similar_users = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Taste profile of {self.user.username}"
+
+def private_storage():
+    # Resolved lazily so the STORAGES setting can differ per environment without a migration
+    from django.core.files.storage import storages
+    return storages['private']
+
+
+class ImportJob(models.Model):
+    """
+    Background list import. Workers update `processed` as chunks are written and
+    push the same numbers to the user's notification socket. Paged imports also
+    checkpoint `last_page`, so a retried task resumes instead of starting over.
+    """
+    SOURCE_CHOICES = [
+        ('mal_xml', 'MAL XML Export'),
+        ('mal_username', 'MAL Username'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='imports/', storage=private_storage, blank=True)
+    mal_username = models.CharField(max_length=100, blank=True)
+    processed = models.IntegerField(default=0)
+    last_page = models.IntegerField(default=0)
+    total_pages = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_source_display()} ({self.status})"
+
 
 class Badge(models.Model):
     name = models.CharField(max_length=50, unique=True)
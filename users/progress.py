@@ -0,0 +1,77 @@
+"""
+Fast path for the "+1 episode" button.
+
+increment_episode() bumps the counter, the owner's list sequence and their XP
+without loading the entry or calling save(). On PostgreSQL that is a single
+statement (data-modifying CTEs with RETURNING); elsewhere it is a few ORM
+UPDATEs in one transaction. Instead of save()'s 'entry.saved' it publishes
+'entry.progressed', whose handlers fold a batch of clicks into one EntryEvent
+per title and skip the badge, taste and recommendation work an episode bump
+can't affect.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app import outbox
+from .models import ListSequence, Profile, UserAnimeEntry, XP_PER_EPISODE, XP_PER_LEVEL
+
+
+def _increment_postgres(user_id, anime_id, now):
+    sql = f"""
+        WITH seq AS (
+            UPDATE {ListSequence._meta.db_table} SET value = value + 1
+            WHERE user_id = %(user)s
+            RETURNING value
+        ), entry AS (
+            UPDATE {UserAnimeEntry._meta.db_table}
+            SET episodes_watched = episodes_watched + 1,
+                updated_at = %(now)s,
+                change_seq = COALESCE((SELECT value FROM seq), change_seq)
+            WHERE user_id = %(user)s AND anime_id = %(anime)s
+            RETURNING id, title, episodes_watched
+        ), profile AS (
+            UPDATE {Profile._meta.db_table}
+            SET xp = xp + %(xp)s, level = GREATEST(level, (xp + %(xp)s) / %(per_level)s + 1)
+            WHERE user_id = %(user)s AND EXISTS (SELECT 1 FROM entry)
+            RETURNING xp
+        )
+        SELECT id, title, episodes_watched FROM entry
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'user': user_id, 'anime': anime_id, 'now': now,
+            'xp': XP_PER_EPISODE, 'per_level': XP_PER_LEVEL,
+        })
+        return cursor.fetchone()
+
+
+def _increment_generic(user_id, anime_id, now):
+    entries = UserAnimeEntry.objects.filter(user_id=user_id, anime_id=anime_id)
+    seq = ListSequence.reserve(user_id)
+    if not entries.update(episodes_watched=F('episodes_watched') + 1, updated_at=now, change_seq=seq):
+        return None
+    Profile.add_xp(user_id, XP_PER_EPISODE)
+    return entries.values_list('id', 'title', 'episodes_watched').get()
+
+
+def increment_episode(user_id, anime_id):
+    """Add one watched episode. Returns the new count, or None if the anime isn't in the list."""
+    now = timezone.now()
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            row = _increment_postgres(user_id, anime_id, now)
+        else:
+            row = _increment_generic(user_id, anime_id, now)
+        if row is None:
+            return None
+        entry_id, title, episodes_watched = row
+        outbox.publish(
+            'entry.progressed',
+            user_id=user_id,
+            entry_id=entry_id,
+            anime_id=anime_id,
+            title=title,
+            at=now.isoformat(),
+        )
+    return episodes_watched
@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+import datetime
+from collections import defaultdict
+
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Follow, UserAnimeEntry, Badge, UserBadge
+from django.contrib.auth.models import User
+from .models import Follow, UserAnimeEntry, Badge, UserBadge, EntryEvent, ListSequence, ListTombstone
 from app.models import ReviewComment, Notification, Review
+from app.notifications import create_notifications
+from app import outbox
+from . import leaderboards, membership, social
 
 
 @receiver(post_save, sender=Follow)
@@ -10,14 +18,14 @@ def notify_new_follower(sender, instance, created, **kwargs):
     When a Follow is created, notify the target user.
     Moved here from users/views.py to keep views thin and logic centralised.
     """
-    if created and instance.user != instance.following:
-        Notification.objects.create(
-            recipient=instance.following,
-            sender=instance.user,
-            notification_type='new_follower',
-            message=f"{instance.user.username} started following you",
-            link=f"/profile/{instance.user.username}/",
-        )
+    if created and instance.user_id != instance.following_id:
+        outbox.publish('follow.created', user_id=instance.user_id, following_id=instance.following_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_following_ids(sender, instance, **kwargs):
+    social.invalidate_following(instance.user_id)
 
 
 @receiver(post_save, sender=ReviewComment)
@@ -26,62 +34,263 @@ def notify_review_comment(sender, instance, created, **kwargs):
     When a ReviewComment is created, notify the review author.
     Moved here from users/views.py.
     """
-    if created and instance.user != instance.review.user:
-        Notification.objects.create(
-            recipient=instance.review.user,
-            sender=instance.user,
+    if created:
+        outbox.publish('review.commented', user_id=instance.user_id, review_id=instance.review_id)
+
+
+@outbox.handler('follow.created')
+def send_follower_notifications(payloads):
+    users = User.objects.in_bulk({p['user_id'] for p in payloads})
+    return create_notifications([
+        Notification(
+            recipient_id=p['following_id'],
+            sender=users[p['user_id']],
+            notification_type='new_follower',
+            message=f"{users[p['user_id']].username} started following you",
+            link=f"/profile/{users[p['user_id']].username}/",
+            group_key='new_follower',
+        )
+        for p in payloads if p['user_id'] in users
+    ])
+
+
+@outbox.handler('review.commented')
+def send_comment_notifications(payloads):
+    users = User.objects.in_bulk({p['user_id'] for p in payloads})
+    reviews = Review.objects.in_bulk({p['review_id'] for p in payloads})
+    return create_notifications([
+        Notification(
+            recipient_id=reviews[p['review_id']].user_id,
+            sender=users[p['user_id']],
             notification_type='review_comment',
-            message=f"{instance.user.username} commented on your review",
-            link=f"/anime/{instance.review.anime_id}/reviews/",
+            message=f"{users[p['user_id']].username} commented on your review",
+            link=f"/anime/{reviews[p['review_id']].anime_id}/reviews/",
+            group_key=f"review_comment:{p['review_id']}",
         )
+        for p in payloads
+        if p['user_id'] in users and p['review_id'] in reviews
+        and reviews[p['review_id']].user_id != p['user_id']
+    ])
 
-@receiver(post_save, sender=UserAnimeEntry)
-def check_anime_badges(sender, instance, created, **kwargs):
-    """Evaluate and award badges based on Anime count."""
-    user = instance.user
-    total_entries = UserAnimeEntry.objects.filter(user=user).count()
-    completed_entries = UserAnimeEntry.objects.filter(user=user, status='completed').count()
-    
-    # Check anime_count badges
-    count_badges = Badge.objects.filter(category='anime_count', requirement_value__lte=total_entries)
-    for badge in count_badges:
-        user_badge, awarded = UserBadge.objects.get_or_create(user=user, badge=badge)
-        if awarded:
-            Notification.objects.create(
-                recipient=user,
-                sender=user,  # System message essentially
-                notification_type='badge_earned',
-                message=f"🏆 You earned a new badge: {badge.name}!",
-                link=f"/users/profile/",
-            )
-            
-    # Check completed_count badges
-    completed_badges = Badge.objects.filter(category='completed_count', requirement_value__lte=completed_entries)
-    for badge in completed_badges:
-        user_badge, awarded = UserBadge.objects.get_or_create(user=user, badge=badge)
-        if awarded:
-            Notification.objects.create(
-                recipient=user,
-                sender=user,
+
+@outbox.handler('list.exported')
+def send_export_notifications(payloads):
+    return create_notifications([
+        Notification(
+            recipient_id=p['user_id'],
+            sender_id=p['user_id'],  # System message essentially
+            notification_type='system',
+            message=f"Your {p['format'].upper()} list export is ready to download.",
+            link=p['url'],
+        )
+        for p in payloads
+    ])
+
+
+@outbox.handler('saved_search.matched')
+def send_search_alerts(payloads):
+    notifications = []
+    for p in payloads:
+        count = len(p['anime_ids'])
+        for saved_search_id, user_id, name in p['subscribers']:
+            notifications.append(Notification(
+                recipient_id=user_id,
+                sender_id=user_id,  # System message essentially
+                notification_type='search_alert',
+                message=f"{count} new {'match' if count == 1 else 'matches'} for your saved search \"{name}\"",
+                link=f"/anime/{p['anime_ids'][0]}/",
+                group_key=f"saved_search:{saved_search_id}",
+            ))
+    return create_notifications(notifications)
+
+
+def award_badges(user_ids, category, counts):
+    """
+    Award every badge of `category` whose requirement is met by `counts[user_id]`.
+    Returns the badge_earned notifications for newly awarded badges.
+    """
+    badges = list(Badge.objects.filter(category=category))
+    owned = set(
+        UserBadge.objects.filter(user_id__in=user_ids, badge__in=badges).values_list('user_id', 'badge_id')
+    )
+
+    earned = defaultdict(int)
+    notifications = []
+    for user_id in user_ids:
+        for badge in badges:
+            if badge.requirement_value > counts.get(user_id, 0) or (user_id, badge.id) in owned:
+                continue
+            # Awards are rare, so one get_or_create each; unlike bulk_create(ignore_conflicts=True)
+            # it says whether this call inserted the row or a concurrent drain beat it to it
+            _, created = UserBadge.objects.get_or_create(user_id=user_id, badge=badge)
+            if not created:
+                continue
+            earned[user_id] += 1
+            notifications.append(Notification(
+                recipient_id=user_id,
+                sender_id=user_id,  # System message essentially
                 notification_type='badge_earned',
                 message=f"🏆 You earned a new badge: {badge.name}!",
                 link=f"/users/profile/",
-            )
+            ))
+
+    leaderboards.record('badges', earned)
+    return notifications
+
+
+def award_entry_badges(user_ids):
+    """Evaluate anime_count and completed_count badges for the given users."""
+    counts = UserAnimeEntry.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    total_entries = {c['user_id']: c['total'] for c in counts}
+    completed_entries = {c['user_id']: c['completed'] for c in counts}
+
+    notifications = award_badges(user_ids, 'anime_count', total_entries)
+    notifications += award_badges(user_ids, 'completed_count', completed_entries)
+    return create_notifications(notifications)
+
+
+@outbox.handler('entry.saved')
+def check_anime_badges(payloads):
+    """Evaluate and award badges based on Anime count."""
+    return award_entry_badges({p['user_id'] for p in payloads})
+
 
-@receiver(post_save, sender=Review)
-def check_review_badges(sender, instance, created, **kwargs):
+@outbox.handler('list.imported')
+@outbox.handler('list.batch_updated')
+def check_imported_badges(payloads):
+    """Bulk imports and edits skip per-entry signals, so badges are evaluated once per batch."""
+    return award_entry_badges({p['user_id'] for p in payloads})
+
+
+@outbox.handler('review.created')
+def check_review_badges(payloads):
     """Evaluate and award badges based on Review count."""
-    user = instance.user
-    total_reviews = Review.objects.filter(user=user).count()
-    
-    review_badges = Badge.objects.filter(category='review_count', requirement_value__lte=total_reviews)
-    for badge in review_badges:
-        user_badge, awarded = UserBadge.objects.get_or_create(user=user, badge=badge)
-        if awarded:
-            Notification.objects.create(
-                recipient=user,
-                sender=user,
-                notification_type='badge_earned',
-                message=f"🏆 You earned a new badge: {badge.name}!",
-                link=f"/users/profile/",
-            )
+    user_ids = {p['user_id'] for p in payloads}
+    total_reviews = dict(
+        Review.objects.filter(user_id__in=user_ids).values('user_id')
+        .annotate(total=Count('id')).values_list('user_id', 'total')
+    )
+    return create_notifications(award_badges(user_ids, 'review_count', total_reviews))
+
+
+@outbox.handler('entry.saved')
+def update_taste_profiles(payloads):
+    from .taste import apply_taste_transitions, build_taste_profiles
+    # Only a save whose old status/score were unknown re-reads the user's whole
+    # list; events queued before `tracked` existed fall back to the old guess
+    unknown = {
+        p['user_id'] for p in payloads
+        if not p.get('tracked', p.get('stats') is not None or p.get('changes') is not None)
+    }
+    apply_taste_transitions([
+        (p['user_id'], p['anime_id'], *p['stats'])
+        for p in payloads if p.get('stats') and p['user_id'] not in unknown
+    ])
+    if unknown:
+        build_taste_profiles(unknown)
+
+
+@outbox.handler('entry.deleted')
+def remove_from_taste_profiles(payloads):
+    from .taste import apply_taste_transitions
+    apply_taste_transitions([(p['user_id'], p['anime_id'], p['status'], p['score'], None, 0) for p in payloads])
+
+
+@outbox.handler('list.imported')
+@outbox.handler('list.batch_updated')
+def rebuild_taste_profiles(payloads):
+    from .taste import build_taste_profiles
+    build_taste_profiles({p['user_id'] for p in payloads})
+
+
+@outbox.handler('entry.saved')
+def record_entry_events(payloads):
+    events = EntryEvent.objects.bulk_create([
+        EntryEvent(
+            user_id=p['user_id'],
+            anime_id=p['anime_id'],
+            status=p['changes'][0],
+            score_delta=p['changes'][1],
+            episode_delta=p['changes'][2],
+            created_at=datetime.datetime.fromisoformat(p['at']),
+        )
+        for p in payloads if p.get('changes')
+    ])
+    record_episode_deltas(events)
+
+
+@outbox.handler('entry.progressed')
+def record_progress_events(payloads):
+    # A burst of "+1" clicks on one title becomes a single event
+    clicks = defaultdict(list)
+    for p in payloads:
+        clicks[(p['user_id'], p['anime_id'])].append(p['at'])
+    events = EntryEvent.objects.bulk_create([
+        EntryEvent(
+            user_id=user_id,
+            anime_id=anime_id,
+            episode_delta=len(times),
+            created_at=datetime.datetime.fromisoformat(max(times)),
+        )
+        for (user_id, anime_id), times in clicks.items()
+    ])
+    record_episode_deltas(events)
+
+
+def record_episode_deltas(events):
+    episodes = defaultdict(int)
+    for event in events:
+        episodes[event.user_id] += event.episode_delta
+    leaderboards.record('episodes', episodes)
+
+
+@outbox.handler('entry.saved')
+@outbox.handler('entry.deleted')
+def expire_friends_watching(payloads):
+    social.bump_entries_versions(p['anime_id'] for p in payloads)
+
+
+@outbox.handler('entry.saved')
+def add_to_list_sets(payloads):
+    membership.add_to_sets((p['user_id'], p['anime_id']) for p in payloads)
+
+
+@outbox.handler('entry.deleted')
+def remove_from_list_sets(payloads):
+    membership.remove_from_sets((p['user_id'], p['anime_id']) for p in payloads)
+
+
+@receiver(post_delete, sender=UserAnimeEntry)
+def record_list_tombstone(sender, instance, origin=None, **kwargs):
+    # Written in the deleting transaction so its sequence value stays in order;
+    # nothing to sync when the whole account is going away
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    ListTombstone.objects.create(
+        user_id=instance.user_id,
+        anime_id=instance.anime_id,
+        change_seq=ListSequence.reserve(instance.user_id),
+    )
+
+
+@receiver(post_delete, sender=Review)
+def track_review_deletion(sender, instance, **kwargs):
+    outbox.publish('review.deleted', user_id=instance.user_id, created_at=instance.created_at.isoformat())
+
+
+@outbox.handler('review.created')
+def count_new_reviews(payloads):
+    reviews = defaultdict(int)
+    for p in payloads:
+        reviews[p['user_id']] += 1
+    leaderboards.record('reviews', reviews)
+
+
+@outbox.handler('review.deleted')
+def uncount_deleted_reviews(payloads):
+    # Take the review off the windows it was counted in
+    for p in payloads:
+        leaderboards.record('reviews', {p['user_id']: -1}, at=datetime.datetime.fromisoformat(p['created_at']))
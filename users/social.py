@@ -0,0 +1,94 @@
+"""
+"Friends watching this" for anime detail pages.
+
+The viewer's following ids are cached as a packed int array, and the page does
+one indexed lookup on UserAnimeEntry (anime_id, user) restricted to those ids.
+Results are cached per viewer and anime. The key carries a per-anime version
+(bumped from the outbox when entries change) and a digest of the following
+set, so follows and list edits show up on the next view without explicit
+deletes. Imports don't bump versions; their changes show up within
+FRIENDS_WATCHING_TTL.
+"""
+import hashlib
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow, UserAnimeEntry
+
+FOLLOWING_IDS_TTL = 3600
+FRIENDS_WATCHING_TTL = 600
+
+# Friends listed on the page; the count covers all of them
+FRIENDS_WATCHING_LIMIT = 12
+
+
+def following_ids(user_id):
+    """Ids of the users `user_id` follows, as a sorted array('q')."""
+    key = f'following_ids_{user_id}'
+    packed = cache.get(key)
+    if packed is None:
+        ids = array('q', sorted(Follow.objects.filter(user_id=user_id).values_list('following_id', flat=True)))
+        packed = ids.tobytes()
+        cache.set(key, packed, FOLLOWING_IDS_TTL)
+    return array('q', packed)
+
+
+def invalidate_following(user_id):
+    transaction.on_commit(lambda: cache.delete(f'following_ids_{user_id}'))
+
+
+def _entries_version(anime_id):
+    return cache.get(f'anime_entries_v_{anime_id}', 0)
+
+
+def bump_entries_versions(anime_ids):
+    anime_ids = set(anime_ids)
+
+    def _bump():
+        for anime_id in anime_ids:
+            key = f'anime_entries_v_{anime_id}'
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+
+    transaction.on_commit(_bump)
+
+
+def friends_watching(viewer_id, anime_id):
+    """
+    {'count': followed users with the anime in their list, 'friends': up to
+    FRIENDS_WATCHING_LIMIT of them as dicts with username, avatar_url, status
+    and score}, most recently updated first.
+    """
+    ids = following_ids(viewer_id)
+    if not ids:
+        return {'count': 0, 'friends': []}
+
+    digest = hashlib.md5(ids.tobytes()).hexdigest()[:12]
+    key = f'friends_watching_{viewer_id}_{anime_id}_{_entries_version(anime_id)}_{digest}'
+    result = cache.get(key)
+    if result is None:
+        entries = list(
+            UserAnimeEntry.objects.filter(anime_id=anime_id, user_id__in=ids.tolist())
+            .select_related('user__profile')
+            .only('status', 'score', 'updated_at', 'user__username', 'user__profile__image')
+            .order_by('-updated_at')
+        )
+        result = {
+            'count': len(entries),
+            'friends': [
+                {
+                    'username': entry.user.username,
+                    'avatar_url': entry.user.profile.avatar_url if hasattr(entry.user, 'profile') else '',
+                    'status': entry.status,
+                    'status_display': entry.get_status_display(),
+                    'score': entry.score,
+                }
+                for entry in entries[:FRIENDS_WATCHING_LIMIT]
+            ],
+        }
+        cache.set(key, result, FRIENDS_WATCHING_TTL)
+    return result
@@ -0,0 +1,83 @@
+"""
+Delta sync of a user's list for mobile/extension clients.
+
+Every entry write takes the next value of the owner's ListSequence, and every
+deletion leaves a ListTombstone with one. A client keeps the cursor from its
+last response and asks for what changed after it, so a sync costs what was
+edited, not the list size. Cursors are "<seq>.<unix time issued>"; a cursor
+older than the tombstone retention may have missed deletions, so it gets a 410
+and the client starts over without one.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ListTombstone, UserAnimeEntry
+
+SYNC_VERSION = 1
+PAGE_SIZE = getattr(settings, 'LIST_SYNC_PAGE_SIZE', 500)
+TOMBSTONE_DAYS = getattr(settings, 'LIST_SYNC_TOMBSTONE_DAYS', 90)
+
+ENTRY_FIELDS = ('anime_id', 'title', 'image_url', 'status', 'score', 'episodes_watched', 'updated_at')
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def parse_cursor(cursor):
+    """The sequence value a cursor points at (0 for a full sync)."""
+    if not cursor:
+        return 0
+    seq, _, issued = cursor.partition('.')
+    seq, issued = int(seq), int(issued or 0)
+    if time.time() - issued > TOMBSTONE_DAYS * 86400:
+        raise CursorExpired(cursor)
+    return seq
+
+
+def make_cursor(seq):
+    return f'{seq}.{int(time.time())}'
+
+
+def list_changes(user_id, since=0, limit=PAGE_SIZE):
+    """
+    One page of changes after `since`, oldest first: entries as rows of
+    ENTRY_FIELDS and deleted anime ids. Clients apply `deleted` before
+    `entries`, since a title can be removed and re-added within one page.
+    """
+    entries = list(
+        UserAnimeEntry.objects.filter(user_id=user_id, change_seq__gt=since)
+        .order_by('change_seq').values_list('change_seq', *ENTRY_FIELDS)[:limit + 1]
+    )
+    # A full sync starts from an empty list, so there is nothing to delete
+    tombstones = [] if not since else list(
+        ListTombstone.objects.filter(user_id=user_id, change_seq__gt=since)
+        .order_by('change_seq').values_list('change_seq', 'anime_id')[:limit + 1]
+    )
+
+    changes = sorted(
+        [(row[0], 'entry', row[1:]) for row in entries] + [(seq, 'deleted', anime_id) for seq, anime_id in tombstones],
+        key=lambda change: change[0],
+    )
+    page = changes[:limit]
+    return {
+        'version': SYNC_VERSION,
+        'cursor': make_cursor(page[-1][0] if page else since),
+        'has_more': len(changes) > limit,
+        'fields': ENTRY_FIELDS,
+        'entries': [
+            [*row[:-1], row[-1].isoformat()]
+            for _, kind, row in page if kind == 'entry'
+        ],
+        'deleted': [anime_id for _, kind, anime_id in page if kind == 'deleted'],
+    }
+
+
+def purge_tombstones(days=TOMBSTONE_DAYS):
+    """Drop tombstones older than the cursor lifetime. Returns the number deleted."""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = ListTombstone.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -1,4 +1,8 @@
+import tempfile
+
 from celery import shared_task
+from django.contrib.auth.models import User
+from django.core.files import File
 from django.core.mail import EmailMultiAlternatives
 
 @shared_task
@@ -14,3 +18,68 @@ def send_async_email(subject, recipient_email, text_content, html_content):
     )
     email.attach_alternative(html_content, "text/html")
     email.send()
+
+@shared_task
+def export_list_task(user_id, fmt, gzipped):
+    """
+    Background variant of the list export for lists too long to stream in a request.
+    Chunks are spooled to a temporary file (constant memory) and saved under a
+    random name in the private storage; the user is notified via the outbox with
+    a signed download link that expires after LIST_EXPORT_LINK_MAX_AGE.
+    """
+    import secrets
+    from django.core.files.storage import storages
+    from django.urls import reverse
+    from app import outbox
+    from .exporters import export_chunks, export_filename, export_token, gzip_chunks
+
+    user = User.objects.filter(id=user_id).first()
+    if user is None:
+        return
+
+    chunks = export_chunks(user, fmt)
+    if gzipped:
+        chunks = gzip_chunks(chunks)
+    else:
+        chunks = (chunk.encode('utf-8') for chunk in chunks)
+
+    filename = export_filename(user, fmt, gzipped)
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in chunks:
+            tmp.write(chunk)
+        tmp.seek(0)
+        name = storages['private'].save(f"exports/{user.id}/{secrets.token_urlsafe(16)}/{filename}", File(tmp))
+
+    url = reverse('download_export', args=[export_token(user.id, name, filename)])
+    outbox.publish('list.exported', user_id=user.id, url=url, format=fmt)
+
+@shared_task
+def build_similar_users_task():
+    """Nightly "users like you" ranking over every taste profile."""
+    from .taste import build_similar_users
+    return build_similar_users()
+
+@shared_task
+def rollup_entry_events_task():
+    """Fold recent EntryEvents into the monthly rollup table."""
+    from .history import rollup_entry_events
+    return rollup_entry_events()
+
+@shared_task
+def reconcile_leaderboards_task():
+    """Nightly rebuild of the Redis leaderboards from SQL."""
+    from .leaderboards import reconcile_leaderboards
+    return reconcile_leaderboards()
+
+
+@shared_task
+def purge_list_tombstones_task():
+    """Nightly: forget deletions older than the sync cursor lifetime."""
+    from .sync import purge_tombstones
+    return purge_tombstones()
+
+@shared_task
+def evaluate_saved_searches_task():
+    """Alert users to new matches for their saved searches, one query per distinct search."""
+    from .alerts import evaluate_saved_searches
+    return evaluate_saved_searches()
@@ -0,0 +1,246 @@
+"""
+Per-user taste vectors and compatibility scores.
+
+A TasteProfile holds genre/studio weights (every watched title adds its rating
+/ 10, so favourites count more than drops) and a bitset of watched MAL ids.
+Single entry changes from the outbox are applied to the stored profile as
+deltas; imports, batch edits and users without a profile yet get a full
+rebuild from their list. Profile views compare two small rows instead of
+joining both anime lists:
+compatibility is the cosine of the weight vectors, and shared titles come from
+a popcount over the bitsets.
+"""
+from collections import defaultdict
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+
+from app.models import AnimeMetadata
+from app.recommender import entry_rating
+from .models import TasteProfile, UserAnimeEntry
+
+SIMILAR_USERS_LIMIT = getattr(settings, 'TASTE_SIMILAR_USERS', 10)
+
+# Profiles compared per block in the batch job; bounds the dense block to
+# BLOCK_SIZE x n_users float32 values
+BLOCK_SIZE = 256
+
+
+def encode_bitset(anime_ids):
+    if not anime_ids:
+        return b''
+    bits = np.zeros(max(anime_ids) + 1, dtype=bool)
+    bits[list(anime_ids)] = True
+    return np.packbits(bits).tobytes()
+
+
+def _padded(a, b):
+    a, b = np.frombuffer(bytes(a), dtype=np.uint8), np.frombuffer(bytes(b), dtype=np.uint8)
+    size = max(len(a), len(b))
+    return np.pad(a, (0, size - len(a))), np.pad(b, (0, size - len(b)))
+
+
+def _with_bits(data, added, removed):
+    """The bitset `data` with the `added` ids set and the `removed` ids cleared."""
+    bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+    bits = np.pad(bits, (0, max(0, max(added, default=-1) + 1 - len(bits))))
+    bits[list(added)] = 1
+    bits[[anime_id for anime_id in removed if anime_id < len(bits)]] = 0
+    return np.packbits(bits).tobytes()
+
+
+def _weight(status, score):
+    """What one list entry adds to its owner's weights; None if it isn't a watched title."""
+    if status is None or status == 'plan_to_watch':
+        return None
+    return entry_rating(score, status) / 10
+
+
+def _rounded(weights):
+    return {name: round(weight, 2) for name, weight in weights.items() if round(weight, 2)}
+
+
+def apply_taste_transitions(transitions):
+    """
+    Apply [(user_id, anime_id, old status, old score, new status, new score)]
+    to the stored profiles (status None: not in the list). Users without a
+    profile yet get a full build instead.
+    """
+    changes = defaultdict(list)
+    for user_id, anime_id, old_status, old_score, new_status, new_score in transitions:
+        old, new = _weight(old_status, old_score), _weight(new_status, new_score)
+        if old != new:
+            changes[user_id].append((anime_id, old, new))
+    if not changes:
+        return
+
+    metadata = {
+        mal_id: (genres, studios)
+        for mal_id, genres, studios in AnimeMetadata.objects.filter(
+            mal_id__in={anime_id for rows in changes.values() for anime_id, _, _ in rows}
+        ).values_list('mal_id', 'genres', 'studios')
+    }
+    with transaction.atomic():
+        # Lock in a fixed order so concurrent drains can't deadlock
+        profiles = list(
+            TasteProfile.objects.select_for_update().filter(user_id__in=changes).order_by('user_id')
+        )
+        for profile in profiles:
+            genres, studios = defaultdict(float, profile.genres), defaultdict(float, profile.studios)
+            added, removed = set(), set()
+            for anime_id, old, new in changes[profile.user_id]:
+                delta = (new or 0.0) - (old or 0.0)
+                anime_genres, anime_studios = metadata.get(anime_id, ((), ()))
+                for genre in anime_genres:
+                    genres[genre] += delta
+                for studio in anime_studios:
+                    studios[studio] += delta
+                if old is None:
+                    added.add(anime_id)
+                    removed.discard(anime_id)
+                    profile.entry_count += 1
+                elif new is None:
+                    removed.add(anime_id)
+                    added.discard(anime_id)
+                    profile.entry_count -= 1
+            profile.genres, profile.studios = _rounded(genres), _rounded(studios)
+            profile.watched = _with_bits(profile.watched, added, removed)
+        TasteProfile.objects.bulk_update(profiles, ['genres', 'studios', 'watched', 'entry_count', 'updated_at'])
+
+    missing = set(changes) - {profile.user_id for profile in profiles}
+    if missing:
+        build_taste_profiles(missing)
+
+
+def build_taste_profiles(user_ids):
+    """Recompute the taste profiles of `user_ids` from their lists."""
+    user_ids = list(user_ids)
+    entries = defaultdict(list)
+    for user_id, anime_id, score, status in (
+        UserAnimeEntry.objects.filter(user_id__in=user_ids).exclude(status='plan_to_watch')
+        .values_list('user_id', 'anime_id', 'score', 'status')
+    ):
+        entries[user_id].append((anime_id, entry_rating(score, status) / 10))
+
+    metadata = {
+        mal_id: (genres, studios)
+        for mal_id, genres, studios in AnimeMetadata.objects.filter(
+            mal_id__in={anime_id for rows in entries.values() for anime_id, _ in rows}
+        ).values_list('mal_id', 'genres', 'studios')
+    }
+
+    profiles = []
+    for user_id in user_ids:
+        genres, studios = defaultdict(float), defaultdict(float)
+        for anime_id, weight in entries[user_id]:
+            anime_genres, anime_studios = metadata.get(anime_id, ((), ()))
+            for genre in anime_genres:
+                genres[genre] += weight
+            for studio in anime_studios:
+                studios[studio] += weight
+        profiles.append(TasteProfile(
+            user_id=user_id,
+            genres=_rounded(genres),
+            studios=_rounded(studios),
+            watched=encode_bitset([anime_id for anime_id, _ in entries[user_id]]),
+            entry_count=len(entries[user_id]),
+        ))
+
+    TasteProfile.objects.bulk_create(
+        profiles,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['genres', 'studios', 'watched', 'entry_count', 'updated_at'],
+    )
+
+
+def _features(profile):
+    features = {f"g:{name}": weight for name, weight in profile.genres.items()}
+    features.update({f"s:{name}": weight for name, weight in profile.studios.items()})
+    return features
+
+
+def compatibility(a, b):
+    """
+    Compare two TasteProfiles. Returns {'percent': cosine of the taste weights
+    as 0-100, 'shared': number of titles both watched, 'jaccard': overlap of the
+    watched sets}.
+    """
+    features_a, features_b = _features(a), _features(b)
+    keys = list(features_a.keys() | features_b.keys())
+    vec_a = np.array([features_a.get(k, 0.0) for k in keys])
+    vec_b = np.array([features_b.get(k, 0.0) for k in keys])
+    norm = np.linalg.norm(vec_a) * np.linalg.norm(vec_b)
+    cosine = float(vec_a @ vec_b / norm) if norm else 0.0
+
+    bits_a, bits_b = _padded(a.watched, b.watched)
+    shared = int(np.unpackbits(bits_a & bits_b).sum())
+    union = int(np.unpackbits(bits_a | bits_b).sum())
+    return {
+        'percent': round(cosine * 100),
+        'shared': shared,
+        'jaccard': shared / union if union else 0.0,
+    }
+
+
+def shared_anime_ids(a, b):
+    """MAL ids both profiles watched, ascending."""
+    bits_a, bits_b = _padded(a.watched, b.watched)
+    return np.flatnonzero(np.unpackbits(bits_a & bits_b)).tolist()
+
+
+def build_similar_users(limit=SIMILAR_USERS_LIMIT):
+    """
+    Batch job: rank "users like you" for everyone by taste cosine and store the
+    top `limit` per user in TasteProfile.similar_users. Returns profiles updated.
+    """
+    from django.contrib.auth.models import User
+
+    # Backfill users whose list predates taste profiles
+    missing = list(
+        User.objects.filter(taste_profile__isnull=True, anime_entries__isnull=False)
+        .distinct().values_list('id', flat=True)
+    )
+    for start in range(0, len(missing), 500):
+        build_taste_profiles(missing[start:start + 500])
+
+    profiles = list(TasteProfile.objects.filter(entry_count__gt=0).only('id', 'user_id', 'genres', 'studios'))
+    if not profiles:
+        return 0
+
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, profile in enumerate(profiles):
+        for feature, weight in _features(profile).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(feature, len(vocabulary)))
+            values.append(weight)
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(len(profiles), max(len(vocabulary), 1)),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = (sparse.diags((1.0 / norms).astype(np.float32)) @ matrix).tocsr()
+
+    user_ids = np.array([profile.user_id for profile in profiles])
+    k = min(limit, len(profiles) - 1)
+    for start in range(0, len(profiles), BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, len(profiles))
+        block = (matrix[start:end] @ matrix.T).toarray()
+        block[np.arange(end - start), np.arange(start, end)] = -1.0  # Never your own match
+
+        if k > 0:
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        for offset, profile in enumerate(profiles[start:end]):
+            profile.similar_users = [] if k <= 0 else [
+                [int(user_ids[idx]), round(float(score) * 100)]
+                for idx, score in zip(top[offset], top_scores[offset]) if score > 0
+            ]
+        TasteProfile.objects.bulk_update(profiles[start:end], ['similar_users'])
+    return len(profiles)
@@ -1,7 +1,13 @@
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Profile, Follow
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch, AsyncMock
+from .models import Profile, Follow, UserAnimeEntry, ImportJob, XP_PER_EPISODE
+from app.models import OutboxEvent
+from app.tasks import import_mal_xml_task, import_mal_username_task
 
 class UserModelTest(TestCase):
     def test_profile_created_on_user_creation(self):
@@ -51,3 +57,840 @@ class UserViewsTest(TestCase):
         response = self.client.get(reverse('unfollow_user', args=['otheruser']))
         self.assertEqual(response.status_code, 302)
         self.assertFalse(Follow.objects.filter(user=self.user, following=self.other_user).exists())
+
+
+MAL_EXPORT = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<myanimelist>
+    <myinfo><user_name>tester</user_name></myinfo>
+    <anime>
+        <series_animedb_id>1</series_animedb_id>
+        <series_title>Cowboy Bebop</series_title>
+        <my_watched_episodes>26</my_watched_episodes>
+        <my_score>10</my_score>
+        <my_status>Completed</my_status>
+    </anime>
+    <anime>
+        <series_animedb_id>5</series_animedb_id>
+        <series_title>Cowboy Bebop: Tengoku no Tobira</series_title>
+        <my_watched_episodes>0</my_watched_episodes>
+        <my_score>0</my_score>
+        <my_status>Plan to Watch</my_status>
+    </anime>
+    <anime>
+        <series_animedb_id>not-a-number</series_animedb_id>
+    </anime>
+</myanimelist>
+"""
+
+
+@patch('app.tasks.outbox.send_group_messages')
+class XMLImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Cowboy Bebop', status='watching', episodes_watched=3)
+        OutboxEvent.objects.all().delete()
+
+    def run_import(self):
+        job = ImportJob.objects.create(user=self.user, source='mal_xml', file=ContentFile(MAL_EXPORT, name='list.xml'))
+        import_mal_xml_task(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_import_upserts_in_bulk_without_per_entry_signals(self, mock_send):
+        job = self.run_import()
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.processed, 2)
+        entry = UserAnimeEntry.objects.get(user=self.user, anime_id=1)
+        self.assertEqual((entry.status, entry.episodes_watched, entry.score), ('completed', 26, 10))
+        self.assertTrue(UserAnimeEntry.objects.filter(user=self.user, anime_id=5, status='plan_to_watch').exists())
+        self.assertEqual(list(OutboxEvent.objects.values_list('topic', flat=True)), ['list.imported'])
+
+    def test_import_reports_progress_over_socket(self, mock_send):
+        job = self.run_import()
+
+        sent = [call.args[0][0] for call in mock_send.call_args_list]
+        self.assertTrue(all(group == f'user_{self.user.id}_notifications' for group, _ in sent))
+        self.assertEqual(sent[-1][1]['status'], 'completed')
+        self.assertEqual(sent[-1][1]['processed'], job.processed)
+
+    @patch('app.tasks.import_mal_xml_task.delay')
+    def test_upload_queues_background_job(self, mock_delay, mock_send):
+        self.client.login(username='testuser', password='password123')
+        upload = SimpleUploadedFile('animelist.xml', MAL_EXPORT, content_type='text/xml')
+
+        response = self.client.post(reverse('import_list'), {'xml_file': upload})
+
+        self.assertEqual(response.status_code, 302)
+        job = ImportJob.objects.get(user=self.user)
+        mock_delay.assert_called_once_with(job.id)
+        job.file.delete()
+
+
+def jikan_animelist_page(page, last_page, anime_ids):
+    return {
+        'pagination': {'last_visible_page': last_page, 'has_next_page': page < last_page},
+        'data': [
+            {
+                'anime': {'mal_id': anime_id, 'title': f'Anime {anime_id}', 'images': {'jpg': {'image_url': ''}}},
+                'watching_status': 2,
+                'score': 8,
+                'episodes_watched': 12,
+            }
+            for anime_id in anime_ids
+        ],
+    }
+
+
+@patch('app.tasks.outbox.send_group_messages')
+class MALUsernameImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.pages = {
+            1: jikan_animelist_page(1, 3, [1, 2]),
+            2: jikan_animelist_page(2, 3, [3, 4]),
+            3: jikan_animelist_page(3, 3, [5]),
+        }
+        self.requested = []
+
+    async def fake_request_jikan(self, client, url, retries=2):
+        page = int(url.rsplit('page=', 1)[1])
+        self.requested.append(page)
+        return 200, self.pages[page]
+
+    def test_resumes_from_checkpoint(self, mock_send):
+        job = ImportJob.objects.create(user=self.user, source='mal_username', mal_username='tester', last_page=1, processed=2)
+
+        with patch('app.services.request_jikan', side_effect=self.fake_request_jikan):
+            import_mal_username_task(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(sorted(self.requested), [2, 3])
+        self.assertEqual((job.status, job.last_page, job.total_pages, job.processed), ('completed', 3, 3, 5))
+        self.assertEqual(UserAnimeEntry.objects.filter(user=self.user).count(), 3)
+
+    def test_rerun_is_idempotent(self, mock_send):
+        for _ in range(2):
+            job = ImportJob.objects.create(user=self.user, source='mal_username', mal_username='tester')
+            with patch('app.services.request_jikan', side_effect=self.fake_request_jikan):
+                import_mal_username_task(job.id)
+
+        self.assertEqual(UserAnimeEntry.objects.filter(user=self.user, status='completed').count(), 5)
+
+    def test_unknown_user_fails_without_retrying(self, mock_send):
+        job = ImportJob.objects.create(user=self.user, source='mal_username', mal_username='nobody')
+
+        with patch('app.services.request_jikan', new_callable=AsyncMock, return_value=(404, None)):
+            import_mal_username_task(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.last_page, 0)
+
+
+class ListExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Cowboy Bebop & Co', status='completed', episodes_watched=26, score=10)
+        UserAnimeEntry.objects.create(user=self.user, anime_id=5, title='Trigun', status='plan_to_watch')
+        self.client.login(username='testuser', password='password123')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_list'), params)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        return b''.join(response.streaming_content)
+
+    def test_wsgi_export_streams_incrementally(self):
+        from .exporters import ROWS_PER_WRITE
+        UserAnimeEntry.objects.bulk_create(
+            UserAnimeEntry(user=self.user, anime_id=anime_id, title=f'Anime {anime_id}', status='completed')
+            for anime_id in range(100, 100 + 2 * ROWS_PER_WRITE)
+        )
+        response = self.client.get(reverse('export_list'), {'format': 'ndjson'})
+
+        chunks = iter(response.streaming_content)
+        # The first chunk is out before most rows are read
+        first = len(next(chunks).splitlines())
+        self.assertLessEqual(first, ROWS_PER_WRITE)
+        self.assertEqual(first + len(b''.join(chunks).splitlines()), 2 * ROWS_PER_WRITE + 2)
+
+    def test_asgi_export_streams_an_async_generator(self):
+        async def read():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(reverse('export_list'), {'format': 'ndjson'})
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len(async_to_sync(read)().splitlines()), 2)
+
+    @patch('app.tasks.outbox.send_group_messages')
+    def test_xml_export_round_trips_through_import(self, mock_send):
+        from django.core.files.storage import storages
+        other = User.objects.create_user(username='other', password='password123')
+        job = ImportJob.objects.create(user=other, source='mal_xml', file=ContentFile(self.export(format='xml'), name='list.xml'))
+        self.assertTrue(storages['private'].exists(job.file.name))
+
+        import_mal_xml_task(job.id)
+
+        imported = UserAnimeEntry.objects.filter(user=other).order_by('anime_id')
+        self.assertEqual(
+            list(imported.values_list('anime_id', 'title', 'status', 'episodes_watched', 'score')),
+            [(1, 'Cowboy Bebop & Co', 'completed', 26, 10), (5, 'Trigun', 'plan_to_watch', 0, 0)],
+        )
+        job.file.delete()
+
+    def test_gzipped_csv_export(self):
+        import csv, gzip, io
+        rows = list(csv.reader(io.StringIO(gzip.decompress(self.export(format='csv', gzip='1')).decode())))
+
+        self.assertEqual(rows[0][:3], ['anime_id', 'title', 'status'])
+        self.assertEqual([row[0] for row in rows[1:]], ['1', '5'])
+
+    def test_ndjson_export(self):
+        import json
+        records = [json.loads(line) for line in self.export(format='ndjson').decode().splitlines()]
+
+        self.assertEqual([r['anime_id'] for r in records], [1, 5])
+        self.assertEqual(records[0]['title'], 'Cowboy Bebop & Co')
+
+    @patch('users.tasks.export_list_task.delay')
+    def test_large_list_is_exported_in_background(self, mock_delay):
+        with self.settings(LIST_EXPORT_STREAM_LIMIT=1):
+            response = self.client.get(reverse('export_list'), {'format': 'csv'})
+
+        self.assertEqual(response.status_code, 302)
+        mock_delay.assert_called_once_with(self.user.id, 'csv', False)
+
+    def test_background_export_is_private_behind_a_signed_link(self):
+        from django.core.files.storage import storages
+        from users.exporters import read_export_token
+        from users.tasks import export_list_task
+        OutboxEvent.objects.all().delete()
+
+        export_list_task(self.user.id, 'ndjson', False)
+
+        url = OutboxEvent.objects.get(topic='list.exported').payload['url']
+        _, name, _ = read_export_token(url.rstrip('/').rsplit('/', 1)[1])
+        self.addCleanup(storages['private'].delete, name)
+        response = self.client.get(url)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2)
+
+        User.objects.create_user(username='other', password='password123')
+        self.client.login(username='other', password='password123')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.settings(LIST_EXPORT_LINK_MAX_AGE=-1):
+            self.client.login(username='testuser', password='password123')
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@patch('app.outbox.send_group_messages')
+class TasteProfileTest(TestCase):
+    def setUp(self):
+        from app.models import AnimeMetadata
+        AnimeMetadata.objects.create(mal_id=1, title='Bebop', genres=['Action', 'Sci-Fi'], studios=['Sunrise'])
+        AnimeMetadata.objects.create(mal_id=2, title='Gundam', genres=['Sci-Fi', 'Mecha'], studios=['Sunrise'])
+        AnimeMetadata.objects.create(mal_id=3, title='K-On', genres=['Slice of Life'], studios=['Kyoto Animation'])
+        self.lists = {
+            'alice': {1: 10, 2: 8},
+            'bob': {1: 9, 2: 9},
+            'carol': {3: 10},
+        }
+        self.users = {}
+        for username, scores in self.lists.items():
+            self.users[username] = User.objects.create_user(username=username, password='password123')
+            for anime_id, score in scores.items():
+                UserAnimeEntry.objects.create(user=self.users[username], anime_id=anime_id, title=f'Anime {anime_id}', status='completed', score=score)
+
+    def taste(self, username):
+        from .models import TasteProfile
+        return TasteProfile.objects.get(user=self.users[username])
+
+    def test_profiles_follow_list_changes(self, mock_send):
+        from app.outbox import drain
+        drain()
+
+        alice = self.taste('alice')
+        self.assertEqual(alice.entry_count, 2)
+        self.assertEqual(alice.genres, {'Action': 1.0, 'Sci-Fi': 1.8, 'Mecha': 0.8})
+
+        UserAnimeEntry.objects.create(user=self.users['alice'], anime_id=3, title='Anime 3', status='dropped')
+        drain()
+        self.assertEqual(self.taste('alice').entry_count, 3)
+
+    def test_entry_changes_apply_as_deltas(self, mock_send):
+        from app.outbox import drain
+        from .taste import build_taste_profiles, compatibility
+        drain()
+        gundam = UserAnimeEntry.objects.get(user=self.users['alice'], anime_id=2)
+        gundam.score = 4
+        gundam.save()
+        UserAnimeEntry.objects.get(user=self.users['alice'], anime_id=1).delete()
+
+        with patch('users.taste.build_taste_profiles') as mock_build:
+            drain()
+        mock_build.assert_not_called()
+
+        by_delta = self.taste('alice')
+        self.assertEqual((by_delta.entry_count, by_delta.genres), (1, {'Sci-Fi': 0.4, 'Mecha': 0.4}))
+        build_taste_profiles([self.users['alice'].id])
+        rebuilt = self.taste('alice')
+        self.assertEqual((rebuilt.genres, rebuilt.studios), (by_delta.genres, by_delta.studios))
+        self.assertEqual(compatibility(rebuilt, by_delta)['jaccard'], 1.0)
+
+    def test_untracked_field_edit_does_not_rebuild(self, mock_send):
+        from app.outbox import drain
+        drain()
+        entry = UserAnimeEntry.objects.get(user=self.users['alice'], anime_id=1)
+        entry.image_url = 'https://example.com/bebop.jpg'
+        entry.save()
+        UserAnimeEntry.objects.get(user=self.users['alice'], anime_id=2).save()
+
+        with patch('users.taste.build_taste_profiles') as mock_build:
+            drain()
+        mock_build.assert_not_called()
+        self.assertEqual(self.taste('alice').entry_count, 2)
+
+    def test_compatibility_and_shared_titles(self, mock_send):
+        from app.outbox import drain
+        from .taste import compatibility, shared_anime_ids
+        drain()
+
+        close = compatibility(self.taste('alice'), self.taste('bob'))
+        far = compatibility(self.taste('alice'), self.taste('carol'))
+
+        self.assertGreater(close['percent'], 90)
+        self.assertEqual(far['percent'], 0)
+        self.assertEqual((close['shared'], close['jaccard']), (2, 1.0))
+        self.assertEqual(shared_anime_ids(self.taste('alice'), self.taste('bob')), [1, 2])
+
+    def test_batch_ranks_users_like_you(self, mock_send):
+        from .taste import build_similar_users
+        # No drain: the batch backfills missing profiles itself
+        build_similar_users()
+
+        self.assertEqual([uid for uid, _ in self.taste('alice').similar_users], [self.users['bob'].id])
+        self.assertEqual(self.taste('carol').similar_users, [])
+
+    def test_profile_shows_compatibility(self, mock_send):
+        from app.outbox import drain
+        drain()
+        self.client.login(username='alice', password='password123')
+
+        response = self.client.get(reverse('public_profile', args=['bob']))
+
+        self.assertEqual(response.context['compatibility']['shared'], 2)
+        self.assertContains(response, f"{response.context['compatibility']['percent']}% match")
+
+
+@patch('app.outbox.send_group_messages')
+class EntryEventTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', password='password123')
+
+    def events(self):
+        from .models import EntryEvent
+        return list(EntryEvent.objects.order_by('id').values_list('anime_id', 'status', 'score_delta', 'episode_delta'))
+
+    def test_saves_log_deltas(self, mock_send):
+        from app.outbox import drain
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Bebop', status='watching', episodes_watched=3)
+        entry = UserAnimeEntry.objects.get(user=self.user, anime_id=1)
+        entry.episodes_watched = 5
+        entry.save()
+        entry.save()  # No change, no event
+        entry.status, entry.score = 'completed', 9
+        entry.save()
+        drain()
+
+        self.assertEqual(self.events(), [(1, 'watching', 0, 3), (1, '', 0, 2), (1, 'completed', 9, 0)])
+
+    def test_imports_log_deltas(self, mock_send):
+        from app.tasks import bulk_upsert_entries
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Bebop', status='watching', episodes_watched=3)
+
+        bulk_upsert_entries(self.user.id, [
+            {'anime_id': 1, 'title': 'Bebop', 'status': 'completed', 'score': 10, 'episodes_watched': 26},
+            {'anime_id': 5, 'title': 'Trigun', 'status': 'plan_to_watch', 'score': 0, 'episodes_watched': 0},
+        ], ['status', 'score', 'episodes_watched'])
+
+        self.assertEqual(sorted(self.events()), [(1, 'completed', 10, 23), (5, 'plan_to_watch', 0, 0)])
+
+    def test_monthly_rollup_is_idempotent(self, mock_send):
+        import datetime
+        from django.utils import timezone
+        from .models import EntryEvent, EntryMonthlyRollup
+        from .history import rollup_entry_events, monthly_episodes
+        march = timezone.make_aware(datetime.datetime(2025, 3, 10))
+        EntryEvent.objects.bulk_create([
+            EntryEvent(user=self.user, anime_id=1, status='watching', episode_delta=4, created_at=march),
+            EntryEvent(user=self.user, anime_id=1, status='completed', episode_delta=8, created_at=march + datetime.timedelta(days=5)),
+            EntryEvent(user=self.user, anime_id=2, episode_delta=2, created_at=march + datetime.timedelta(days=30)),
+        ])
+
+        rollup_entry_events(since=march)
+        rollup_entry_events(since=march)
+
+        self.assertEqual(EntryMonthlyRollup.objects.count(), 2)
+        self.assertEqual(
+            list(EntryMonthlyRollup.objects.values_list('episodes', 'completed', 'started', 'events')),
+            [(12, 1, 1, 2), (2, 0, 0, 1)],
+        )
+        self.assertEqual(monthly_episodes(self.user.id, 2025)[2:4], [12, 2])
+
+    def test_baseline_events_stay_out_of_windows(self, mock_send):
+        from django.utils import timezone
+        from .models import EntryEvent, EntryMonthlyRollup
+        from .history import rollup_entry_events
+        from .leaderboards import top
+        # What the event log was seeded with: a lifetime total dated at a recent edit
+        EntryEvent.objects.create(user=self.user, anime_id=1, status='completed', episode_delta=500, baseline=True)
+
+        rollup_entry_events(since=timezone.now())
+
+        self.assertFalse(EntryMonthlyRollup.objects.exists())
+        self.assertEqual(top('episodes', 'week'), [])
+
+
+@patch('app.outbox.send_group_messages')
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        import datetime
+        from django.utils import timezone
+        from app.outbox import drain
+        from .models import EntryEvent
+        self.alice = User.objects.create_user(username='alice', password='password123')
+        self.bob = User.objects.create_user(username='bob', password='password123')
+        UserAnimeEntry.objects.create(user=self.alice, anime_id=1, title='Bebop', status='completed', episodes_watched=26)
+        UserAnimeEntry.objects.create(user=self.bob, anime_id=2, title='Trigun', status='watching', episodes_watched=5)
+        drain()
+        # Alice binged long ago; Bob is watching now
+        EntryEvent.objects.filter(user=self.alice).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        EntryEvent.objects.filter(user=self.bob).update(created_at=timezone.now())
+
+    def test_sql_fallback_windows(self, mock_send):
+        from .leaderboards import top
+
+        self.assertEqual(top('episodes', 'all'), [(self.alice.id, 26), (self.bob.id, 5)])
+        self.assertEqual(top('episodes', 'week'), [(self.bob.id, 5)])
+
+    def test_record_bumps_every_window(self, mock_send):
+        from unittest.mock import MagicMock
+        from .leaderboards import record
+        client = MagicMock()
+        with patch('users.leaderboards.get_redis', return_value=client), \
+                self.captureOnCommitCallbacks(execute=True):
+            record('reviews', {self.alice.id: 1, self.bob.id: 0})
+
+        keys = [c.args[0] for c in client.pipeline.return_value.zincrby.call_args_list]
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys[0], 'lb:reviews:all')
+        client.pipeline.return_value.execute.assert_called_once()
+
+    def test_set_without_sentinel_is_rebuilt_from_sql(self, mock_send):
+        from unittest.mock import MagicMock
+        from .leaderboards import RECONCILED, top
+        client = MagicMock()
+        # Only an increment reached this set, so it has no sentinel
+        client.pipeline.return_value.execute.return_value = [None, [(str(self.bob.id).encode(), 1.0)]]
+        with patch('users.leaderboards.get_redis', return_value=client):
+            rows = top('episodes', 'all')
+
+        self.assertEqual(rows, [(self.alice.id, 26), (self.bob.id, 5)])
+        client.pipeline.return_value.zadd.assert_called_once_with(
+            'lb:episodes:all', {RECONCILED: -1, str(self.alice.id): 26, str(self.bob.id): 5}
+        )
+
+    def test_badges_awarded_concurrently_are_not_counted_twice(self, mock_send):
+        from .models import Badge, UserBadge
+        from .signals import award_badges
+        badge = Badge.objects.create(name='First', description='', icon='fa-star', category='anime_count', requirement_value=1)
+        UserBadge.objects.create(user=self.alice, badge=badge)  # Another drain got there first
+
+        with patch.object(UserBadge.objects, 'filter') as owned, \
+                patch('users.signals.leaderboards.record') as record:
+            owned.return_value.values_list.return_value = []
+            notifications = award_badges([self.alice.id], 'anime_count', {self.alice.id: 1})
+
+        self.assertEqual(notifications, [])
+        record.assert_called_once_with('badges', {})
+
+    def test_view_renders_window(self, mock_send):
+        response = self.client.get(reverse('leaderboard') + '?window=week')
+
+        self.assertEqual(response.context['window'], 'week')
+        self.assertEqual([u.username for u in response.context['top_watchers']], ['bob'])
+        self.assertEqual(response.context['top_watchers'][0].total_episodes, 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'friends-watching-tests'}})
+@patch('app.outbox.send_group_messages')
+class FriendsWatchingTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.viewer = User.objects.create_user(username='viewer', password='password123')
+        self.friend = User.objects.create_user(username='friend', password='password123')
+        self.stranger = User.objects.create_user(username='stranger', password='password123')
+        Follow.objects.create(user=self.viewer, following=self.friend)
+        UserAnimeEntry.objects.create(user=self.friend, anime_id=1, title='Bebop', status='watching')
+        UserAnimeEntry.objects.create(user=self.stranger, anime_id=1, title='Bebop', status='completed')
+
+    def test_only_followed_users_with_status(self, mock_send):
+        from .social import friends_watching
+
+        result = friends_watching(self.viewer.id, 1)
+
+        self.assertEqual(result['count'], 1)
+        self.assertEqual([(f['username'], f['status']) for f in result['friends']], [('friend', 'watching')])
+        with self.assertNumQueries(0):
+            friends_watching(self.viewer.id, 1)
+
+    def test_follows_and_list_edits_show_up(self, mock_send):
+        from app.outbox import drain
+        from .social import friends_watching
+        friends_watching(self.viewer.id, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.viewer, following=self.stranger)
+        self.assertEqual(friends_watching(self.viewer.id, 1)['count'], 2)
+
+        entry = UserAnimeEntry.objects.get(user=self.friend, anime_id=1)
+        entry.status = 'dropped'
+        entry.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            drain()
+        self.assertIn(('friend', 'dropped'), [(f['username'], f['status']) for f in friends_watching(self.viewer.id, 1)['friends']])
+
+
+class ListStatusBatchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='grid', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Bebop', status='watching', score=8, episodes_watched=3)
+        UserAnimeEntry.objects.create(user=self.user, anime_id=5, title='Trigun', status='completed')
+        self.client.login(username='grid', password='password123')
+
+    def test_batch_returns_listed_titles_only(self):
+        response = self.client.get(reverse('get_user_anime_statuses'), {'ids': '1,2,5'})
+
+        self.assertEqual(response.json()['statuses'], {
+            '1': {'status': 'watching', 'score': 8, 'episodes_watched': 3},
+            '5': {'status': 'completed', 'score': 0, 'episodes_watched': 0},
+        })
+
+    def test_rejects_oversized_and_bad_batches(self):
+        from .membership import BATCH_LIMIT
+        ids = ','.join(str(i) for i in range(BATCH_LIMIT + 1))
+        self.assertEqual(self.client.get(reverse('get_user_anime_statuses'), {'ids': ids}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('get_user_anime_statuses'), {'ids': 'x'}).status_code, 400)
+
+    def test_membership_set_skips_sql_for_unlisted_ids(self):
+        from unittest.mock import MagicMock
+        from .membership import list_statuses
+        client = MagicMock()
+        client.smismember.return_value = [1, 0, 0]  # Loaded; neither id is listed
+        with patch('users.membership.get_redis', return_value=client), self.assertNumQueries(0):
+            self.assertEqual(list_statuses(self.user.id, [2, 3]), {})
+        client.smismember.assert_called_once_with(f'list:{self.user.id}', [0, 2, 3])
+
+
+class ListSyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', password='password123')
+        self.client.login(username='syncer', password='password123')
+        for anime_id in (1, 2, 3):
+            UserAnimeEntry.objects.create(user=self.user, anime_id=anime_id, title=f'Anime {anime_id}')
+
+    def sync(self, cursor='', **params):
+        return self.client.get(reverse('list_sync'), {'cursor': cursor, **params}).json()
+
+    def test_full_then_delta(self):
+        full = self.sync()
+        self.assertEqual([row[0] for row in full['entries']], [1, 2, 3])
+        self.assertFalse(full['has_more'])
+
+        entry = UserAnimeEntry.objects.get(user=self.user, anime_id=2)
+        entry.status = 'watching'
+        entry.save(update_fields=['status'])
+        UserAnimeEntry.objects.get(user=self.user, anime_id=3).delete()
+
+        delta = self.sync(full['cursor'])
+        self.assertEqual([(row[0], row[3]) for row in delta['entries']], [(2, 'watching')])
+        self.assertEqual(delta['deleted'], [3])
+        self.assertEqual(self.sync(delta['cursor'])['entries'], [])
+
+    def test_pages_follow_the_sequence(self):
+        first = self.sync(limit=2)
+        second = self.sync(first['cursor'], limit=2)
+
+        self.assertTrue(first['has_more'])
+        self.assertEqual([row[0] for row in first['entries'] + second['entries']], [1, 2, 3])
+        self.assertFalse(second['has_more'])
+
+    def test_imports_take_sequence_values(self):
+        from app.tasks import bulk_upsert_entries
+        cursor = self.sync()['cursor']
+        bulk_upsert_entries(self.user.id, [
+            {'anime_id': 1, 'title': 'Anime 1', 'status': 'completed', 'score': 9, 'episodes_watched': 12},
+            {'anime_id': 4, 'title': 'Anime 4', 'status': 'watching', 'score': 0, 'episodes_watched': 1},
+        ], ['status', 'score', 'episodes_watched'])
+
+        self.assertEqual(sorted(row[0] for row in self.sync(cursor)['entries']), [1, 4])
+
+    def test_expired_cursor_asks_for_resync(self):
+        response = self.client.get(reverse('list_sync'), {'cursor': '3.1000'})
+
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['resync'])
+
+
+@patch('app.outbox.send_group_messages')
+class BatchListEditTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', password='password123')
+        self.client.login(username='bulk', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Bebop', status='watching', score=7, episodes_watched=10)
+        from app.outbox import drain
+        drain()
+        Profile.objects.filter(user=self.user).update(xp=0, level=1)
+
+    def post(self, changes):
+        import json
+        return self.client.post(reverse('batch-update-status'), json.dumps({'changes': changes}), content_type='application/json')
+
+    def test_applies_changes_with_one_activity_and_xp(self, mock_send):
+        from app.models import Activity
+        from app.outbox import drain
+        response = self.post([
+            {'anime_id': 1, 'status': 'completed', 'episodes_watched': 26},
+            {'anime_id': 2, 'status': 'completed', 'episodes_watched': 12, 'title': 'Trigun'},
+        ])
+        drain()
+
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(
+            sorted(UserAnimeEntry.objects.filter(user=self.user).values_list('anime_id', 'title', 'status', 'score', 'episodes_watched')),
+            [(1, 'Bebop', 'completed', 7, 26), (2, 'Trigun', 'completed', 0, 12)],
+        )
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.xp, profile.level), (280, 2))
+        self.assertEqual(list(Activity.objects.filter(activity_type='list_batch').values_list('anime_title', flat=True)), ['2 anime'])
+        self.assertEqual(Activity.objects.count(), 2)  # Plus the setUp entry's own
+
+    def test_query_count_does_not_grow_with_batch_size(self, mock_send):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        counts = []
+        for start, size in ((10, 2), (100, 40)):
+            with CaptureQueriesContext(connection) as queries:
+                self.post([{'anime_id': anime_id, 'status': 'completed', 'episodes_watched': 1} for anime_id in range(start, start + size)])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_changes_write_nothing(self, mock_send):
+        response = self.post([{'anime_id': 1, 'status': 'completed'}, {'anime_id': 3}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserAnimeEntry.objects.get(user=self.user, anime_id=1).status, 'watching')
+
+
+@patch('app.outbox.send_group_messages')
+class QuickEpisodeUpdateTest(TestCase):
+    def setUp(self):
+        from app.outbox import drain
+        self.user = User.objects.create_user(username='binger', password='password123')
+        self.client.login(username='binger', password='password123')
+        UserAnimeEntry.objects.create(user=self.user, anime_id=1, title='Bebop', status='watching', episodes_watched=3)
+        drain()
+
+    def click(self, anime_id=1):
+        return self.client.post(reverse('quick_update_anime_episode', args=[anime_id]))
+
+    def test_increments_with_xp_and_sync_sequence(self, mock_send):
+        seq = UserAnimeEntry.objects.get(user=self.user, anime_id=1).change_seq
+
+        response = self.click()
+
+        self.assertEqual(response.content, b'4 eps')
+        entry = UserAnimeEntry.objects.get(user=self.user, anime_id=1)
+        self.assertGreater(entry.change_seq, seq)
+        self.assertEqual(Profile.objects.get(user=self.user).xp, 10)
+        self.assertEqual(self.click(anime_id=99).status_code, 400)
+
+    def test_clicks_are_coalesced(self, mock_send):
+        from app.models import Activity
+        from app.outbox import drain
+        from .models import EntryEvent
+        events, activities = EntryEvent.objects.count(), Activity.objects.count()
+        for _ in range(3):
+            self.click()
+        drain()
+
+        self.assertEqual(EntryEvent.objects.count(), events + 1)
+        self.assertEqual(EntryEvent.objects.latest('id').episode_delta, 3)
+        self.assertEqual(Activity.objects.count(), activities)  # The save in setUp already made one this hour
+
+
+@patch('app.outbox.send_group_messages')
+class SavedSearchAlertTest(TestCase):
+    def setUp(self):
+        from app.models import AnimeMetadata
+        from .models import SavedSearch
+        self.users = [User.objects.create_user(username=f'fan{i}', password='password123') for i in range(3)]
+        # Two spellings of one query and an unrelated one
+        SavedSearch.objects.create(user=self.users[0], name='Mecha', params={'q': 'Gundam ', 'genres': '18,1'})
+        SavedSearch.objects.create(user=self.users[1], name='gundams', params={'q': 'gundam', 'genres': [1, 18]})
+        SavedSearch.objects.create(user=self.users[2], name='Empty', params={'q': ''})
+        for mal_id in range(1, 6):
+            AnimeMetadata.objects.create(mal_id=mal_id, title=f'Gundam {mal_id}', genre_ids=[1, 18], score=mal_id)
+
+    def add_anime(self, mal_id):
+        from app.models import AnimeMetadata
+        AnimeMetadata.objects.create(mal_id=mal_id, title=f'Gundam {mal_id}', genre_ids=[1, 18], score=9)
+
+    def test_one_query_per_distinct_search_and_bulk_alerts(self, mock_send):
+        from app.models import Notification
+        from app.outbox import drain
+        from .alerts import evaluate_saved_searches
+        from .models import SearchAlertState
+
+        # The first run only records the baseline
+        self.assertEqual(evaluate_saved_searches(), {'queries': 1, 'jikan_requests': 0, 'alerted_queries': 0})
+        self.assertEqual(SearchAlertState.objects.count(), 1)
+
+        self.add_anime(6)
+        # Independent of the number of subscribers: one search, one outbox row per query
+        with self.assertNumQueries(8):
+            stats = evaluate_saved_searches()
+        self.assertEqual(stats['alerted_queries'], 1)
+        drain()
+
+        alerts = Notification.objects.filter(notification_type='search_alert').order_by('recipient_id')
+        self.assertEqual([n.recipient_id for n in alerts], [self.users[0].id, self.users[1].id])
+        self.assertEqual(alerts[0].message, '1 new match for your saved search "Mecha"')
+        self.assertEqual(alerts[0].link, '/anime/6/')
+
+        # Nothing new, nothing sent
+        evaluate_saved_searches()
+        drain()
+        self.assertEqual(Notification.objects.filter(notification_type='search_alert').count(), 2)
+
+    @patch('users.alerts.ALERT_DEPTH', 3)
+    def test_new_unscored_title_alerts_despite_depth(self, mock_send):
+        from app.models import AnimeMetadata
+        from .alerts import evaluate_saved_searches
+
+        evaluate_saved_searches(jikan_budget=0)
+        # Just announced: no score yet, so it would rank last by score
+        AnimeMetadata.objects.create(mal_id=7, title='Gundam 7', genre_ids=[1, 18], year=2026)
+
+        self.assertEqual(evaluate_saved_searches(jikan_budget=0)['alerted_queries'], 1)
+
+    @patch('users.alerts.fetch_jikan_data', new_callable=AsyncMock)
+    def test_thin_queries_use_jikan_within_budget(self, mock_fetch_jikan, mock_send):
+        from app.models import AnimeMetadata
+        from .alerts import evaluate_saved_searches
+        from .models import SearchAlertState
+
+        AnimeMetadata.objects.filter(mal_id__gt=1).delete()
+        mock_fetch_jikan.return_value = {'data': [{'mal_id': 40}, {'mal_id': 41}]}
+
+        self.assertEqual(evaluate_saved_searches(jikan_budget=0)['jikan_requests'], 0)
+        self.assertEqual(SearchAlertState.objects.get().source, 'local')
+
+        self.assertEqual(evaluate_saved_searches()['jikan_requests'], 1)
+        state = SearchAlertState.objects.get()
+        # A change of source is a new baseline rather than an alert
+        self.assertEqual((state.source, state.seen_ids[:2]), ('jikan', [40, 41]))
+        self.assertIn('order_by=start_date', mock_fetch_jikan.call_args.args[1])
+
+
+class HotEndpointsTest(TransactionTestCase):
+    # Through the ASGI handler, as deployed; only recommend_anime is an async view
+    def setUp(self):
+        from app.models import Review
+        from chat.models import ChatMessage, ChatThread
+        from clubs.models import Club
+        from .models import TasteProfile
+        self.client = AsyncClient()
+        self.user = User.objects.create_user(username='viewer', password='password123')
+        self.other = User.objects.create_user(username='other', password='password123')
+        self.outsider = User.objects.create_user(username='outsider', password='password123')
+        Follow.objects.create(user=self.user, following=self.other)
+        for i in range(30):
+            UserAnimeEntry.objects.create(user=self.other, anime_id=i, title=f'Show {i}', status='completed', score=7)
+        TasteProfile.objects.create(user=self.user, similar_users=[[self.other.id, 80]])
+        self.review = Review.objects.create(user=self.other, anime_id=5, content='Great')
+        self.thread = ChatThread.objects.create(user1=self.user, user2=self.other)
+        for i in range(60):
+            ChatMessage.objects.create(thread=self.thread, sender=self.other, text=f'Message {i}')
+        self.club = Club.objects.create(name='Club', description='', owner=self.other, cover_image='')
+        self.club.members.add(self.other, self.user)
+
+    async def test_public_profile(self):
+        await self.client.aforce_login(self.user)
+
+        response = await self.client.get(reverse('public_profile', args=['other']), {'page': 2})
+        context = response.context
+        self.assertEqual((context['anime_entries'].number, len(context['anime_entries'].object_list)), (2, 6))
+        self.assertEqual((context['followers_count'], context['following_count'], context['is_following']), (1, 0, True))
+        self.assertEqual((context['stats']['total_entries'], context['stats']['completed']), (30, 30))
+        self.assertEqual(len(context['recent_updates']), 5)
+
+        response = await self.client.get(reverse('public_profile', args=['viewer']))
+        self.assertEqual([(u.username, percent) for u, percent in response.context['similar_users']], [('other', 80)])
+        self.assertEqual((await self.client.get(reverse('public_profile', args=['nobody']))).status_code, 404)
+
+    async def test_update_status_awards_xp_once(self):
+        await self.client.aforce_login(self.user)
+        body = {'anime_id': 100, 'status': 'watching', 'episodes_watched': 3, 'title': 'New Show'}
+
+        for _ in range(2):
+            response = await self.client.post(reverse('update-status'), body, content_type='application/json')
+            self.assertEqual(response.json()['status'], 'success')
+
+        entry = await UserAnimeEntry.objects.aget(user=self.user, anime_id=100)
+        profile = await Profile.objects.aget(user=self.user)
+        self.assertEqual(entry.episodes_watched, 3)
+        self.assertEqual(profile.xp, 3 * XP_PER_EPISODE)
+
+    async def test_review_likes(self):
+        await self.client.aforce_login(self.user)
+        url = reverse('toggle_review_like', args=[self.review.id])
+
+        self.assertEqual((await self.client.post(url)).json(), {'liked': True, 'count': 1})
+        response = await self.client.get(reverse('anime_reviews_list', args=[5]))
+        self.assertEqual([(r.likes_count, r.is_liked) for r in response.context['reviews']], [(1, True)])
+        self.assertEqual(response.context['anime_title'], 'Show 5')
+        self.assertEqual((await self.client.post(url)).json(), {'liked': False, 'count': 0})
+
+    async def test_chat_history(self):
+        await self.client.aforce_login(self.user)
+        url = reverse('chat:get_messages', args=[self.thread.id])
+
+        data = (await self.client.get(url, {'page': 2})).json()
+        self.assertEqual((len(data['messages']), data['has_next']), (10, False))
+        self.assertEqual((data['messages'][0]['text'], data['messages'][0]['is_sent']), ('Message 0', False))
+        self.assertEqual((await self.client.get(url, {'page': 9})).json(), {'messages': [], 'has_next': False})
+
+        await self.client.aforce_login(self.outsider)
+        self.assertEqual((await self.client.get(url)).status_code, 403)
+
+    @patch('clubs.views.fetch_jikan_data', new_callable=AsyncMock)
+    async def test_club_detail_and_recommendation(self, mock_fetch_jikan):
+        from clubs.models import ClubRecommendation
+        mock_fetch_jikan.return_value = {'data': {'title': 'Recommended', 'images': {'jpg': {'image_url': 'x.jpg'}}}}
+        await self.client.aforce_login(self.user)
+
+        response = await self.client.post(reverse('clubs:recommend_anime', args=[self.club.pk]), {'anime_id': 7})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mock_fetch_jikan.call_args.args[0], 'anime_detail_7')
+
+        response = await self.client.get(reverse('clubs:club_detail', args=[self.club.pk]))
+        self.assertTrue(response.context['is_member'])
+        self.assertEqual([r.anime_title for r in response.context['recommendations']], ['Recommended'])
+
+        await self.client.aforce_login(self.outsider)
+        await self.client.post(reverse('clubs:recommend_anime', args=[self.club.pk]), {'anime_id': 8})
+        self.assertEqual(await ClubRecommendation.objects.acount(), 1)
@@ -8,6 +8,8 @@ urlpatterns = [
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('profile/review/', views.create_review, name='create_review'),
     path('profile/<str:username>/', views.public_profile, name='public_profile'),
+    path('follow/<str:username>/', views.follow_user, name='follow_user'),
+    path('unfollow/<str:username>/', views.unfollow_user, name='unfollow_user'),
     path('register/', views.register, name='register'),
     path('activate/<uidb64>/<token>/', views.activate, name='activate'),
     path('login/', views.login_view, name='login'),
@@ -15,8 +17,14 @@ urlpatterns = [
     path('api/save-search/', views.save_search, name='save-search'),
     path('api/saved-searches/', views.list_saved_searches, name='saved-searches'),
     path('api/update-status/', views.update_anime_status, name='update-status'),
+    path('api/update-status/batch/', views.batch_update_anime_status, name='batch-update-status'),
     path('import/', views.import_list, name='import_list'),
+    path('api/import/<int:job_id>/', views.import_job_status, name='import_job_status'),
+    path('export/', views.export_list, name='export_list'),
+    path('export/download/<str:token>/', views.download_export, name='download_export'),
     path('api/anime/status/<int:anime_id>/', views.get_user_anime_status, name='get_user_anime_status'),
+    path('api/anime/statuses/', views.get_user_anime_statuses, name='get_user_anime_statuses'),
+    path('api/v1/list/sync/', views.list_sync, name='list_sync'),
     path('profile/review/', views.create_review, name='create_review'),
     
     # Review System
@@ -46,3 +54,49 @@ urlpatterns = [
     path('profile/<str:username>/list/<int:list_id>/', views.custom_list_detail, name='custom_list_detail'),
     path('api/lists/<int:list_id>/toggle/<int:anime_id>/', views.toggle_custom_list_entry, name='toggle_custom_list_entry'),
 ]
+
+# Most SQL queries per request with caching off, checked by QueryBudgetTest (see app/query_budget.py)
+query_budgets = {
+    'profile': 2,
+    'edit_profile': 3,
+    'create_review': 4,
+    'public_profile': 16,
+    'follow_user': 4,
+    'unfollow_user': 5,
+    'register': 3,
+    'activate': 4,
+    'login': 3,
+    'logout': 4,
+    'save-search': 3,
+    'saved-searches': 3,
+    'update-status': 15,
+    'batch-update-status': 20,
+    'import_list': 4,
+    'import_job_status': 3,
+    'export_list': 4,
+    'download_export': 3,
+    'get_user_anime_status': 3,
+    'get_user_anime_statuses': 3,
+    'list_sync': 3,
+    'anime_reviews_list': 8,
+    'toggle_review_like': 9,
+    'add_review_comment': 5,
+    'delete_review': 8,
+    'delete_review_comment': 6,
+    'password_reset': 3,
+    'password_reset_done': 3,
+    'password_reset_confirm': 4,
+    'password_reset_complete': 3,
+    'discord_login': 2,
+    'discord_callback': 2,
+    'discord_disconnect': 4,
+    'discord_presence_api': 2,
+    'toggle_theme': 4,
+    'leaderboard': 7,
+    'toggle_pin_badge': 5,
+    'quick_update_anime_episode': 12,
+    'htmx_add_to_plan': 4,
+    'create_custom_list': 6,
+    'custom_list_detail': 7,
+    'toggle_custom_list_entry': 6,
+}
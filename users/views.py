@@ -4,14 +4,17 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.gzip import gzip_page
 import json
-from .models import SavedSearch, UserAnimeEntry
+from .models import SavedSearch, UserAnimeEntry, Profile, XP_PER_EPISODE
 from app.models import Review
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
 from app.forms import ReviewForm
 from app.models import Review, ReviewLike, ReviewComment
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Exists, OuterRef
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Value
+from django.views.decorators.http import require_POST
 import datetime
 from django_ratelimit.decorators import ratelimit
 
@@ -59,6 +62,27 @@ def edit_profile(request):
     }
     return render(request, 'users/edit_profile.html', context)
 
+def _save_anime_status(user_id, anime_id, defaults, episodes_watched):
+    """Upsert the list entry and award XP for newly watched episodes; returns the entry."""
+    old_episodes = 0
+    existing_entry = UserAnimeEntry.objects.filter(user_id=user_id, anime_id=anime_id).first()
+    if existing_entry:
+        old_episodes = existing_entry.episodes_watched
+
+    entry, created = UserAnimeEntry.objects.update_or_create(
+        user_id=user_id,
+        anime_id=anime_id,
+        defaults=defaults
+    )
+    
+    # RPG Gamification: Add XP
+    try:
+        episodes_diff = max(0, int(episodes_watched) - old_episodes)
+        Profile.add_xp(user_id, episodes_diff * XP_PER_EPISODE)
+    except (ValueError, TypeError):
+        pass
+    return entry
+
 @login_required
 def update_anime_status(request):
     if request.method == 'POST':
@@ -74,42 +98,83 @@ def update_anime_status(request):
             if not anime_id or not status:
                 return JsonResponse({'status': 'error', 'message': 'Missing fields'}, status=400)
 
-            old_episodes = 0
-            existing_entry = UserAnimeEntry.objects.filter(user=request.user, anime_id=anime_id).first()
-            if existing_entry:
-                old_episodes = existing_entry.episodes_watched
-
-            entry, created = UserAnimeEntry.objects.update_or_create(
-                user=request.user,
-                anime_id=anime_id,
-                defaults={
-                    'status': status,
-                    'score': score,
-                    'episodes_watched': episodes_watched,
-                    'title': title,
-                    'image_url': image_url
-                }
-            )
-            
-            # RPG Gamification: Add XP
-            try:
-                ep_watched = int(episodes_watched)
-                episodes_diff = max(0, ep_watched - old_episodes)
-                if episodes_diff > 0:
-                    profile = request.user.profile
-                    profile.xp += episodes_diff * 10
-                    new_level = (profile.xp // 200) + 1
-                    if new_level > profile.level:
-                        profile.level = new_level
-                    profile.save()
-            except (ValueError, TypeError):
-                pass
+            entry = _save_anime_status(request.user.id, anime_id, {
+                'status': status,
+                'score': score,
+                'episodes_watched': episodes_watched,
+                'title': title,
+                'image_url': image_url
+            }, episodes_watched)
                 
             return JsonResponse({'status': 'success', 'entry_id': entry.id})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     return JsonResponse({'status': 'invalid method'}, status=405)
 
+# Changes accepted per batch list edit
+BATCH_EDIT_LIMIT = 100
+
+
+@login_required
+@require_POST
+def batch_update_anime_status(request):
+    """
+    Apply up to BATCH_EDIT_LIMIT list changes in one transaction:
+    {"changes": [{"anime_id", "status"?, "score"?, "episodes_watched"?, "title"?, "image_url"?}]}.
+    Fields left out keep their current value; new titles need a status. The
+    whole batch is one upsert, one XP update and one feed activity.
+    """
+    from app import outbox
+    from app.tasks import bulk_upsert_entries
+
+    try:
+        changes = json.loads(request.body).get('changes')
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    if not isinstance(changes, list) or not changes:
+        return JsonResponse({'status': 'error', 'message': 'No changes'}, status=400)
+    if len(changes) > BATCH_EDIT_LIMIT:
+        return JsonResponse({'status': 'error', 'message': f'At most {BATCH_EDIT_LIMIT} changes per request'}, status=400)
+
+    statuses = {status for status, _ in UserAnimeEntry.STATUS_CHOICES}
+    try:
+        anime_ids = [int(change['anime_id']) for change in changes]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Every change needs an anime_id'}, status=400)
+    with transaction.atomic():
+        # Locked so a concurrent edit of the same titles can't make both requests award the same episodes
+        existing = {
+            entry['anime_id']: entry
+            for entry in UserAnimeEntry.objects.select_for_update()
+            .filter(user=request.user, anime_id__in=anime_ids)
+            .values('anime_id', 'title', 'image_url', 'status', 'score', 'episodes_watched')
+        }
+
+        rows, xp = [], 0
+        # A title listed twice keeps its last change
+        for anime_id, change in dict(zip(anime_ids, changes)).items():
+            current = existing.get(anime_id)
+            try:
+                row = {
+                    'anime_id': anime_id,
+                    'title': current['title'] if current else str(change.get('title') or 'Unknown Title'),
+                    'image_url': current['image_url'] if current else change.get('image_url', ''),
+                    'status': change.get('status', current['status'] if current else None),
+                    'score': int(change.get('score', current['score'] if current else 0)),
+                    'episodes_watched': int(change.get('episodes_watched', current['episodes_watched'] if current else 0)),
+                }
+            except (TypeError, ValueError):
+                return JsonResponse({'status': 'error', 'message': f'Invalid values for {anime_id}'}, status=400)
+            if row['status'] not in statuses or not 0 <= row['score'] <= 10 or row['episodes_watched'] < 0:
+                return JsonResponse({'status': 'error', 'message': f'Invalid values for {anime_id}'}, status=400)
+            xp += max(0, row['episodes_watched'] - (current['episodes_watched'] if current else 0)) * XP_PER_EPISODE
+            rows.append(row)
+
+        count = bulk_upsert_entries(request.user.id, rows, ['status', 'score', 'episodes_watched'])
+        Profile.add_xp(request.user.id, xp)
+        outbox.publish('list.batch_updated', user_id=request.user.id, count=count)
+    return JsonResponse({'status': 'success', 'updated': count, 'xp': xp})
+
 @login_required
 def get_user_anime_status(request, anime_id):
     try:
@@ -123,6 +188,36 @@ def get_user_anime_status(request, anime_id):
     except UserAnimeEntry.DoesNotExist:
         return JsonResponse({'found': False})
 
+@login_required
+def get_user_anime_statuses(request):
+    """Batch version of get_user_anime_status for card grids: ?ids=1,2,3."""
+    from .membership import BATCH_LIMIT, list_statuses
+    try:
+        anime_ids = [int(anime_id) for anime_id in request.GET.get('ids', '').split(',') if anime_id]
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'ids must be MAL ids'}, status=400)
+    if len(anime_ids) > BATCH_LIMIT:
+        return JsonResponse({'status': 'error', 'message': f'At most {BATCH_LIMIT} ids per request'}, status=400)
+    statuses = list_statuses(request.user.id, anime_ids)
+    return JsonResponse({'statuses': {str(anime_id): entry for anime_id, entry in statuses.items()}})
+
+@gzip_page
+@login_required
+def list_sync(request):
+    """Delta sync of the viewer's list: ?cursor=<cursor from the last response>."""
+    from . import sync
+    try:
+        since = sync.parse_cursor(request.GET.get('cursor', ''))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+    except sync.CursorExpired:
+        return JsonResponse({'status': 'error', 'message': 'Cursor expired, sync again without one', 'resync': True}, status=410)
+    try:
+        limit = min(int(request.GET.get('limit', sync.PAGE_SIZE)), sync.PAGE_SIZE)
+    except ValueError:
+        limit = sync.PAGE_SIZE
+    return JsonResponse(sync.list_changes(request.user.id, since, max(limit, 1)))
+
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
@@ -278,114 +373,126 @@ def unfollow_user(request, username):
         
     return redirect('public_profile', username=username)
 
-def public_profile(request, username):
-    from django.shortcuts import get_object_or_404
-    from django.contrib.auth.models import User
-    from .models import Follow
-    from django.core.paginator import Paginator
+def _profile_stats(viewed_user):
+    """(stats, badges) for a profile, cached for 5 minutes."""
     from django.core.cache import cache
-    from django.db.models import Sum, Avg
+    from django.db.models import Sum, Avg, Q
+
+    # --- Statistics & Badges: Cache in Redis for 5 minutes ---
+    cache_key = f'profile_stats_{viewed_user.pk}'
+    cached = cache.get(cache_key)
+    if cached:
+        return cached
+
+    anime_entries_list = UserAnimeEntry.objects.filter(user=viewed_user)
+    # Counts, episodes and mean score in one pass over the list
+    stats = anime_entries_list.aggregate(
+        total_entries=Count('id'),
+        **{status: Count('id', filter=Q(status=status)) for status in ('watching', 'completed', 'on_hold', 'dropped', 'plan_to_watch')},
+        total_episodes=Sum('episodes_watched'),
+        mean_score=Avg('score', filter=~Q(score=0)),
+    )
+    stats['total_episodes'] = stats['total_episodes'] or 0
+    stats['mean_score'] = round(stats['mean_score'] or 0.0, 1)
+    minutes_watched = stats['total_episodes'] * 24
+    stats['days_watched'] = round(minutes_watched / 60 / 24, 1)
     
-    viewed_user = get_object_or_404(User, username=username)
+    # Calculate Score Distribution (1 to 10)
+    score_counts = anime_entries_list.exclude(score=0).values('score').annotate(count=Count('score')).order_by('score')
+    dist = {str(i): 0 for i in range(1, 11)}
+    for sc in score_counts:
+        dist[str(sc['score'])] = sc['count']
+    stats['score_distribution_json'] = json.dumps(list(dist.values()))
     
-    # Get anime list
-    anime_entries_list = UserAnimeEntry.objects.filter(user=viewed_user)
-    paginator = Paginator(anime_entries_list, 24)
-    page_number = request.GET.get('page')
-    anime_entries = paginator.get_page(page_number)
+    # Calculate Top Studios and Genres from local cache
+    from app.models import AnimeMetadata
+    watched_ids = anime_entries_list.exclude(status='plan_to_watch').values_list('anime_id', flat=True)
+    local_animes = AnimeMetadata.objects.filter(mal_id__in=watched_ids)
     
-    # Follow stats
-    followers_count = Follow.objects.filter(following=viewed_user).count()
-    following_count = Follow.objects.filter(user=viewed_user).count()
+    studio_freq = {}
+    genre_freq = {}
+    for anime in local_animes:
+        for s in anime.studios:
+            studio_freq[s] = studio_freq.get(s, 0) + 1
+        for g in anime.genres:
+            genre_freq[g] = genre_freq.get(g, 0) + 1
+            
+    top_studios = sorted(studio_freq.items(), key=lambda x: x[1], reverse=True)[:5]
+    top_genres = sorted(genre_freq.items(), key=lambda x: x[1], reverse=True)[:5]
     
-    is_following = False
-    shared_anime = []
+    stats['top_studios_json'] = json.dumps(top_studios)
+    stats['top_genres_json'] = json.dumps(top_genres)
     
-    # --- Statistics & Badges: Cache in Redis for 5 minutes ---
-    cache_key = f'profile_stats_{viewed_user.pk}'
-    cached = cache.get(cache_key)
-    if cached:
-        stats, badges = cached
-    else:
-        stats = {
-            'total_entries': anime_entries_list.count(),
-            'watching': anime_entries_list.filter(status='watching').count(),
-            'completed': anime_entries_list.filter(status='completed').count(),
-            'on_hold': anime_entries_list.filter(status='on_hold').count(),
-            'dropped': anime_entries_list.filter(status='dropped').count(),
-            'plan_to_watch': anime_entries_list.filter(status='plan_to_watch').count(),
-            'total_episodes': anime_entries_list.aggregate(Sum('episodes_watched'))['episodes_watched__sum'] or 0,
-            'mean_score': round(anime_entries_list.exclude(score=0).aggregate(Avg('score'))['score__avg'] or 0.0, 1),
-        }
-        minutes_watched = stats['total_episodes'] * 24
-        stats['days_watched'] = round(minutes_watched / 60 / 24, 1)
-        
-        # Calculate Score Distribution (1 to 10)
-        from django.db.models import Count
-        import json
-        score_counts = anime_entries_list.exclude(score=0).values('score').annotate(count=Count('score')).order_by('score')
-        dist = {str(i): 0 for i in range(1, 11)}
-        for sc in score_counts:
-            dist[str(sc['score'])] = sc['count']
-        stats['score_distribution_json'] = json.dumps(list(dist.values()))
-        
-        # Calculate Top Studios and Genres from local cache
-        from app.models import AnimeMetadata
-        watched_ids = anime_entries_list.exclude(status='plan_to_watch').values_list('anime_id', flat=True)
-        local_animes = AnimeMetadata.objects.filter(mal_id__in=watched_ids)
-        
-        studio_freq = {}
-        genre_freq = {}
-        for anime in local_animes:
-            for s in anime.studios:
-                studio_freq[s] = studio_freq.get(s, 0) + 1
-            for g in anime.genres:
-                genre_freq[g] = genre_freq.get(g, 0) + 1
-                
-        top_studios = sorted(studio_freq.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_genres = sorted(genre_freq.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        stats['top_studios_json'] = json.dumps(top_studios)
-        stats['top_genres_json'] = json.dumps(top_genres)
-        
-        # Earned Badges
-        user_badges = viewed_user.earned_badges.select_related('badge').order_by('-is_pinned', '-earned_at')
-        badges = []
-        for ub in user_badges:
-            badge_obj = ub.badge
-            badge_obj.is_pinned = ub.is_pinned
-            badge_obj.user_badge_id = ub.id
-            badges.append(badge_obj)
+    # Earned Badges
+    user_badges = viewed_user.earned_badges.select_related('badge').order_by('-is_pinned', '-earned_at')
+    badges = []
+    for ub in user_badges:
+        badge_obj = ub.badge
+        badge_obj.is_pinned = ub.is_pinned
+        badge_obj.user_badge_id = ub.id
+        badges.append(badge_obj)
+    
+    cache.set(cache_key, (stats, badges), 300)  # 5 minutes
+    return stats, badges
+
+
+def _viewer_rows(viewer, viewed_user):
+    """The parts of a profile that depend on who is looking: the follow button, taste match or similar users."""
+    from django.contrib.auth.models import User
+    from .models import Follow, TasteProfile
+
+    rows = {'is_following': False, 'shared_anime': [], 'shared_count': 0, 'compatibility': None, 'similar_users': []}
+    if not viewer.is_authenticated:
+        return rows
+
+    if viewer.id != viewed_user.id:
+        rows['is_following'] = Follow.objects.filter(user=viewer, following=viewed_user).exists()
         
-        cache.set(cache_key, (stats, badges), 300)  # 5 minutes
-    custom_lists = viewed_user.custom_lists.annotate(entries_count=Count('entries'))
+        # Compatibility & shared anime from the two taste profiles (users/taste.py)
+        from .taste import compatibility as taste_compatibility, shared_anime_ids
+        tastes = {t.user_id: t for t in TasteProfile.objects.filter(user_id__in=[viewer.id, viewed_user.id])}
+        if len(tastes) == 2:
+            compatibility = taste_compatibility(tastes[viewer.id], tastes[viewed_user.id])
+            rows['compatibility'] = compatibility
+            rows['shared_count'] = compatibility['shared']
+            rows['shared_anime'] = UserAnimeEntry.objects.filter(
+                user=viewer,
+                anime_id__in=shared_anime_ids(tastes[viewer.id], tastes[viewed_user.id])[:5]
+            )
+    else:
+        # "Users like you", ranked by the nightly build_similar_users_task
+        taste = TasteProfile.objects.filter(user=viewed_user).first()
+        if taste and taste.similar_users:
+            users_by_id = User.objects.select_related('profile').in_bulk([uid for uid, _ in taste.similar_users])
+            rows['similar_users'] = [(users_by_id[uid], percent) for uid, percent in taste.similar_users if uid in users_by_id]
+    return rows
 
-    if request.user.is_authenticated:
-        if request.user != viewed_user:
-            is_following = Follow.objects.filter(user=request.user, following=viewed_user).exists()
-            
-            # Shared Anime Logic
-            viewed_user_anime_ids = UserAnimeEntry.objects.filter(user=viewed_user).values_list('anime_id', flat=True)
-            shared_anime = UserAnimeEntry.objects.filter(
-                user=request.user, 
-                anime_id__in=viewed_user_anime_ids
-            ).select_related('user')[:5]
-            
-    # --- Activity History ---
-    recent_updates = anime_entries_list.order_by('-updated_at')[:5]
+
+def public_profile(request, username):
+    from django.contrib.auth.models import User
+    from django.core.paginator import Paginator
+    from .models import Follow
+    
+    viewed_user = get_object_or_404(User.objects.select_related('profile'), username=username)
+    
+    # Get anime list
+    anime_entries_list = UserAnimeEntry.objects.filter(user=viewed_user)
+    anime_entries = Paginator(anime_entries_list, 24).get_page(request.GET.get('page'))
+    stats, badges = _profile_stats(viewed_user)
     
     context = {
         'viewed_user': viewed_user,
         'anime_entries': anime_entries,
-        'followers_count': followers_count,
-        'following_count': following_count,
-        'is_following': is_following,
+        # Follow stats
+        'followers_count': Follow.objects.filter(following=viewed_user).count(),
+        'following_count': Follow.objects.filter(user=viewed_user).count(),
         'is_own_profile': request.user == viewed_user,
-        'custom_lists': custom_lists,
-        'shared_anime': shared_anime,
+        'custom_lists': viewed_user.custom_lists.annotate(entries_count=Count('entries')),
         'stats': stats,
         'badges': badges,
-        'recent_updates': recent_updates,
+        # --- Activity History ---
+        'recent_updates': anime_entries_list.order_by('-updated_at')[:5],
+        **_viewer_rows(request.user, viewed_user),
     }
     return render(request, 'users/profile.html', context)
 @login_required
@@ -397,64 +504,14 @@ def import_list(request):
                 messages.error(request, 'Please upload a valid .xml file.')
                 return redirect('import_list')
             
-            try:
-                import xml.etree.ElementTree as ET
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-                
-                # MAL Status to MitsuList Status Mapping
-                status_map = {
-                    'Watching': 'watching',
-                    'Completed': 'completed',
-                    'On-Hold': 'on_hold',
-                    'Dropped': 'dropped',
-                    'Plan to Watch': 'plan_to_watch'
-                }
-                
-                count = 0
-                for anime in root.findall('anime'):
-                    try:
-                        mal_id_elem = anime.find('series_animedb_id')
-                        if mal_id_elem is None: continue
-                        mal_id = int(mal_id_elem.text)
-                        
-                        title_elem = anime.find('series_title')
-                        title = title_elem.text if title_elem is not None else "Unknown Title"
-                        
-                        status_elem = anime.find('my_status')
-                        my_status = status_elem.text if status_elem is not None else "Plan to Watch"
-                        
-                        score_elem = anime.find('my_score')
-                        my_score = int(score_elem.text) if score_elem is not None and score_elem.text else 0
-                        
-                        episodes_elem = anime.find('my_watched_episodes')
-                        my_episodes = int(episodes_elem.text) if episodes_elem is not None and episodes_elem.text else 0
-                        
-                        db_status = status_map.get(my_status, 'plan_to_watch')
-                        
-                        # Update or Create
-                        UserAnimeEntry.objects.update_or_create(
-                            user=request.user,
-                            anime_id=mal_id,
-                            defaults={
-                                'title': title, # We save title to avoid API lookups for simple lists
-                                'status': db_status,
-                                'score': my_score,
-                                'episodes_watched': my_episodes,
-                                'updated_at': datetime.datetime.now()
-                            }
-                        )
-                        count += 1
-                    except Exception as loop_e:
-                        print(f"Skipping bad entry in XML import: {loop_e}")
-                        continue
-                        
-                messages.success(request, f'Successfully imported {count} anime entries from XML!')
-                return redirect('profile')
-                
-            except Exception as e:
-                messages.error(request, f'Error parsing file: {e}')
-                return redirect('import_list')
+            # Parsing and writing happen in a Celery worker (app.tasks.import_mal_xml_task);
+            # the request only stores the upload and queues the job.
+            from .models import ImportJob
+            from app.tasks import import_mal_xml_task
+            job = ImportJob.objects.create(user=request.user, source='mal_xml', file=xml_file)
+            import_mal_xml_task.delay(job.id)
+            messages.success(request, 'Your XML file is being imported in the background. Progress is shown below.')
+            return redirect('import_list')
                 
         elif 'mal_username' in request.POST:
             mal_username = request.POST.get('mal_username')
@@ -462,12 +519,90 @@ def import_list(request):
                 messages.error(request, 'Please enter a MAL username.')
                 return redirect('import_list')
             
+            from .models import ImportJob
             from app.tasks import import_mal_username_task
-            import_mal_username_task.delay(request.user.id, mal_username)
-            messages.success(request, f'Import started for "{mal_username}" in the background! Please wait a minute or two and refresh your profile.')
-            return redirect('profile')
+            job = ImportJob.objects.create(user=request.user, source='mal_username', mal_username=mal_username)
+            import_mal_username_task.delay(job.id)
+            messages.success(request, f'Import started for "{mal_username}" in the background! Progress is shown below.')
+            return redirect('import_list')
             
-    return render(request, 'users/import.html')
+    import_jobs = request.user.import_jobs.all()[:5]
+    return render(request, 'users/import.html', {'import_jobs': import_jobs})
+
+@login_required
+def import_job_status(request, job_id):
+    """Polling fallback for clients without the notification websocket."""
+    from .models import ImportJob
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'job_id': job.id,
+        'source': job.source,
+        'status': job.status,
+        'processed': job.processed,
+        'last_page': job.last_page,
+        'total_pages': job.total_pages,
+        'error': job.error,
+    })
+
+@login_required
+def export_list(request):
+    """
+    Stream the user's list as MAL XML, CSV or NDJSON (`?format=`), optionally
+    gzipped (`?gzip=1`). Rows are read through a server-side cursor and written
+    incrementally by a generator matching the handler (async under ASGI, sync
+    under WSGI), so memory stays flat however long the list is. Lists above
+    LIST_EXPORT_STREAM_LIMIT (or `?background=1`) are exported by a worker
+    instead.
+    """
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+    from .exporters import (
+        EXPORT_FORMATS, aexport_chunks, agzip_chunks, export_chunks, export_filename, gzip_chunks,
+    )
+    from .tasks import export_list_task
+
+    fmt = request.GET.get('format', 'xml')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'Unsupported format'}, status=400)
+    gzipped = request.GET.get('gzip') == '1'
+
+    if (request.GET.get('background') == '1'
+            or request.user.anime_entries.count() > settings.LIST_EXPORT_STREAM_LIMIT):
+        export_list_task.delay(request.user.id, fmt, gzipped)
+        messages.success(request, 'Your list is being exported in the background. You will get a notification with the download link.')
+        return redirect('import_list')
+
+    # Each handler only streams its own kind of iterator; it buffers the other whole
+    if isinstance(request, ASGIRequest):
+        chunks, compress = aexport_chunks(request.user, fmt), agzip_chunks
+    else:
+        chunks, compress = export_chunks(request.user, fmt), gzip_chunks
+    content_type = EXPORT_FORMATS[fmt][0]
+    if gzipped:
+        chunks = compress(chunks)
+        content_type = 'application/gzip'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(request.user, fmt, gzipped)}"'
+    return response
+
+@login_required
+def download_export(request, token):
+    """Serve a background export through the signed, expiring link from the notification."""
+    from django.core import signing
+    from django.core.files.storage import storages
+    from django.http import FileResponse, Http404
+    from .exporters import read_export_token
+
+    try:
+        user_id, name, filename = read_export_token(token)
+    except signing.BadSignature:
+        raise Http404('Export link expired or invalid')
+    storage = storages['private']
+    if user_id != request.user.id or not storage.exists(name):
+        raise Http404('Export not found')
+    return FileResponse(storage.open(name), as_attachment=True, filename=filename)
 
 def anime_reviews_list(request, anime_id):
     # Get anime details (simplified, no full API call needed if we just show reviews, 
@@ -481,10 +616,11 @@ def anime_reviews_list(request, anime_id):
         likes_count=Count('likes'),
         is_liked=Exists(ReviewLike.objects.filter(review=OuterRef('pk'), user=request.user)) if request.user.is_authenticated else Value(False)
     ).order_by('-created_at')
+    reviews = list(reviews)
     
     # We might need anime title. Let's try to get it from one of the reviews or UserAnimeEntry
     anime_title = "Anime Reviews"
-    if reviews.exists():
+    if reviews:
         # Try to find an entry for this anime to get title
         entry = UserAnimeEntry.objects.filter(anime_id=anime_id).first()
         if entry:
@@ -712,28 +848,36 @@ def toggle_pin_badge(request, badge_id):
         return JsonResponse({'status': 'error', 'message': 'Badge not found.'}, status=404)
 
 def leaderboard(request):
-    from django.db.models import Sum, Count
-    
-    # Top Watchers (All Time Episodes)
-    top_watchers = User.objects.annotate(
-        total_episodes=Sum('anime_entries__episodes_watched')
-    ).exclude(total_episodes__isnull=True).order_by('-total_episodes')[:10]
-
-    # Top Reviewers (All Time Reviews)
-    top_reviewers = User.objects.annotate(
-        total_reviews=Count('review')
-    ).exclude(total_reviews=0).order_by('-total_reviews')[:10]
-    
-    # Top Badges Earner
-    from .models import UserBadge
-    top_badges = User.objects.annotate(
-        total_badges=Count('earned_badges')
-    ).exclude(total_badges=0).order_by('-total_badges')[:10]
-    
+    from . import leaderboards
+
+    window = request.GET.get('window', 'all')
+    if window not in leaderboards.WINDOWS:
+        window = 'all'
+
+    # Three sorted-set reads, then one query for every user on the page
+    boards = {
+        'episodes': leaderboards.top('episodes', window),
+        'reviews': leaderboards.top('reviews', window),
+        'badges': leaderboards.top('badges', window),
+    }
+    users = User.objects.select_related('profile').in_bulk(
+        {user_id for rows in boards.values() for user_id, _ in rows}
+    )
+
+    def _ranked(board):
+        ranked = []
+        for user_id, total in boards[board]:
+            u = users.get(user_id)
+            if u is not None:
+                setattr(u, f'total_{board}', total)
+                ranked.append(u)
+        return ranked
+
     context = {
-        'top_watchers': top_watchers,
-        'top_reviewers': top_reviewers,
-        'top_badges': top_badges,
+        'top_watchers': _ranked('episodes'),
+        'top_reviewers': _ranked('reviews'),
+        'top_badges': _ranked('badges'),
+        'window': window,
     }
     return render(request, 'users/leaderboard.html', context)
 
@@ -743,14 +887,12 @@ from django.views.decorators.http import require_POST
 @login_required
 @require_POST
 def quick_update_anime_episode(request, anime_id):
-    from .models import UserAnimeEntry
-    try:
-        entry = UserAnimeEntry.objects.get(user=request.user, anime_id=anime_id)
-        entry.episodes_watched += 1
-        entry.save()
-        return HttpResponse(f"{entry.episodes_watched} eps")
-    except UserAnimeEntry.DoesNotExist:
+    # One atomic UPDATE (counter, XP, sync sequence); side effects go through the outbox
+    from .progress import increment_episode
+    episodes_watched = increment_episode(request.user.id, anime_id)
+    if episodes_watched is None:
         return HttpResponse("Error", status=400)
+    return HttpResponse(f"{episodes_watched} eps")
 
 @login_required
 @require_POST